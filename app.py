@@ -1,20 +1,27 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request
 from flask.json.provider import DefaultJSONProvider
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import json
+import math
 import os
-import shutil
+import threading
 from werkzeug.utils import secure_filename
 from history_manager import get_history_manager
+from upload_jobs import get_upload_job_manager
 
 # Import from new refactored modules
 import config
 from utils import (
     parse_date_flexible, get_days_since, get_tenure_days,
     DataValidator, validate_data_quality,
-    read_excel_file as utils_read_excel_file, merge_dataframes, save_data
+    read_excel_files, merge_dataframes, save_data,
+    read_data_text, upsert_dataframes,
+    hash_file, hash_upload, diff_datasets, diff_data_files, summarize_changes,
+    get_backup_store, atomic_replace, read_data_marker, publish_lock,
+    use_chunked_ingest, ingest_files_chunked,
+    score_churn_risk
 )
 
 # Custom JSON provider to handle NaN
@@ -33,11 +40,67 @@ app.config['UPLOAD_FOLDER'] = config.UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = config.MAX_CONTENT_LENGTH
 
 # Load data from centralized path
-def load_data():
-    """Load main data file"""
-    df = pd.read_csv(config.MAIN_DATA_FILE, encoding='utf-8-sig')
+def load_data(dtype=None):
+    """
+    Load main data file
+
+    Args:
+        dtype: Optional column dtypes passed to read_csv (default: inferred)
+    """
+    df = pd.read_csv(config.MAIN_DATA_FILE, encoding='utf-8-sig', dtype=dtype)
     return df
 
+def get_data_version():
+    """
+    Identify current version of main data file
+    (publication marker + inode / mtime / size, so a file replaced outside the app is noticed too)
+    """
+    stat = os.stat(config.MAIN_DATA_FILE)
+    marker = read_data_marker(config.MAIN_DATA_FILE)
+    return (marker['version'], stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+# Content hash of the main data file, recomputed only when its version changes
+_data_hash_cache = {'version': None, 'hash': None}
+_data_hash_lock = threading.Lock()
+
+def get_data_hash():
+    """SHA-256 of the main data file (None if there is no data file yet)"""
+    if not os.path.exists(config.MAIN_DATA_FILE):
+        return None
+    with _data_hash_lock:
+        version = get_data_version()
+        if _data_hash_cache['version'] != version:
+            _data_hash_cache['hash'] = hash_file(config.MAIN_DATA_FILE)
+            _data_hash_cache['version'] = version
+        return _data_hash_cache['hash']
+
+# Churn-scored data cache, keyed by dataset version and day
+_scored_data_cache = {'key': None, 'df': None}
+_scored_data_lock = threading.Lock()
+
+def load_scored_data(columns=None):
+    """
+    Load main data with churn scoring columns (see utils.churn.score_churn_risk)
+    Scores are computed once per dataset version and day, then reused
+
+    Args:
+        columns: Optional list of columns to return (default: all)
+    """
+    # Scored against the current time like before; the cache is keyed on the date only,
+    # which gives the same day counts all day for date-only values (SUPPORTED_DATE_FORMATS)
+    now = pd.Timestamp.now()
+    cache_key = (get_data_version(), now.normalize())
+    with _scored_data_lock:
+        if _scored_data_cache['key'] != cache_key:
+            # IDs read as text, so numeric IDs with gaps are not turned into floats ('12345.0')
+            df = load_data(dtype={'ID Pelanggan': str})
+            _scored_data_cache['df'] = score_churn_risk(df, now)
+            _scored_data_cache['key'] = cache_key
+        df = _scored_data_cache['df']
+        if columns is not None:
+            df = df[columns]
+        return df.copy()
+
 # Use DataValidator for price cleaning (alias for backward compatibility)
 clean_price = DataValidator.clean_price
 
@@ -61,40 +124,71 @@ def clean_for_json(data):
         return None
     return data
 
+def record_changes(changes):
+    """Summary of an upload's row-level changes; saved as a changeset when anything changed"""
+    changes_summary = summarize_changes(changes)
+    if any(changes_summary[kind] for kind in ('new', 'removed', 'changed', 'columns_added', 'columns_removed')):
+        changes_summary['changeset_id'] = get_history_manager().save_changeset(changes)
+    return changes_summary
+
 # Function to merge and clean multiple files
-def merge_and_clean_files(file_paths):
+def merge_and_clean_files(file_paths, on_stage=None, mode='replace'):
     """
     Merge multiple Excel/CSV files and clean data
-    Returns: (success, message, stats)
+    Returns: (success, message, stats, overview_stats)
+    overview_stats is create_overview_stats of the dataset now in the main data file, for the
+    history snapshot (None on failure)
+    Large CSV / HTML uploads in replace mode go through merge_and_clean_files_chunked
+
+    Args:
+        file_paths: Uploaded file paths
+        on_stage: Optional callback(stage, detail) called when entering the
+                  read / merge / dedupe / write stages (upload job progress)
+        mode: 'replace' - the upload becomes the dataset
+              'upsert' - the upload is merged into the stored dataset by ID Pelanggan
     """
+    if on_stage is None:
+        on_stage = lambda stage, detail=None: None
+
+    if mode == 'replace' and use_chunked_ingest(file_paths):
+        return merge_and_clean_files_chunked(file_paths, on_stage)
+
     try:
         all_dataframes = []
         file_info = []
 
         print(f"Processing {len(file_paths)} files...")
 
-        # Read each file
-        for idx, file_path in enumerate(file_paths, 1):
-            print(f"\n--- Processing File {idx}: {file_path} ---")
-            success, df_or_message, file_ext = utils_read_excel_file(file_path)
+        # Read all files (in parallel worker processes when there are several)
+        on_stage('read', f'0/{len(file_paths)} file')
+        read_results = read_excel_files(
+            file_paths,
+            on_file_done=lambda done: on_stage('read', f'{done}/{len(file_paths)} file')
+        )
 
+        for idx, (file_path, (success, df_or_message, read_info)) in enumerate(zip(file_paths, read_results), 1):
             if not success:
-                return False, f"Error reading file {idx}: {df_or_message}", None
+                return False, f"Error reading file {idx}: {df_or_message}", None, None
 
             df = df_or_message
             file_info.append({
                 'file_num': idx,
                 'filename': os.path.basename(file_path),
                 'rows': len(df),
-                'columns': len(df.columns)
+                'columns': len(df.columns),
+                'format': read_info['format'],
+                'strategy': read_info['strategy'],
+                'read_seconds': read_info['seconds'],
+                'attempts': read_info['attempts']
             })
 
             all_dataframes.append(df)
             print(f"File {idx} loaded: {len(df)} rows, {len(df.columns)} columns")
 
-        # Merge all dataframes
+        # Merge all dataframes (text frames; columns missing from a file stay empty)
+        on_stage('merge')
         print(f"\n--- Merging {len(all_dataframes)} dataframes ---")
-        merged_df = pd.concat(all_dataframes, ignore_index=True)
+        merged_df = pd.concat(all_dataframes, ignore_index=True).fillna('')
         print(f"Merged data: {len(merged_df)} rows")
 
         # Calculate stats before deduplication
@@ -102,9 +196,10 @@ def merge_and_clean_files(file_paths):
 
         # Check for ID Pelanggan column
         if 'ID Pelanggan' not in merged_df.columns:
-            return False, f"Kolom 'ID Pelanggan' tidak ditemukan di file yang di-upload!", None
+            return False, f"Kolom 'ID Pelanggan' tidak ditemukan di file yang di-upload!", None, None
 
         # Remove duplicates based on ID Pelanggan (keep first occurrence)
+        on_stage('dedupe')
         merged_df = merged_df.drop_duplicates(subset=['ID Pelanggan'], keep='first')
         duplicates_removed = total_rows_before - len(merged_df)
         print(f"Removed {duplicates_removed} duplicates")
@@ -112,16 +207,59 @@ def merge_and_clean_files(file_paths):
         # Clean column names
         merged_df.columns = merged_df.columns.str.strip()
 
-        # Backup old file
-        if os.path.exists('data-wifi-clean.csv'):
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_name = f'data-wifi-clean_backup_{timestamp}.csv'
-            shutil.copy('data-wifi-clean.csv', backup_name)
-            print(f"Backup created: {backup_name}")
+        # No other publication (e.g. a restore) may land between reading the stored version and writing
+        with publish_lock:
+            # Stored version as text, for the upsert and the changelog (uploads are read as text too)
+            old_text = read_data_text() if os.path.exists(config.MAIN_DATA_FILE) else None
+
+            upsert_stats = None
+            if mode == 'upsert' and old_text is not None:
+                on_stage('diff', 'upsert ke data tersimpan')
+                uploaded_rows = len(merged_df)
+                success, merged_df, upsert_stats = upsert_dataframes(old_text, merged_df)
+                if not success:
+                    return False, merged_df, None, None
+
+            # Row-level changes against the stored version
+            changes = None
+            if old_text is not None:
+                on_stage('diff', 'membandingkan baris')
+                changes = diff_datasets(old_text, merged_df)
+                del old_text
+
+            # Stored version must be restorable (normally already in the backup store, no copy made)
+            on_stage('write')
+            backup_store = get_backup_store()
+            write_mode = upsert_stats['write_mode'] if upsert_stats else 'rewrite'
+            if write_mode == 'append':
+                with open(config.MAIN_DATA_FILE, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        write_mode = 'rewrite'  # Hand-edited file without a final newline
+            if write_mode != 'unchanged' and os.path.exists(config.MAIN_DATA_FILE):
+                backup_store.ensure_version(config.MAIN_DATA_FILE, get_data_hash())
+
+            # Save merged and cleaned data (temp file swapped in, readers never see a partial file)
+            if write_mode == 'rewrite':
+                with atomic_replace(config.MAIN_DATA_FILE) as tmp_path:
+                    merged_df.to_csv(tmp_path, index=False, encoding='utf-8-sig')
+                print(f"Saved merged data: {len(merged_df)} rows, {len(merged_df.columns)} columns")
+            elif write_mode == 'append':
+                # Only new customers: the stored file is copied byte for byte (no parsing or CSV
+                # serialization of its rows) and the new rows are written after it. The copy still
+                # reads and writes the whole file, as a rewrite would
+                with atomic_replace(config.MAIN_DATA_FILE, copy_existing=True) as tmp_path:
+                    merged_df.tail(upsert_stats['inserted']).to_csv(
+                        tmp_path, mode='a', header=False, index=False, encoding='utf-8'
+                    )
+                print(f"Appended {upsert_stats['inserted']} rows to {config.MAIN_DATA_FILE}")
+            else:
+                print(f"No changes, {config.MAIN_DATA_FILE} left untouched")
+
+            # New version goes into the backup store (compressed once per distinct content)
+            backup_version = backup_store.add_version(config.MAIN_DATA_FILE, get_data_hash())
 
-        # Save merged and cleaned data
-        merged_df.to_csv('data-wifi-clean.csv', index=False, encoding='utf-8-sig')
-        print(f"Saved merged data: {len(merged_df)} rows, {len(merged_df.columns)} columns")
+        changes_summary = record_changes(changes) if changes is not None else None
 
         # Prepare statistics
         stats = {
@@ -131,399 +269,313 @@ def merge_and_clean_files(file_paths):
             'total_rows_after_merge': total_rows_before,
             'duplicates_removed': duplicates_removed,
             'final_rows': len(merged_df),
-            'columns': len(merged_df.columns)
+            'columns': len(merged_df.columns),
+            'mode': 'upsert' if upsert_stats else 'replace',
+            'changes': changes_summary,
+            'backup_version': backup_version['id'],
+            'data_version': read_data_marker(config.MAIN_DATA_FILE)['version']
         }
 
-        message = f"Berhasil merge {len(file_paths)} file! Total {len(merged_df)} pelanggan unique."
-        return True, message, stats
+        if upsert_stats:
+            stats.update(upsert_stats, uploaded_rows=uploaded_rows)
+            message = (f"Berhasil upsert {len(file_paths)} file! {upsert_stats['inserted']} baru, "
+                       f"{upsert_stats['updated']} diperbarui, {upsert_stats['unchanged']} tidak berubah. "
+                       f"Total {len(merged_df)} pelanggan.")
+        else:
+            message = f"Berhasil merge {len(file_paths)} file! Total {len(merged_df)} pelanggan unique."
+            if changes_summary:
+                message += (f" Perubahan: {changes_summary['new']} baru, {changes_summary['removed']} hilang, "
+                            f"{changes_summary['changed']} berubah.")
+        return True, message, stats, create_overview_stats(merged_df)
 
     except Exception as e:
         import traceback
         error_detail = traceback.format_exc()
         print(f"Error in merge_and_clean_files: {error_detail}")
-        return False, f"Error: {str(e)}", None
-
+        return False, f"Error: {str(e)}", None, None
 
-# Function to read single Excel/CSV file
-def read_excel_file(file_path):
+def merge_and_clean_files_chunked(file_paths, on_stage):
     """
-    Read single Excel/CSV file
-    Returns: (success, dataframe_or_error_message, file_ext)
+    Replace upload of large CSV / HTML files in bounded memory
+    Files are merged and de-duplicated batch by batch into a staged file (utils.ingest),
+    compared with the stored data file by streaming both (diff_data_files), then swapped in.
+    Snapshot stats are aggregated batch by batch as rows are written, the dataset is never loaded whole
+    Returns: same as merge_and_clean_files
     """
-    try:
-        # Determine engine based on file extension
-        file_ext = file_path.rsplit('.', 1)[1].lower()
+    staged_path = f'{config.MAIN_DATA_FILE}.ingest'
+    overview = {}
 
-        df = None
-        error_messages = []
+    def add_to_overview(rows):
+        if rows is None:   # Ingest restarted, batches come again
+            overview.clear()
+        elif set(OVERVIEW_COLUMNS).issubset(rows.columns):
+            combine_overview_partials(overview, overview_partials(rows))
 
-        # Smart header detection
-        def find_header_row(file_path, file_ext):
-            """Find the row that contains 'ID Pelanggan' column"""
-            try:
-                print(f"Searching for header row with 'ID Pelanggan'...")
-                # Read first 10 rows without header to inspect
-                if file_ext == 'csv':
-                    temp_df = pd.read_csv(file_path, encoding='utf-8-sig', header=None, nrows=10)
-                elif file_ext == 'xlsx':
-                    temp_df = pd.read_excel(file_path, engine='openpyxl', header=None, nrows=10)
-                elif file_ext == 'xls':
-                    try:
-                        temp_df = pd.read_excel(file_path, engine='xlrd', header=None, nrows=10)
-                    except:
-                        try:
-                            temp_df = pd.read_excel(file_path, engine='openpyxl', header=None, nrows=10)
-                        except:
-                            temp_df = pd.read_csv(file_path, encoding='utf-8-sig', header=None, nrows=10)
-                else:
-                    return 0
-
-                # Search for row containing "ID Pelanggan"
-                for idx, row in temp_df.iterrows():
-                    row_values = row.astype(str).tolist()
-                    if any('ID Pelanggan' in str(val) for val in row_values):
-                        print(f"Found header row at index {idx}")
-                        return idx
-
-                print("Header row not found, using default (0)")
-                return 0
-            except Exception as e:
-                print(f"Error finding header row: {str(e)}")
-                return 0
-
-        # Find the correct header row
-        header_row = find_header_row(file_path, file_ext)
-
-        # Read file based on extension
-        if file_ext == 'csv':
-            try:
-                print(f"Reading CSV file with header at row {header_row}...")
-                df = pd.read_csv(file_path, encoding='utf-8-sig', skiprows=header_row)
-                print(f"Successfully read CSV: {len(df)} rows")
-            except Exception as e:
-                error_messages.append(f"CSV (utf-8-sig): {str(e)}")
-                try:
-                    df = pd.read_csv(file_path, encoding='latin1', skiprows=header_row)
-                    print(f"Successfully read CSV with latin1: {len(df)} rows")
-                except Exception as e2:
-                    error_messages.append(f"CSV (latin1): {str(e2)}")
-
-        elif file_ext == 'xlsx':
-            try:
-                print(f"Trying to read with openpyxl engine (header at row {header_row})...")
-                df = pd.read_excel(file_path, engine='openpyxl', skiprows=header_row)
-                print(f"Successfully read with openpyxl: {len(df)} rows")
-            except Exception as e:
-                error_messages.append(f"openpyxl: {str(e)}")
-                try:
-                    print(f"Trying CSV as fallback...")
-                    df = pd.read_csv(file_path, encoding='utf-8-sig', skiprows=header_row)
-                    print(f"Successfully read as CSV: {len(df)} rows")
-                except Exception as e2:
-                    error_messages.append(f"CSV fallback: {str(e2)}")
-
-        elif file_ext == 'xls':
-            try:
-                print(f"Trying to read with xlrd engine (header at row {header_row})...")
-                df = pd.read_excel(file_path, engine='xlrd', skiprows=header_row)
-                print(f"Successfully read with xlrd: {len(df)} rows")
-            except Exception as e:
-                error_messages.append(f"xlrd: {str(e)}")
-                try:
-                    print(f"Trying openpyxl as fallback...")
-                    df = pd.read_excel(file_path, engine='openpyxl', skiprows=header_row)
-                    print(f"Successfully read with openpyxl fallback: {len(df)} rows")
-                except Exception as e2:
-                    error_messages.append(f"openpyxl fallback: {str(e2)}")
-                    try:
-                        print(f"Trying CSV as fallback...")
-                        df = pd.read_csv(file_path, encoding='utf-8-sig', skiprows=header_row)
-                        print(f"Successfully read as CSV: {len(df)} rows")
-                    except Exception as e3:
-                        error_messages.append(f"CSV fallback: {str(e3)}")
-
-        else:
-            return False, f"Format file tidak didukung: {file_ext}", None
-
-        # If still failed, return error
-        if df is None:
-            error_detail = "\n".join(error_messages)
-            return False, f"Gagal membaca file. Detail: {error_detail}", None
+    try:
+        print(f"Processing {len(file_paths)} files in batches...")
+
+        on_stage('read', f'0/{len(file_paths)} file')
+        success, message, ingest_stats = ingest_files_chunked(
+            file_paths, staged_path,
+            on_progress=lambda file_num, rows: on_stage('read', f'{file_num}/{len(file_paths)} file, {rows} baris'),
+            on_batch=add_to_overview
+        )
+        if not success:
+            return False, message, None, None
+        print(f"Removed {ingest_stats['duplicates_removed']} duplicates")
+
+        with publish_lock:
+            # Row-level changes against the stored version
+            changes = None
+            if os.path.exists(config.MAIN_DATA_FILE):
+                on_stage('diff', 'membandingkan baris')
+                changes = diff_data_files(config.MAIN_DATA_FILE, staged_path)
+
+            # Stored version must be restorable, then the staged file is published
+            on_stage('write')
+            backup_store = get_backup_store()
+            if os.path.exists(config.MAIN_DATA_FILE):
+                backup_store.ensure_version(config.MAIN_DATA_FILE, get_data_hash())
+            with atomic_replace(config.MAIN_DATA_FILE) as tmp_path:
+                os.replace(staged_path, tmp_path)
+            print(f"Saved merged data: {ingest_stats['total_rows_after_merge']} rows, {ingest_stats['columns']} columns")
+
+            backup_version = backup_store.add_version(config.MAIN_DATA_FILE, get_data_hash())
+
+        changes_summary = record_changes(changes) if changes is not None else None
 
-        print(f"Successfully read {len(df)} rows")
-        print(f"Columns found: {list(df.columns)[:10]}")
+        stats = {
+            'files_count': len(file_paths),
+            'file_info': ingest_stats['file_info'],
+            'total_rows_before_merge': ingest_stats['total_rows_before_merge'],
+            'total_rows_after_merge': ingest_stats['total_rows_before_merge'],
+            'duplicates_removed': ingest_stats['duplicates_removed'],
+            'final_rows': ingest_stats['total_rows_after_merge'],
+            'columns': ingest_stats['columns'],
+            'mode': 'replace',
+            'chunked': True,
+            'changes': changes_summary,
+            'backup_version': backup_version['id'],
+            'data_version': read_data_marker(config.MAIN_DATA_FILE)['version']
+        }
 
-        # Clean column names
-        df.columns = df.columns.str.strip()
-
-        # Check for ID Pelanggan
-        if 'ID Pelanggan' not in df.columns:
-            print(f"ERROR: 'ID Pelanggan' column not found!")
-            print(f"Available columns: {list(df.columns)}")
-            possible_cols = [col for col in df.columns if 'ID' in str(col).upper() or 'PELANGGAN' in str(col).upper()]
-            if possible_cols:
-                return False, f"Kolom 'ID Pelanggan' tidak ditemukan. Kolom yang mirip: {', '.join(possible_cols[:5])}", None
-            else:
-                return False, f"Kolom 'ID Pelanggan' tidak ditemukan. Kolom yang tersedia: {', '.join(list(df.columns)[:10])}", None
+        message = f"Berhasil merge {len(file_paths)} file! Total {stats['final_rows']} pelanggan unique."
+        if changes_summary:
+            message += (f" Perubahan: {changes_summary['new']} baru, {changes_summary['removed']} hilang, "
+                        f"{changes_summary['changed']} berubah.")
 
-        return True, df, file_ext
+        if not overview:
+            print(f"Error creating overview stats: upload lacks some of {', '.join(OVERVIEW_COLUMNS)}")
+        return True, message, stats, finish_overview_stats(overview) if overview else None
 
     except Exception as e:
         import traceback
         error_detail = traceback.format_exc()
-        print(f"Error in read_excel_file: {error_detail}")
-        return False, f"Error: {str(e)}", None
+        print(f"Error in merge_and_clean_files_chunked: {error_detail}")
+        return False, f"Error: {str(e)}", None, None
+
+    finally:
+        if os.path.exists(staged_path):
+            os.remove(staged_path)
 
 
 # Function to clean uploaded Excel data (LEGACY - kept for backwards compatibility)
 def clean_uploaded_data(file_path):
     """
     Clean uploaded Excel/CSV file and save as CSV
+    Same pipeline as a single-file replace upload (merge_and_clean_files)
     Returns: (success, message, stats)
     """
-    try:
-        # Determine engine based on file extension
-        file_ext = file_path.rsplit('.', 1)[1].lower()
-
-        # Try to read file with multiple methods
-        df = None
-        error_messages = []
+    success, message, stats, _ = merge_and_clean_files([file_path])
+    if not success:
+        return False, message, None
+
+    return True, "Data berhasil di-upload dan di-clean!", {
+        'original_rows': stats['total_rows_before_merge'],
+        'cleaned_rows': stats['final_rows'],
+        'duplicates_removed': stats['duplicates_removed'],
+        'columns': stats['columns']
+    }
 
-        # Smart header detection: Read file without header first to find the correct header row
-        def find_header_row(file_path, file_ext):
-            """Find the row that contains 'ID Pelanggan' column"""
-            try:
-                print(f"Searching for header row with 'ID Pelanggan'...")
-                # Read first 10 rows without header to inspect
-                if file_ext == 'csv':
-                    temp_df = pd.read_csv(file_path, encoding='utf-8-sig', header=None, nrows=10)
-                elif file_ext == 'xlsx':
-                    temp_df = pd.read_excel(file_path, engine='openpyxl', header=None, nrows=10)
-                elif file_ext == 'xls':
-                    try:
-                        temp_df = pd.read_excel(file_path, engine='xlrd', header=None, nrows=10)
-                    except:
-                        try:
-                            temp_df = pd.read_excel(file_path, engine='openpyxl', header=None, nrows=10)
-                        except:
-                            temp_df = pd.read_csv(file_path, encoding='utf-8-sig', header=None, nrows=10)
-                else:
-                    return 0
-
-                # Search for row containing "ID Pelanggan"
-                for idx, row in temp_df.iterrows():
-                    row_values = row.astype(str).tolist()
-                    if any('ID Pelanggan' in str(val) for val in row_values):
-                        print(f"Found header row at index {idx}")
-                        return idx
-
-                print("Header row not found, using default (0)")
-                return 0
-            except Exception as e:
-                print(f"Error finding header row: {str(e)}")
-                return 0
-
-        # Find the correct header row
-        header_row = find_header_row(file_path, file_ext)
-
-        # Method 1: If CSV, read directly
-        if file_ext == 'csv':
-            try:
-                print(f"Reading CSV file with header at row {header_row}...")
-                df = pd.read_csv(file_path, encoding='utf-8-sig', skiprows=header_row)
-                print(f"Successfully read CSV: {len(df)} rows")
-            except Exception as e:
-                error_messages.append(f"CSV (utf-8-sig): {str(e)}")
-                # Try different encodings
-                try:
-                    df = pd.read_csv(file_path, encoding='latin1', skiprows=header_row)
-                    print(f"Successfully read CSV with latin1: {len(df)} rows")
-                except Exception as e2:
-                    error_messages.append(f"CSV (latin1): {str(e2)}")
+def group_partials(keys, active_price):
+    """
+    Customer count, active revenue and active customer count per group, in first-seen order
+    Additive across batches (see combine_overview_partials)
 
-        # Method 2: Try openpyxl for .xlsx
-        elif file_ext == 'xlsx':
-            try:
-                print(f"Trying to read with openpyxl engine (header at row {header_row})...")
-                df = pd.read_excel(file_path, engine='openpyxl', skiprows=header_row)
-                print(f"Successfully read with openpyxl: {len(df)} rows")
-            except Exception as e:
-                error_messages.append(f"openpyxl: {str(e)}")
-                # Try CSV as fallback (sometimes .xlsx is actually .csv)
-                try:
-                    print(f"Trying CSV as fallback...")
-                    df = pd.read_csv(file_path, encoding='utf-8-sig', skiprows=header_row)
-                    print(f"Successfully read as CSV: {len(df)} rows")
-                except Exception as e2:
-                    error_messages.append(f"CSV fallback (utf-8-sig): {str(e2)}")
-                    # Try latin1 encoding
-                    try:
-                        df = pd.read_csv(file_path, encoding='latin1', skiprows=header_row)
-                        print(f"Successfully read as CSV with latin1: {len(df)} rows")
-                    except Exception as e3:
-                        error_messages.append(f"CSV fallback (latin1): {str(e3)}")
-
-        # Method 3: Try xlrd for .xls
-        elif file_ext == 'xls':
-            try:
-                print(f"Trying to read with xlrd engine (header at row {header_row})...")
-                df = pd.read_excel(file_path, engine='xlrd', skiprows=header_row)
-                print(f"Successfully read with xlrd: {len(df)} rows")
-            except Exception as e:
-                error_messages.append(f"xlrd: {str(e)}")
-                # Try openpyxl as fallback (sometimes .xls is actually .xlsx)
-                try:
-                    print(f"Trying openpyxl as fallback...")
-                    df = pd.read_excel(file_path, engine='openpyxl', skiprows=header_row)
-                    print(f"Successfully read with openpyxl fallback: {len(df)} rows")
-                except Exception as e2:
-                    error_messages.append(f"openpyxl fallback: {str(e2)}")
-                    # Try CSV as last fallback (sometimes .xls is actually .csv)
-                    try:
-                        print(f"Trying CSV as fallback...")
-                        df = pd.read_csv(file_path, encoding='utf-8-sig', skiprows=header_row)
-                        print(f"Successfully read as CSV: {len(df)} rows")
-                    except Exception as e3:
-                        error_messages.append(f"CSV fallback (utf-8-sig): {str(e3)}")
-                        # Try latin1 encoding
-                        try:
-                            df = pd.read_csv(file_path, encoding='latin1', skiprows=header_row)
-                            print(f"Successfully read as CSV with latin1: {len(df)} rows")
-                        except Exception as e4:
-                            error_messages.append(f"CSV fallback (latin1): {str(e4)}")
+    Args:
+        keys: Column to group by
+        active_price: Cleaned price of active customers (NaN for inactive ones)
 
-        else:
-            return False, f"Format file tidak didukung: {file_ext}", None
+    Returns:
+        dict: name -> [customer_count, revenue, active_count]
+    """
+    grouped = active_price.groupby(keys, sort=False).agg(['size', 'sum', 'count'])
+    return {
+        name: [int(size), int(revenue), int(count)]
+        for name, size, revenue, count in grouped.itertuples()
+    }
 
-        # If still failed, return error
-        if df is None:
-            error_detail = "\n".join(error_messages)
-            return False, f"Gagal membaca file. Pastikan file tidak corrupt dan format benar (.xlsx, .xls, atau .csv).\n\nDetail: {error_detail}", None
-
-        print(f"Successfully read {len(df)} rows")
-        print(f"Columns found: {list(df.columns)[:10]}")
-
-        # Final check for ID Pelanggan
-        if 'ID Pelanggan' not in df.columns:
-            print(f"ERROR: 'ID Pelanggan' column not found!")
-            print(f"Available columns: {list(df.columns)}")
-            # Try to find similar column
-            possible_cols = [col for col in df.columns if 'ID' in str(col).upper() or 'PELANGGAN' in str(col).upper()]
-            if possible_cols:
-                return False, f"Kolom 'ID Pelanggan' tidak ditemukan. Kolom yang mirip: {', '.join(possible_cols[:5])}", None
-            else:
-                return False, f"Kolom 'ID Pelanggan' tidak ditemukan. Kolom yang tersedia: {', '.join(list(df.columns)[:10])}", None
+# Columns read by create_overview_stats
+OVERVIEW_COLUMNS = [
+    'Status Langganan', 'Harga', 'Foto KTP', 'Tlp', 'Nama Langganan',
+    'Nama Lokasi', 'Nama Sales', 'Tanggal Registrasi'
+]
 
-        original_count = len(df)
+# Counters of overview_partials, summed as they are
+OVERVIEW_COUNTS = [
+    'total_customers', 'active_customers', 'inactive_customers', 'revenue',
+    'missing_ktp', 'invalid_phone', 'incomplete', 'psb'
+]
 
-        # Remove duplicates based on ID Pelanggan
-        df = df.drop_duplicates(subset=['ID Pelanggan'], keep='first')
-        duplicates_removed = original_count - len(df)
-        print(f"Removed {duplicates_removed} duplicates")
+def overview_partials(df):
+    """
+    Additive overview aggregates of one customer frame (the whole dataset or one batch of it)
+    Partials of consecutive batches are summed with combine_overview_partials and turned
+    into the snapshot stats by finish_overview_stats
 
-        # Clean column names (strip whitespace)
-        df.columns = df.columns.str.strip()
+    Args:
+        df: Customer DataFrame, typed (load_data) or text frame where '' is a missing value
 
-        # Backup old file
-        if os.path.exists('data-wifi-clean.csv'):
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_name = f'data-wifi-clean_backup_{timestamp}.csv'
-            shutil.copy('data-wifi-clean.csv', backup_name)
-            print(f"Backup created: {backup_name}")
+    Returns:
+        dict of counters (OVERVIEW_COUNTS) plus per-location revenue and per-sales / per-package groups
+    """
+    # Text frames keep empty cells as '': treat them as missing like load_data does
+    df = df[OVERVIEW_COLUMNS].replace('', np.nan)
 
-        # Save cleaned data
-        df.to_csv('data-wifi-clean.csv', index=False, encoding='utf-8-sig')
-        print(f"Saved cleaned data: {len(df)} rows, {len(df.columns)} columns")
+    is_active = df['Status Langganan'] == 'On'
 
-        stats = {
-            'original_rows': original_count,
-            'cleaned_rows': len(df),
-            'duplicates_removed': duplicates_removed,
-            'columns': len(df.columns)
-        }
+    # Revenue calculation (each distinct price string is parsed once)
+    active_price = DataValidator.map_unique(df['Harga'], clean_price).where(is_active).astype(float)
 
-        return True, "Data berhasil di-upload dan di-clean!", stats
+    # Data Quality Checks - use refactored validators
+    missing_ktp = DataValidator.map_unique(df['Foto KTP'], DataValidator.is_ktp_missing).astype(bool)
+    invalid_phone = DataValidator.map_unique(df['Tlp'], DataValidator.is_phone_invalid).astype(bool)
 
-    except Exception as e:
-        import traceback
-        error_detail = traceback.format_exc()
-        print(f"Error in clean_uploaded_data: {error_detail}")
-        return False, f"Error: {str(e)}", None
+    return {
+        'total_customers': len(df),
+        'active_customers': int(is_active.sum()),
+        'inactive_customers': int((df['Status Langganan'] == 'Off').sum()),
+        'revenue': int(active_price.sum()),
+        'missing_ktp': int(missing_ktp.sum()),
+        'invalid_phone': int(invalid_phone.sum()),
+        'incomplete': int((missing_ktp | invalid_phone).sum()),
+        # PSB count (using Tanggal Registrasi)
+        'psb': int(df['Tanggal Registrasi'].notna().sum()),
+        'locations': active_price.groupby(df['Nama Lokasi'], sort=False).sum().astype(int).to_dict(),
+        'sales': group_partials(df['Nama Sales'], active_price),
+        'packages': group_partials(df['Nama Langganan'], active_price)
+    }
 
-def create_overview_stats():
+def combine_overview_partials(total, partials):
     """
-    Create comprehensive overview stats for history tracking
-    Returns dict with all key metrics from current data
-    """
-    try:
-        df = load_data()
-
-        # Basic stats
-        total_customers = len(df)
-        active_customers = len(df[df['Status Langganan'] == 'On'])
-        inactive_customers = len(df[df['Status Langganan'] == 'Off'])
+    Add the overview partials of one more batch to a running total (in place)
+    Groups keep the order in which they were first seen
 
-        # Revenue calculation
-        df['Harga_Clean'] = df['Harga'].apply(clean_price)
-        total_monthly_revenue = int(df[df['Status Langganan'] == 'On']['Harga_Clean'].sum())
-        avg_revenue_per_customer = int(df[df['Status Langganan'] == 'On']['Harga_Clean'].mean())
+    Args:
+        total: Running partials ({} before the first batch)
+        partials: overview_partials of the next batch
 
-        # Data Quality Checks - use refactored validators
-        validator = DataValidator()
-        df['Missing_KTP'] = df['Foto KTP'].apply(validator.is_ktp_missing)
-        df['Invalid_Phone'] = df['Tlp'].apply(validator.is_phone_invalid)
-        df['Incomplete_Data'] = df['Missing_KTP'] | df['Invalid_Phone']
+    Returns:
+        dict - total
+    """
+    for key in OVERVIEW_COUNTS:
+        total[key] = total.get(key, 0) + partials[key]
+
+    locations = total.setdefault('locations', {})
+    for name, revenue in partials['locations'].items():
+        locations[name] = locations.get(name, 0) + revenue
+
+    for key in ('sales', 'packages'):
+        groups = total.setdefault(key, {})
+        for name, values in partials[key].items():
+            group = groups.setdefault(name, [0, 0, 0])
+            for i, value in enumerate(values):
+                group[i] += value
+    return total
+
+def build_group_metrics(groups):
+    """
+    Customer count, active revenue and average active revenue per group
+    Used for per-sales and per-package history snapshots
 
-        missing_ktp_count = int(df['Missing_KTP'].sum())
-        invalid_phone_count = int(df['Invalid_Phone'].sum())
-        incomplete_data_count = int(df['Incomplete_Data'].sum())
+    Args:
+        groups: name -> [customer_count, revenue, active_count] (group_partials)
 
-        # Package distribution
-        package_dist = df['Nama Langganan'].value_counts().to_dict()
-        top_package = max(package_dist.items(), key=lambda x: x[1])
+    Returns:
+        list of dicts with name, customer_count, revenue, avg_revenue, sorted by name
+    """
+    return [
+        {
+            'name': name,
+            'customer_count': customer_count,
+            'revenue': revenue,
+            'avg_revenue': round(revenue / active_count, 2) if active_count else 0
+        }
+        for name, (customer_count, revenue, active_count) in sorted(groups.items())
+    ]
 
-        # Location distribution with revenue
-        location_revenue = {}
-        for location in df['Nama Lokasi'].dropna().unique():
-            location_df = df[df['Nama Lokasi'] == location]
-            location_df['Harga_Clean'] = location_df['Harga'].apply(clean_price)
-            revenue = int(location_df[location_df['Status Langganan'] == 'On']['Harga_Clean'].sum())
-            location_revenue[location] = revenue
+def finish_overview_stats(partials):
+    """
+    Overview stats for history tracking from combined overview partials
 
-        top_location = max(location_revenue.items(), key=lambda x: x[1]) if location_revenue else ('N/A', 0)
+    Args:
+        partials: overview_partials of the whole dataset (or its batches combined)
 
-        # Active sales count
-        active_sales = len(df['Nama Sales'].dropna().unique())
+    Returns:
+        dict with stats, quality_checks, sales_metrics, package_metrics
+    """
+    active_customers = partials['active_customers']
+    packages = partials['packages']
+    locations = partials['locations']
+
+    # Most customers / most revenue (first one seen wins ties)
+    top_package = max(packages.items(), key=lambda x: x[1][0]) if packages else ('N/A', [0])
+    top_location = max(locations.items(), key=lambda x: x[1]) if locations else ('N/A', 0)
+
+    stats = {
+        'total_customers': partials['total_customers'],
+        'active_customers': active_customers,
+        'inactive_customers': partials['inactive_customers'],
+        'total_revenue': partials['revenue'],
+        'avg_revenue_per_customer': int(partials['revenue'] / active_customers) if active_customers else 0,
+        'total_packages': len(packages),
+        'top_package': top_package[0],
+        'top_package_count': top_package[1][0],
+        'top_location': top_location[0],
+        'top_location_revenue': top_location[1],
+        'active_sales': len(partials['sales']),
+        'total_psb_count': partials['psb']
+    }
 
-        # PSB count (using Tanggal Registrasi)
-        total_psb = len(df[df['Tanggal Registrasi'].notna()])
+    quality = {
+        'total_issues': partials['missing_ktp'] + partials['invalid_phone'] + partials['incomplete'],
+        'missing_ktp_count': partials['missing_ktp'],
+        'invalid_phone_count': partials['invalid_phone'],
+        'incomplete_data_count': partials['incomplete']
+    }
 
-        stats = {
-            'total_customers': total_customers,
-            'active_customers': active_customers,
-            'inactive_customers': inactive_customers,
-            'total_revenue': total_monthly_revenue,
-            'avg_revenue_per_customer': avg_revenue_per_customer,
-            'total_packages': len(package_dist),
-            'top_package': top_package[0] if top_package else 'N/A',
-            'top_package_count': int(top_package[1]) if top_package else 0,
-            'top_location': top_location[0] if top_location else 'N/A',
-            'top_location_revenue': int(top_location[1]) if top_location else 0,
-            'active_sales': active_sales,
-            'total_psb_count': total_psb
-        }
+    return {
+        'stats': stats,
+        'quality_checks': quality,
+        # Per-sales and per-package metrics for history detail tables
+        'sales_metrics': build_group_metrics(partials['sales']),
+        'package_metrics': build_group_metrics(packages)
+    }
 
-        quality = {
-            'total_issues': missing_ktp_count + invalid_phone_count + incomplete_data_count,
-            'missing_ktp_count': missing_ktp_count,
-            'invalid_phone_count': invalid_phone_count,
-            'incomplete_data_count': incomplete_data_count
-        }
+def create_overview_stats(df=None):
+    """
+    Create comprehensive overview stats for history tracking
+    Returns dict with all key metrics from current data
 
-        return {
-            'stats': stats,
-            'quality_checks': quality
-        }
+    Args:
+        df: Optional customer DataFrame already in memory (e.g. the text frame just
+            merged by an upload, where '' is a missing value); the main data file is
+            read only when omitted
+    """
+    try:
+        if df is None:
+            df = load_data()
+        return finish_overview_stats(overview_partials(df))
 
     except Exception as e:
         print(f"Error creating overview stats: {str(e)}")
@@ -535,10 +587,80 @@ def create_overview_stats():
 def index():
     return render_template('dashboard.html')
 
+def save_upload_snapshot(overview_stats):
+    """
+    Save a history snapshot from the overview stats returned by merge_and_clean_files
+
+    Returns:
+        snapshot_id or None
+    """
+    try:
+        if overview_stats:
+            # Detail metrics go to their own tables, not into raw_data
+            sales_metrics = overview_stats.pop('sales_metrics', [])
+            package_metrics = overview_stats.pop('package_metrics', [])
+            history_mgr = get_history_manager()
+            snapshot_id = history_mgr.save_snapshot(
+                overview_stats,
+                sales_data=sales_metrics,
+                package_data=package_metrics
+            )
+            print(f"✓ History snapshot saved (ID: {snapshot_id})")
+            return snapshot_id
+    except Exception as e:
+        print(f"Warning: Failed to save history snapshot: {str(e)}")
+    return None
+
+def process_upload(job, uploaded_files, mode='replace'):
+    """
+    Upload pipeline run by the background worker: hash, read, merge, dedupe, write, snapshot
+    An upload whose files match an already ingested one (same bytes, order and mode) while
+    the data file is still the dataset it produced is answered from the recorded stats
+
+    Returns:
+        tuple: (success, message, result dict for the job status)
+    """
+    history_mgr = get_history_manager()
+    try:
+        job.start_stage('hash')
+        file_hashes = [hash_file(file_path) for file_path in uploaded_files]
+        upload_key = hash_upload(file_hashes, mode)
+
+        ingested = history_mgr.find_ingested_upload(upload_key)
+        if ingested and ingested['dataset_hash'] == get_data_hash():
+            print(f"Upload already ingested at {ingested['ingested_at']}, skipping processing")
+            message = f"File ini sudah pernah di-upload ({ingested['ingested_at'][:16].replace('T', ' ')}), data tidak berubah."
+            return True, message, {
+                'stats': {**ingested['stats'], 'cached': True},
+                'snapshot_id': ingested['snapshot_id']
+            }
+
+        success, message, stats, overview_stats = merge_and_clean_files(uploaded_files, on_stage=job.start_stage, mode=mode)
+    finally:
+        # Remove uploaded files after processing
+        for file_path in uploaded_files:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    if not success:
+        return False, message, None
+
+    job.start_stage('snapshot')
+    snapshot_id = save_upload_snapshot(overview_stats)
+
+    stats['file_hashes'] = file_hashes
+    stats['dataset_hash'] = get_data_hash()
+    history_mgr.record_ingested_upload(upload_key, mode, file_hashes, stats['dataset_hash'], stats, message, snapshot_id)
+    return True, message, {'stats': stats, 'snapshot_id': snapshot_id}
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     """
-    Upload and clean Excel file(s) - supports multiple files
+    Upload Excel file(s) - supports multiple files
+    Files are saved, then processed by a background worker; the response carries
+    the job ID to poll at /api/upload/<job_id> (?wait=true blocks until done)
+    mode=upsert (form field or query) merges the upload into the stored data by ID Pelanggan
+    instead of replacing it
     """
     # Check if files are in request
     if 'files' not in request.files:
@@ -550,25 +672,30 @@ def upload_file():
     if len(files) == 0 or all(f.filename == '' for f in files):
         return jsonify({'success': False, 'message': 'No files selected'}), 400
 
-    try:
-        uploaded_files = []
-        file_stats = []
-
-        # Process each file
-        for idx, file in enumerate(files, 1):
-            if file.filename == '':
-                continue
+    mode = (request.form.get('mode') or request.args.get('mode') or 'replace').lower()
+    if mode not in config.UPLOAD_MODES:
+        return jsonify({
+            'success': False,
+            'message': f"Mode upload tidak dikenal: {mode} (pilih {', '.join(config.UPLOAD_MODES)})"
+        }), 400
 
-            # Check file extension
-            if not allowed_file(file.filename):
+    uploaded_files = []
+    try:
+        # Check all file extensions before saving anything
+        for file in files:
+            if file.filename != '' and not allowed_file(file.filename):
                 return jsonify({
                     'success': False,
                     'message': f'File {file.filename} harus format .xls, .xlsx, atau .csv'
                 }), 400
 
-            # Save uploaded file temporarily
+        # Save uploaded files temporarily
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        for idx, file in enumerate(files, 1):
+            if file.filename == '':
+                continue
+
             filename = secure_filename(file.filename)
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             upload_filename = f'upload_{timestamp}_{idx}_{filename}'
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], upload_filename)
             file.save(file_path)
@@ -576,35 +703,41 @@ def upload_file():
 
             print(f"Saved file {idx}: {upload_filename}")
 
-        # Merge and process all files
-        success, message, stats = merge_and_clean_files(uploaded_files)
-
-        # Remove uploaded files after processing
-        for file_path in uploaded_files:
-            if os.path.exists(file_path):
+        # Only the batch path (replace of large CSV / HTML) reads uploads in bounded memory
+        total_bytes = sum(os.path.getsize(file_path) for file_path in uploaded_files)
+        chunked = mode == 'replace' and use_chunked_ingest(uploaded_files)
+        if total_bytes > config.MAX_IN_MEMORY_UPLOAD_BYTES and not chunked:
+            for file_path in uploaded_files:
                 os.remove(file_path)
-
-        if success:
-            # Save snapshot to history after successful upload
-            try:
-                overview_stats = create_overview_stats()
-                if overview_stats:
-                    history_mgr = get_history_manager()
-                    snapshot_id = history_mgr.save_snapshot(overview_stats)
-                    print(f"✓ History snapshot saved (ID: {snapshot_id})")
-            except Exception as e:
-                print(f"Warning: Failed to save history snapshot: {str(e)}")
-
-            return jsonify({
-                'success': True,
-                'message': message,
-                'stats': stats
-            }), 200
-        else:
             return jsonify({
                 'success': False,
-                'message': message
-            }), 500
+                'message': (f'Upload {total_bytes // (1024 * 1024)} MB terlalu besar: file Excel dan mode upsert '
+                            f'maksimal {config.MAX_IN_MEMORY_UPLOAD_BYTES // (1024 * 1024)} MB '
+                            f'(CSV / HTML besar bisa di-upload dengan mode replace)')
+            }), 413
+
+        job_manager = get_upload_job_manager()
+        job, future = job_manager.submit(
+            lambda job: process_upload(job, uploaded_files, mode),
+            [file.filename for file in files if file.filename != '']
+        )
+
+        if request.args.get('wait', 'false').lower() in ('1', 'true', 'yes'):
+            future.result()
+            status = job.to_dict()
+            return jsonify({
+                'success': status['status'] == 'done',
+                'message': status['message'],
+                'stats': status.get('stats'),
+                'job': status
+            }), 200 if status['status'] == 'done' else 500
+
+        return jsonify({
+            'success': True,
+            'message': 'Upload diterima, data sedang diproses...',
+            'job_id': job.id,
+            'status_url': f'/api/upload/{job.id}'
+        }), 202
 
     except Exception as e:
         # Clean up files on error
@@ -617,6 +750,21 @@ def upload_file():
             'message': f'Error processing files: {str(e)}'
         }), 500
 
+@app.route('/api/upload/<job_id>', methods=['GET'])
+def get_upload_job(job_id):
+    """Status, stage progress and timings of an upload job"""
+    job = get_upload_job_manager().get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'message': f'Upload job tidak ditemukan: {job_id}'
+        }), 404
+
+    return jsonify({
+        'success': True,
+        'data': clean_for_json(job.to_dict())
+    })
+
 @app.route('/api/overview')
 def get_overview():
     df = load_data()
@@ -1629,11 +1777,12 @@ def get_unique_locations():
 
 @app.route('/api/history', methods=['GET'])
 def get_history():
-    """Get all historical snapshots (last 50)"""
+    """Get all historical snapshots (last 50), raw_data only with ?include_raw=true"""
     try:
         limit = request.args.get('limit', 50, type=int)
+        include_raw = request.args.get('include_raw', 'false').lower() in ('1', 'true', 'yes')
         history_mgr = get_history_manager()
-        snapshots = history_mgr.get_history(limit=limit)
+        snapshots = history_mgr.get_history(limit=limit, include_raw=include_raw)
 
         return jsonify({
             'success': True,
@@ -1703,23 +1852,174 @@ def compare_history():
 
 @app.route('/api/history/trend', methods=['GET'])
 def get_history_trend():
-    """Get trend data for last N days"""
+    """
+    Get trend data for a date window
+    Query: days (default 30) or start/end (YYYY-MM-DD), bucket (auto|raw|day|week|month),
+    metrics (comma-separated snapshot columns, default all)
+    """
     try:
         days = request.args.get('days', 30, type=int)
+        metrics = [m.strip() for m in request.args.get('metrics', '').split(',') if m.strip()]
         history_mgr = get_history_manager()
-        trend = history_mgr.get_trend(days=days)
+        trend = history_mgr.get_trend(
+            days=days,
+            start_date=request.args.get('start'),
+            end_date=request.args.get('end'),
+            bucket=request.args.get('bucket'),
+            metrics=metrics or None
+        )
 
         return jsonify({
             'success': True,
             'total': len(trend),
+            'resolution': trend[0]['resolution'] if trend else None,
             'data': clean_for_json(trend)
         })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
             'message': f'Error: {str(e)}'
         }), 500
 
+def detail_history_response(label, name, records):
+    """Build the JSON response for a per-sales / per-package history query"""
+    if not records:
+        return jsonify({
+            'success': False,
+            'message': f'No history found for {label}: {name}'
+        }), 404
+
+    return jsonify({
+        'success': True,
+        'name': name,
+        'total': len(records),
+        'data': clean_for_json(records)
+    })
+
+@app.route('/api/history/sales/<path:sales_name>', methods=['GET'])
+def get_sales_history(sales_name):
+    """Customer count & revenue of one sales agent per upload (?start=&end= YYYY-MM-DD)"""
+    try:
+        history_mgr = get_history_manager()
+        records = history_mgr.get_sales_history(
+            sales_name, start_date=request.args.get('start'), end_date=request.args.get('end')
+        )
+        return detail_history_response('sales', sales_name, records)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        }), 500
+
+@app.route('/api/history/packages/<path:package_name>', methods=['GET'])
+def get_package_history(package_name):
+    """Customer count & revenue of one package per upload (?start=&end= YYYY-MM-DD)"""
+    try:
+        history_mgr = get_history_manager()
+        records = history_mgr.get_package_history(
+            package_name, start_date=request.args.get('start'), end_date=request.args.get('end')
+        )
+        return detail_history_response('package', package_name, records)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        }), 500
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """
+    Row-level changelog of uploads after a point in time
+    Query params: since (YYYY-MM-DD or YYYY-MM-DDTHH:MM, default: latest upload only),
+    customer (ID Pelanggan), type (new / removed / changed), limit
+    """
+    try:
+        limit = int(request.args.get('limit', config.CHANGES_MAX_ROWS))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Parameter tidak valid: limit harus berupa bilangan bulat'}), 400
+    # Clamped to 1..CHANGES_MAX_ROWS (SQLite reads a negative LIMIT as no limit at all)
+    limit = min(max(limit, 1), config.CHANGES_MAX_ROWS)
+
+    try:
+        changesets, truncated = get_history_manager().get_changes(
+            since=request.args.get('since'),
+            customer_id=request.args.get('customer'),
+            change_type=request.args.get('type'),
+            limit=limit
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Parameter tidak valid: {str(e)}'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
+
+    return jsonify({
+        'success': True,
+        'data': changesets,
+        'count': len(changesets),
+        'truncated': truncated
+    })
+
+@app.route('/api/backups', methods=['GET'])
+def list_backups():
+    """Stored versions of the main data file, newest first"""
+    current_hash = get_data_hash()
+    versions = get_backup_store().list_versions()
+    for version in versions:
+        version['current'] = version['hash'] == current_hash
+
+    return jsonify({
+        'success': True,
+        'data': versions,
+        'count': len(versions),
+        'retention': {'count': config.BACKUP_RETENTION_COUNT, 'days': config.BACKUP_RETENTION_DAYS}
+    })
+
+@app.route('/api/backups/<int:version_id>/restore', methods=['POST'])
+def restore_backup(version_id):
+    """Make a stored version the current main data file"""
+    try:
+        backup_store = get_backup_store()
+        if backup_store.get_version(version_id) is None:
+            return jsonify({
+                'success': False,
+                'message': f'Versi backup tidak ditemukan: {version_id}'
+            }), 404
+
+        with publish_lock:
+            # Current data stays restorable too (without retention dropping the version restored)
+            if os.path.exists(config.MAIN_DATA_FILE):
+                backup_store.ensure_version(config.MAIN_DATA_FILE, get_data_hash(), pinned=(version_id,))
+            version = backup_store.restore(version_id, config.MAIN_DATA_FILE)
+        if version is None:
+            return jsonify({
+                'success': False,
+                'message': f'Versi backup {version_id} sudah dihapus oleh retensi'
+            }), 409
+
+        return jsonify({
+            'success': True,
+            'message': f'Data berhasil dikembalikan ke versi {version_id}',
+            'data': version,
+            'data_version': read_data_marker(config.MAIN_DATA_FILE)['version']
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error restoring backup: {str(e)}'}), 500
+
 @app.route('/api/history/cleanup', methods=['POST'])
 def cleanup_history():
     """Clean up old snapshots, keep only N most recent (admin endpoint)"""
@@ -1742,16 +2042,8 @@ def cleanup_history():
 def customer_segmentation():
     """Customer Segmentation using RFM Analysis + Churn Risk"""
     try:
-        df = load_data()
-        today = pd.Timestamp.now()
-
-        # Use refactored date parser instead of duplicating
-        df['Tanggal_Registrasi_Parsed'] = df['Tanggal Registrasi'].apply(parse_date_flexible)
-        df['Pembayaran_Terakhir_Parsed'] = df['Pembayaran Terakhir'].apply(parse_date_flexible)
-
-        # Calculate metrics using refactored utilities
-        df['Tenure_Days'] = df['Tanggal_Registrasi_Parsed'].apply(lambda x: get_tenure_days(x, today) if pd.notna(x) else 0)
-        df['Days_Since_Payment'] = df['Pembayaran_Terakhir_Parsed'].apply(lambda x: get_days_since(x, today) if pd.notna(x) else 999)
+        # Tenure, days since payment and churn risk come from the shared scoring cache
+        df = load_scored_data()
         df['Harga_Clean'] = df['Harga'].apply(clean_price)
 
         # RFM Scoring (1-5 scale)
@@ -1788,74 +2080,77 @@ def customer_segmentation():
         # Calculate RFM Score
         df['RFM_Score'] = df['R_Score'] + df['F_Score'] + df['M_Score']
 
-        # Churn Risk Score (0-100)
-        df['Churn_Risk_Score'] = 0.0
-
-        # Rule 1: Days since payment (most important)
-        df.loc[df['Days_Since_Payment'] > 180, 'Churn_Risk_Score'] += 40
-        df.loc[(df['Days_Since_Payment'] > 90) & (df['Days_Since_Payment'] <= 180), 'Churn_Risk_Score'] += 25
-        df.loc[(df['Days_Since_Payment'] > 30) & (df['Days_Since_Payment'] <= 90), 'Churn_Risk_Score'] += 10
-
-        # Rule 2: Status langganan
-        df.loc[df['Status Langganan'] == 'Off', 'Churn_Risk_Score'] += 30
-
-        # Rule 3: Tenure (new customers = lower risk initially)
-        df.loc[df['Tenure_Days'] < 30, 'Churn_Risk_Score'] -= 10
-        df.loc[df['Tenure_Days'] > 365, 'Churn_Risk_Score'] -= 5
-
-        # Clamp to 0-100
-        df['Churn_Risk_Score'] = df['Churn_Risk_Score'].clip(0, 100)
-
-        # Segment Assignment
-        def assign_segment(row):
-            status = row['Status Langganan']
-            rfm = row['RFM_Score']
-            churn = row['Churn_Risk_Score']
-            days_unpaid = row['Days_Since_Payment']
-
-            if status == 'Off':
-                if churn > 70:
-                    return 'Churned'
-                elif churn > 50:
-                    return 'At Risk'
-            else:  # On
-                if row['Tenure_Days'] < 30:
-                    return 'New'
-                elif rfm >= 13 and churn < 30:
-                    return 'Champions'
-                elif rfm >= 10 and churn < 50:
-                    return 'Loyal'
-                elif rfm >= 7 or churn < 50:
-                    return 'Potential'
-                else:
-                    return 'At Risk'
-
-            return 'At Risk'
-
-        df['Segment'] = df.apply(assign_segment, axis=1)
+        # Segment Assignment (vectorized, first matching condition wins)
+        is_off = df['Status Langganan'] == 'Off'
+        rfm = df['RFM_Score']
+        churn = df['Churn_Risk_Score']
+        segment_conditions = [
+            is_off & (churn > 70),
+            is_off,
+            df['Tenure_Days'] < 30,
+            (rfm >= 13) & (churn < 30),
+            (rfm >= 10) & (churn < 50),
+            (rfm >= 7) | (churn < 50),
+        ]
+        segment_choices = ['Churned', 'At Risk', 'New', 'Champions', 'Loyal', 'Potential']
+        df['Segment'] = np.select(segment_conditions, segment_choices, default='At Risk')
+
+        # Per-segment stats in a single groupby pass
+        is_on = df['Status Langganan'] == 'On'
+        df['Active_Revenue'] = df['Harga_Clean'].where(is_on, 0)
+        df['Is_Active'] = is_on.astype(int)
+        df['Is_Inactive'] = is_off.astype(int)
+        grouped = df.groupby('Segment', sort=False)
+        segment_stats = grouped.agg(
+            count=('Segment', 'size'),
+            avg_rfm_score=('RFM_Score', 'mean'),
+            avg_churn_risk=('Churn_Risk_Score', 'mean'),
+            total_revenue=('Active_Revenue', 'sum'),
+            avg_revenue=('Harga_Clean', 'mean'),
+            avg_tenure_days=('Tenure_Days', 'mean'),
+            active_count=('Is_Active', 'sum'),
+            inactive_count=('Is_Inactive', 'sum'),
+        )
+        top_packages = grouped['Nama Langganan'].value_counts()
+        top_locations = grouped['Nama Lokasi'].value_counts()
 
         # Build response
         segments = {}
         for segment_name in ['Champions', 'Loyal', 'Potential', 'At Risk', 'Churned', 'New']:
-            seg_df = df[df['Segment'] == segment_name]
+            if segment_name not in segment_stats.index:
+                segments[segment_name] = {
+                    'count': 0,
+                    'percentage': 0.0,
+                    'avg_rfm_score': 0,
+                    'avg_churn_risk': 0,
+                    'total_revenue': 0,
+                    'avg_revenue_per_customer': 0,
+                    'avg_tenure_days': 0,
+                    'active_count': 0,
+                    'inactive_count': 0,
+                    'top_packages': {},
+                    'top_locations': {},
+                }
+                continue
 
-            # Calculate revenue safely, handling NaN
-            seg_revenue_sum = seg_df[seg_df['Status Langganan'] == 'On']['Harga_Clean'].sum()
-            seg_revenue_mean = seg_df['Harga_Clean'].mean()
-            seg_tenure_mean = seg_df['Tenure_Days'].mean()
+            seg = segment_stats.loc[segment_name]
+            seg_count = int(seg['count'])
+            seg_revenue_sum = seg['total_revenue']
+            seg_revenue_mean = seg['avg_revenue']
+            seg_tenure_mean = seg['avg_tenure_days']
 
             segments[segment_name] = {
-                'count': len(seg_df),
-                'percentage': round(len(seg_df) / len(df) * 100, 2),
-                'avg_rfm_score': round(seg_df['RFM_Score'].mean(), 2) if not pd.isna(seg_df['RFM_Score'].mean()) else 0,
-                'avg_churn_risk': round(seg_df['Churn_Risk_Score'].mean(), 2) if not pd.isna(seg_df['Churn_Risk_Score'].mean()) else 0,
+                'count': seg_count,
+                'percentage': round(seg_count / len(df) * 100, 2),
+                'avg_rfm_score': round(seg['avg_rfm_score'], 2) if not pd.isna(seg['avg_rfm_score']) else 0,
+                'avg_churn_risk': round(seg['avg_churn_risk'], 2) if not pd.isna(seg['avg_churn_risk']) else 0,
                 'total_revenue': int(seg_revenue_sum) if not pd.isna(seg_revenue_sum) and seg_revenue_sum > 0 else 0,
                 'avg_revenue_per_customer': int(seg_revenue_mean) if not pd.isna(seg_revenue_mean) and seg_revenue_mean > 0 else 0,
                 'avg_tenure_days': int(seg_tenure_mean) if not pd.isna(seg_tenure_mean) else 0,
-                'active_count': len(seg_df[seg_df['Status Langganan'] == 'On']),
-                'inactive_count': len(seg_df[seg_df['Status Langganan'] == 'Off']),
-                'top_packages': seg_df['Nama Langganan'].value_counts().head(3).to_dict(),
-                'top_locations': seg_df['Nama Lokasi'].value_counts().head(3).to_dict(),
+                'active_count': int(seg['active_count']),
+                'inactive_count': int(seg['inactive_count']),
+                'top_packages': top_packages.loc[segment_name].head(3).to_dict() if segment_name in top_packages.index else {},
+                'top_locations': top_locations.loc[segment_name].head(3).to_dict() if segment_name in top_locations.index else {},
             }
 
         # Overall stats
@@ -1883,6 +2178,89 @@ def customer_segmentation():
             'message': f'Error: {str(e)}'
         }), 500
 
+# Dimensions reported by profitability_analysis (response key -> column)
+PROFIT_DIMENSIONS = {
+    'by_package': 'Nama Langganan',
+    'by_location': 'Nama Lokasi',
+    'by_sales': 'Nama Sales',
+    'by_segment': 'Segment',
+}
+
+def calculate_profit_columns(df):
+    """
+    Add Cost, Profit and Margin_Percentage columns from Harga_Clean
+    Cost model: config.FIXED_COST_PER_CUSTOMER + config.VARIABLE_COST_PERCENTAGE of revenue
+    Customers with price <= 0 get zero cost, profit and margin
+    """
+    price = df['Harga_Clean']
+    has_price = price > 0
+    variable_cost = np.trunc(price * config.VARIABLE_COST_PERCENTAGE).astype('int64')
+
+    df['Cost'] = np.where(has_price, config.FIXED_COST_PER_CUSTOMER + variable_cost, 0)
+    df['Profit'] = np.where(has_price, price - df['Cost'], 0)
+
+    # Can't have negative margin %
+    margin = df['Profit'] / price.where(has_price) * 100
+    df['Margin_Percentage'] = np.where(has_price, margin.clip(lower=0), 0.0)
+    return df
+
+def assign_profit_segment(df):
+    """Simplified segment per active customer (Churned, New, At Risk, Potential, Loyal)"""
+    conditions = [
+        df['Status Langganan'] == 'Off',
+        df['Tenure_Days'] < 30,
+        df['Days_Since_Payment'] > 180,
+        df['Days_Since_Payment'] > 90,
+    ]
+    return np.select(conditions, ['Churned', 'New', 'At Risk', 'Potential'], default='Loyal')
+
+def aggregate_profit_by_dimensions(df, dimensions=PROFIT_DIMENSIONS):
+    """
+    Aggregate revenue, cost, profit and margin per group for several dimensions at once
+    Dimension columns are stacked into one long frame so a single groupby covers them all
+
+    Returns:
+        dict - {response_key: {group_name: metrics}}
+    """
+    metric_columns = ['Harga_Clean', 'Cost', 'Profit', 'Margin_Percentage']
+    long_df = df.melt(id_vars=metric_columns, value_vars=list(dimensions.values()),
+                      var_name='Dimension', value_name='Group')
+
+    aggregated = long_df.groupby(['Dimension', 'Group']).agg({
+        'Harga_Clean': ['sum', 'count', 'mean'],
+        'Cost': 'sum',
+        'Profit': 'sum',
+        'Margin_Percentage': 'mean'
+    }).round(0)
+
+    column_to_key = {column: key for key, column in dimensions.items()}
+    results = {key: {} for key in dimensions}
+    for (dimension, group), row in aggregated.iterrows():
+        revenue = int(row[('Harga_Clean', 'sum')])
+        cost = int(row[('Cost', 'sum')])
+        profit = int(row[('Profit', 'sum')])
+
+        metrics = {
+            'revenue': revenue,
+            'cost': cost,
+            'profit': profit,
+            'customer_count': int(row[('Harga_Clean', 'count')]),
+            'avg_revenue_per_customer': int(row[('Harga_Clean', 'mean')]),
+            'margin_percentage': float(row[('Margin_Percentage', 'mean')]),
+            'profitability_ratio': float(profit / revenue * 100) if revenue > 0 else 0
+        }
+        if dimension == 'Segment':
+            metrics['roi'] = float((profit / cost * 100)) if cost > 0 else 0  # ROI = Profit / Cost * 100
+
+        results[column_to_key[dimension]][group] = metrics
+
+    return results
+
+def sort_by_profit(group_data, limit=None):
+    """Sort group metrics by profit (descending), optionally keeping only the top N"""
+    items = sorted(group_data.items(), key=lambda x: x[1]['profit'], reverse=True)
+    return dict(items[:limit] if limit else items)
+
 @app.route('/api/profitability-analysis')
 def profitability_analysis():
     """
@@ -1890,45 +2268,15 @@ def profitability_analysis():
     Calculate profit margins, ROI, and profitability metrics by segment, package, and location
     """
     try:
-        df = load_data()
+        # Tenure and days since payment come from the shared scoring cache
+        df = load_scored_data()
         df['Harga_Clean'] = df['Harga'].apply(clean_price)
 
         # Filter to active customers
         df_active = df[df['Status Langganan'] == 'On'].copy()
 
-        # Estimate operational costs (can be adjusted based on business model)
-        # Cost structure assumptions:
-        # - Fixed infrastructure cost per month per customer: ~50K
-        # - Variable cost percentage of revenue: ~20%
-        FIXED_COST_PER_CUSTOMER = 50000
-        VARIABLE_COST_PERCENTAGE = 0.20
-
-        def calculate_profit_metrics(price):
-            """Calculate profit metrics for a given price"""
-            if price <= 0:
-                return {'revenue': 0, 'cost': 0, 'profit': 0, 'margin': 0, 'margin_percentage': 0}
-
-            revenue = price
-            fixed_cost = FIXED_COST_PER_CUSTOMER
-            variable_cost = int(revenue * VARIABLE_COST_PERCENTAGE)
-            total_cost = fixed_cost + variable_cost
-            profit = revenue - total_cost
-            margin_percentage = (profit / revenue * 100) if revenue > 0 else 0
-
-            return {
-                'revenue': revenue,
-                'cost': total_cost,
-                'profit': profit,
-                'margin': profit,
-                'margin_percentage': max(0, margin_percentage)  # Can't have negative margin %
-            }
-
-        df_active['Profit_Metrics'] = df_active['Harga_Clean'].apply(calculate_profit_metrics)
-
-        # Extract profit data
-        df_active['Profit'] = df_active['Profit_Metrics'].apply(lambda x: x['profit'])
-        df_active['Cost'] = df_active['Profit_Metrics'].apply(lambda x: x['cost'])
-        df_active['Margin_Percentage'] = df_active['Profit_Metrics'].apply(lambda x: x['margin_percentage'])
+        # Estimate operational costs from config cost model
+        calculate_profit_columns(df_active)
 
         # Overall profitability metrics
         total_revenue = int(df_active['Harga_Clean'].sum())
@@ -1936,160 +2284,19 @@ def profitability_analysis():
         total_profit = int(df_active['Profit'].sum())
         overall_margin_percentage = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
 
-        # Profitability by package
-        package_profitability = df_active.groupby('Nama Langganan').agg({
-            'Harga_Clean': ['sum', 'count', 'mean'],
-            'Cost': 'sum',
-            'Profit': 'sum',
-            'Margin_Percentage': 'mean'
-        }).round(0)
-
-        package_data = {}
-        for package, row in package_profitability.iterrows():
-            revenue = int(row[('Harga_Clean', 'sum')])
-            count = int(row[('Harga_Clean', 'count')])
-            cost = int(row[('Cost', 'sum')])
-            profit = int(row[('Profit', 'sum')])
-            avg_margin = row[('Margin_Percentage', 'mean')]
-
-            package_data[package] = {
-                'revenue': revenue,
-                'cost': cost,
-                'profit': profit,
-                'customer_count': count,
-                'avg_revenue_per_customer': int(row[('Harga_Clean', 'mean')]),
-                'margin_percentage': float(avg_margin),
-                'profitability_ratio': float(profit / revenue * 100) if revenue > 0 else 0
-            }
-
-        # Sort by profit
-        package_profitability_sorted = dict(sorted(package_data.items(),
-                                                    key=lambda x: x[1]['profit'],
-                                                    reverse=True))
-
-        # Profitability by location (top 15)
-        location_profitability = df_active.groupby('Nama Lokasi').agg({
-            'Harga_Clean': ['sum', 'count', 'mean'],
-            'Cost': 'sum',
-            'Profit': 'sum',
-            'Margin_Percentage': 'mean'
-        }).round(0)
-
-        location_data = {}
-        for location, row in location_profitability.iterrows():
-            revenue = int(row[('Harga_Clean', 'sum')])
-            count = int(row[('Harga_Clean', 'count')])
-            cost = int(row[('Cost', 'sum')])
-            profit = int(row[('Profit', 'sum')])
-            avg_margin = row[('Margin_Percentage', 'mean')]
-
-            location_data[location] = {
-                'revenue': revenue,
-                'cost': cost,
-                'profit': profit,
-                'customer_count': count,
-                'avg_revenue_per_customer': int(row[('Harga_Clean', 'mean')]),
-                'margin_percentage': float(avg_margin),
-                'profitability_ratio': float(profit / revenue * 100) if revenue > 0 else 0
-            }
-
-        # Sort by profit and limit to top 15
-        location_profitability_sorted = dict(sorted(location_data.items(),
-                                                     key=lambda x: x[1]['profit'],
-                                                     reverse=True)[:15])
-
-        # Profitability by sales
-        sales_profitability = df_active.groupby('Nama Sales').agg({
-            'Harga_Clean': ['sum', 'count', 'mean'],
-            'Cost': 'sum',
-            'Profit': 'sum',
-            'Margin_Percentage': 'mean'
-        }).round(0)
-
-        sales_data = {}
-        for sales, row in sales_profitability.iterrows():
-            revenue = int(row[('Harga_Clean', 'sum')])
-            count = int(row[('Harga_Clean', 'count')])
-            cost = int(row[('Cost', 'sum')])
-            profit = int(row[('Profit', 'sum')])
-            avg_margin = row[('Margin_Percentage', 'mean')]
-
-            sales_data[sales] = {
-                'revenue': revenue,
-                'cost': cost,
-                'profit': profit,
-                'customer_count': count,
-                'avg_revenue_per_customer': int(row[('Harga_Clean', 'mean')]),
-                'margin_percentage': float(avg_margin),
-                'profitability_ratio': float(profit / revenue * 100) if revenue > 0 else 0
-            }
-
-        # Sort by profit
-        sales_profitability_sorted = dict(sorted(sales_data.items(),
-                                                  key=lambda x: x[1]['profit'],
-                                                  reverse=True))
-
-        # Profitability by segment (from customer segmentation)
-        today = pd.Timestamp.now()
-
-        # Use refactored date parser instead of duplicating
-        df_active['Tanggal_Registrasi_Parsed'] = df_active['Tanggal Registrasi'].apply(parse_date_flexible)
-        df_active['Pembayaran_Terakhir_Parsed'] = df_active['Pembayaran Terakhir'].apply(parse_date_flexible)
-        df_active['Tenure_Days'] = df_active['Tanggal_Registrasi_Parsed'].apply(lambda x: get_tenure_days(x, today) if pd.notna(x) else 0)
-        df_active['Days_Since_Payment'] = df_active['Pembayaran_Terakhir_Parsed'].apply(lambda x: get_days_since(x, today) if pd.notna(x) else 999)
-
         # Segment assignment (simplified from customer_segmentation)
-        def assign_segment(row):
-            status = row['Status Langganan']
-            tenure = row['Tenure_Days']
-            days_unpaid = row['Days_Since_Payment']
-
-            if status == 'Off':
-                return 'Churned'
-            elif tenure < 30:
-                return 'New'
-            elif pd.notna(days_unpaid):
-                if days_unpaid > 180:
-                    return 'At Risk'
-                elif days_unpaid > 90:
-                    return 'Potential'
-                else:
-                    return 'Loyal'
-            else:
-                return 'Loyal'
+        df_active['Segment'] = assign_profit_segment(df_active)
 
-        df_active['Segment'] = df_active.apply(assign_segment, axis=1)
+        # Profitability by package, location, sales and segment in one aggregation
+        profit_groups = aggregate_profit_by_dimensions(df_active)
+        package_data = profit_groups['by_package']
+        segment_data = profit_groups['by_segment']
 
-        segment_profitability = df_active.groupby('Segment').agg({
-            'Harga_Clean': ['sum', 'count', 'mean'],
-            'Cost': 'sum',
-            'Profit': 'sum',
-            'Margin_Percentage': 'mean'
-        }).round(0)
-
-        segment_data = {}
-        for segment, row in segment_profitability.iterrows():
-            revenue = int(row[('Harga_Clean', 'sum')])
-            count = int(row[('Harga_Clean', 'count')])
-            cost = int(row[('Cost', 'sum')])
-            profit = int(row[('Profit', 'sum')])
-            avg_margin = row[('Margin_Percentage', 'mean')]
-
-            segment_data[segment] = {
-                'revenue': revenue,
-                'cost': cost,
-                'profit': profit,
-                'customer_count': count,
-                'avg_revenue_per_customer': int(row[('Harga_Clean', 'mean')]),
-                'margin_percentage': float(avg_margin),
-                'profitability_ratio': float(profit / revenue * 100) if revenue > 0 else 0,
-                'roi': float((profit / cost * 100)) if cost > 0 else 0  # ROI = Profit / Cost * 100
-            }
-
-        # Sort by profit
-        segment_profitability_sorted = dict(sorted(segment_data.items(),
-                                                    key=lambda x: x[1]['profit'],
-                                                    reverse=True))
+        # Sort by profit (location limited to top 15)
+        package_profitability_sorted = sort_by_profit(package_data)
+        location_profitability_sorted = sort_by_profit(profit_groups['by_location'], limit=15)
+        sales_profitability_sorted = sort_by_profit(profit_groups['by_sales'])
+        segment_profitability_sorted = sort_by_profit(segment_data)
 
         # Profitability insights
         most_profitable_package = max(package_data.items(), key=lambda x: x[1]['profit']) if package_data else None
@@ -2145,6 +2352,212 @@ def profitability_analysis():
             'message': f'Error: {str(e)}'
         }), 500
 
+# Per-group base aggregates for cost simulation, keyed by dataset version and day
+_profit_base_cache = {'key': None, 'base': None}
+_profit_base_lock = threading.Lock()
+
+def load_profit_base_aggregates():
+    """
+    Per-group revenue sums and customer counts of active customers, per profit dimension
+    Profit is linear in the cost parameters, so these sums are all a simulation needs
+
+    Returns:
+        dict - {response_key: {'groups', 'revenue', 'paid_revenue', 'paid_count', 'count'}}
+        plus '_total' with the same arrays for all active customers
+    """
+    today = pd.Timestamp.now().normalize()
+    cache_key = (get_data_version(), today)
+    with _profit_base_lock:
+        if _profit_base_cache['key'] == cache_key:
+            return _profit_base_cache['base']
+
+        df = load_scored_data()
+        df_active = df[df['Status Langganan'] == 'On'].copy()
+        df_active['Harga_Clean'] = df_active['Harga'].apply(clean_price)
+        df_active['Segment'] = assign_profit_segment(df_active)
+
+        # Only customers with a positive price carry cost (see calculate_profit_columns)
+        has_price = df_active['Harga_Clean'] > 0
+        df_active['Paid_Revenue'] = df_active['Harga_Clean'].where(has_price, 0)
+        df_active['Paid_Count'] = has_price.astype(int)
+
+        metric_columns = ['Harga_Clean', 'Paid_Revenue', 'Paid_Count']
+        long_df = df_active.melt(id_vars=metric_columns, value_vars=list(PROFIT_DIMENSIONS.values()),
+                                 var_name='Dimension', value_name='Group')
+        aggregated = long_df.groupby(['Dimension', 'Group']).agg(
+            revenue=('Harga_Clean', 'sum'),
+            paid_revenue=('Paid_Revenue', 'sum'),
+            paid_count=('Paid_Count', 'sum'),
+            count=('Harga_Clean', 'size'),
+        )
+
+        base = {}
+        for key, column in PROFIT_DIMENSIONS.items():
+            if column in aggregated.index.get_level_values('Dimension'):
+                group_stats = aggregated.xs(column, level='Dimension')
+            else:
+                group_stats = aggregated.iloc[0:0]
+            base[key] = {
+                'groups': group_stats.index.tolist(),
+                'revenue': group_stats['revenue'].to_numpy(dtype=float),
+                'paid_revenue': group_stats['paid_revenue'].to_numpy(dtype=float),
+                'paid_count': group_stats['paid_count'].to_numpy(dtype=float),
+                'count': group_stats['count'].to_numpy(dtype=int),
+            }
+        base['_total'] = {
+            'groups': ['Total'],
+            'revenue': np.array([df_active['Harga_Clean'].sum()], dtype=float),
+            'paid_revenue': np.array([df_active['Paid_Revenue'].sum()], dtype=float),
+            'paid_count': np.array([df_active['Paid_Count'].sum()], dtype=float),
+            'count': np.array([len(df_active)], dtype=int),
+        }
+
+        _profit_base_cache['base'] = base
+        _profit_base_cache['key'] = cache_key
+        return base
+
+def simulate_profit_groups(base_group, fixed_cost, variable_cost_percentage):
+    """
+    Recompute cost and profit for every group of one dimension under a cost scenario
+
+    Returns:
+        dict - {group_name: metrics}
+    """
+    cost = fixed_cost * base_group['paid_count'] + variable_cost_percentage * base_group['paid_revenue']
+    profit = base_group['paid_revenue'] - cost
+
+    results = {}
+    for i, group in enumerate(base_group['groups']):
+        revenue = int(base_group['revenue'][i])
+        group_cost = int(round(cost[i]))
+        group_profit = int(round(profit[i]))
+        results[group] = {
+            'revenue': revenue,
+            'cost': group_cost,
+            'profit': group_profit,
+            'customer_count': int(base_group['count'][i]),
+            'profitability_ratio': float(group_profit / revenue * 100) if revenue > 0 else 0,
+            'roi': float(group_profit / group_cost * 100) if group_cost > 0 else 0
+        }
+    return results
+
+def parse_cost_scenario(scenario):
+    """
+    Validate one cost scenario, filling missing parameters from config
+
+    Returns:
+        tuple: (is_valid: bool, (fixed_cost, variable_cost_percentage) or None, error_message: str or None)
+    """
+    if not isinstance(scenario, dict):
+        return False, None, 'Setiap skenario harus berupa object'
+
+    fixed_cost = scenario.get('fixed_cost', config.FIXED_COST_PER_CUSTOMER)
+    variable_cost_percentage = scenario.get('variable_cost_percentage', config.VARIABLE_COST_PERCENTAGE)
+    # true / false are not costs, even though float(True) == 1.0
+    if isinstance(fixed_cost, bool) or isinstance(variable_cost_percentage, bool):
+        return False, None, 'fixed_cost dan variable_cost_percentage harus berupa angka'
+    try:
+        fixed_cost = float(fixed_cost)
+        variable_cost_percentage = float(variable_cost_percentage)
+    except (ValueError, TypeError):
+        return False, None, 'fixed_cost dan variable_cost_percentage harus berupa angka'
+    if not (math.isfinite(fixed_cost) and math.isfinite(variable_cost_percentage)):
+        return False, None, 'fixed_cost dan variable_cost_percentage harus berupa angka berhingga'
+
+    if fixed_cost < 0:
+        return False, None, 'fixed_cost tidak boleh negatif'
+    if variable_cost_percentage < 0 or variable_cost_percentage > 1:
+        return False, None, 'variable_cost_percentage harus antara 0 dan 1'
+
+    return True, (fixed_cost, variable_cost_percentage), None
+
+@app.route('/api/profitability/simulate', methods=['POST'])
+def simulate_profitability():
+    """
+    What-if cost model simulation
+    Body: {"fixed_cost": 60000, "variable_cost_percentage": 0.25}
+      or {"scenarios": [{...}, {...}]} for a batch of scenarios
+    Missing parameters default to the config cost model. Variable cost is
+    applied to group revenue sums, so it is not truncated per customer
+    """
+    try:
+        # Only an empty body means "all defaults"; a body that is not JSON is an error
+        if not request.get_data():
+            data = {}
+        else:
+            data = request.get_json(silent=True)
+            if data is None:
+                return jsonify({
+                    'success': False,
+                    'message': 'Body harus berupa JSON yang valid (Content-Type: application/json)'
+                }), 400
+        if not isinstance(data, dict):
+            return jsonify({
+                'success': False,
+                'message': 'Body harus berupa object JSON'
+            }), 400
+        scenarios = data['scenarios'] if 'scenarios' in data else [data]
+
+        if not isinstance(scenarios, list) or len(scenarios) == 0:
+            return jsonify({
+                'success': False,
+                'message': 'scenarios harus array dan tidak boleh kosong'
+            }), 400
+
+        parsed_scenarios = []
+        for scenario in scenarios:
+            is_valid, params, error_message = parse_cost_scenario(scenario)
+            if not is_valid:
+                return jsonify({
+                    'success': False,
+                    'message': error_message
+                }), 400
+            parsed_scenarios.append(params)
+
+        base = load_profit_base_aggregates()
+
+        results = []
+        for fixed_cost, variable_cost_percentage in parsed_scenarios:
+            total = simulate_profit_groups(base['_total'], fixed_cost, variable_cost_percentage)['Total']
+            by_dimension = {
+                key: simulate_profit_groups(base[key], fixed_cost, variable_cost_percentage)
+                for key in PROFIT_DIMENSIONS
+            }
+
+            results.append({
+                'parameters': {
+                    'fixed_cost': fixed_cost,
+                    'variable_cost_percentage': variable_cost_percentage
+                },
+                'summary': {
+                    'total_revenue': total['revenue'],
+                    'total_cost': total['cost'],
+                    'total_profit': total['profit'],
+                    'overall_margin_percentage': round(total['profitability_ratio'], 2),
+                    'total_customers': total['customer_count'],
+                    'avg_profit_per_customer': int(total['profit'] / total['customer_count']) if total['customer_count'] > 0 else 0,
+                    'overall_roi': round(total['roi'], 2)
+                },
+                'by_package': sort_by_profit(by_dimension['by_package']),
+                'by_location': sort_by_profit(by_dimension['by_location'], limit=15),
+                'by_sales': sort_by_profit(by_dimension['by_sales']),
+                'by_segment': sort_by_profit(by_dimension['by_segment'])
+            })
+
+        return jsonify(clean_for_json({
+            'success': True,
+            'total': len(results),
+            'scenarios': results
+        }))
+
+    except Exception as e:
+        import traceback
+        print(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        }), 500
+
 @app.route('/api/churn-analysis')
 def churn_analysis():
     """
@@ -2152,51 +2565,10 @@ def churn_analysis():
     Identify at-risk customers, calculate churn probability, and provide retention strategies
     """
     try:
-        df = load_data()
-        today = pd.Timestamp.now()
-
-        # Use refactored date parser instead of duplicating
-        df['Tanggal_Registrasi_Parsed'] = df['Tanggal Registrasi'].apply(parse_date_flexible)
-        df['Pembayaran_Terakhir_Parsed'] = df['Pembayaran Terakhir'].apply(parse_date_flexible)
+        # Tenure, days since payment, churn risk score and category come from the shared scoring cache
+        df = load_scored_data()
         df['Harga_Clean'] = df['Harga'].apply(clean_price)
 
-        # Calculate tenure using refactored utilities
-        df['Tenure_Days'] = df['Tanggal_Registrasi_Parsed'].apply(lambda x: get_tenure_days(x, today) if pd.notna(x) else 0)
-        df['Days_Since_Payment'] = df['Pembayaran_Terakhir_Parsed'].apply(lambda x: get_days_since(x, today) if pd.notna(x) else 999)
-
-        # Churn Risk Scoring (0-100)
-        df['Churn_Risk_Score'] = 0.0
-
-        # Rule 1: Days since payment (most important - 40 points)
-        df.loc[df['Days_Since_Payment'] > 180, 'Churn_Risk_Score'] += 40
-        df.loc[(df['Days_Since_Payment'] > 90) & (df['Days_Since_Payment'] <= 180), 'Churn_Risk_Score'] += 25
-        df.loc[(df['Days_Since_Payment'] > 30) & (df['Days_Since_Payment'] <= 90), 'Churn_Risk_Score'] += 10
-
-        # Rule 2: Status langganan (30 points)
-        df.loc[df['Status Langganan'] == 'Off', 'Churn_Risk_Score'] += 30
-
-        # Rule 3: Tenure (new = lower risk, long-term = lower risk)
-        df.loc[df['Tenure_Days'] < 30, 'Churn_Risk_Score'] -= 10  # New customers get benefit
-        df.loc[df['Tenure_Days'] > 365, 'Churn_Risk_Score'] -= 5   # Loyal get small benefit
-
-        # Clamp to 0-100
-        df['Churn_Risk_Score'] = df['Churn_Risk_Score'].clip(0, 100)
-
-        # Categorize churn risk
-        def categorize_risk(score):
-            if score >= 80:
-                return 'Critical'
-            elif score >= 60:
-                return 'High'
-            elif score >= 40:
-                return 'Medium'
-            elif score >= 20:
-                return 'Low'
-            else:
-                return 'Very Low'
-
-        df['Churn_Category'] = df['Churn_Risk_Score'].apply(categorize_risk)
-
         # Active customers only for more meaningful churn analysis
         df_active = df[df['Status Langganan'] == 'On'].copy()
 
@@ -2270,7 +2642,7 @@ def churn_analysis():
                 'location': row['Nama Lokasi'],
                 'sales': row['Nama Sales'],
                 'churn_risk': float(row['Churn_Risk_Score']),
-                'risk_category': categorize_risk(row['Churn_Risk_Score']),
+                'risk_category': row['Churn_Category'],
                 'days_since_payment': int(row['Days_Since_Payment']) if pd.notna(row['Days_Since_Payment']) else 0,
                 'tenure_days': int(row['Tenure_Days']) if pd.notna(row['Tenure_Days']) else 0,
                 'monthly_revenue': int(row['Harga_Clean'])
@@ -2369,5 +2741,65 @@ def churn_analysis():
             'message': f'Error: {str(e)}'
         }), 500
 
+# Column mapping for churn score export (source column -> exported field)
+CHURN_EXPORT_COLUMNS = {
+    'ID Pelanggan': 'id_pelanggan',
+    'Churn_Risk_Score': 'churn_risk_score',
+    'Churn_Category': 'churn_category',
+    'Days_Since_Payment': 'days_since_payment',
+    'Tenure_Days': 'tenure_days',
+}
+
+@app.route('/api/churn-scores')
+def export_churn_scores():
+    """
+    Export churn risk score of every customer (for nightly CRM sync)
+    Streams NDJSON (default) or CSV (?format=csv) in chunks from the scoring cache
+    """
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({
+            'success': False,
+            'message': 'format harus ndjson atau csv'
+        }), 400
+
+    try:
+        scores = load_scored_data(columns=list(CHURN_EXPORT_COLUMNS))
+        scores = scores.rename(columns=CHURN_EXPORT_COLUMNS)
+        # Missing IDs export as '' (IDs are already text, see load_scored_data)
+        scores['id_pelanggan'] = scores['id_pelanggan'].fillna('')
+    except Exception as e:
+        import traceback
+        print(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        }), 500
+
+    chunk_size = config.CHURN_EXPORT_CHUNK_SIZE
+
+    def generate():
+        for start in range(0, len(scores), chunk_size):
+            chunk = scores.iloc[start:start + chunk_size]
+            if export_format == 'csv':
+                yield chunk.to_csv(index=False, header=(start == 0))
+            else:
+                lines = chunk.to_json(orient='records', lines=True)
+                yield lines if lines.endswith('\n') else lines + '\n'
+        if len(scores) == 0 and export_format == 'csv':
+            yield scores.to_csv(index=False)
+
+    if export_format == 'csv':
+        mimetype = 'text/csv'
+        filename = 'churn_scores.csv'
+    else:
+        mimetype = 'application/x-ndjson'
+        filename = 'churn_scores.ndjson'
+
+    return Response(generate(), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={filename}',
+        'X-Total-Count': str(len(scores))
+    })
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
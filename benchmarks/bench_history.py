@@ -0,0 +1,127 @@
+"""
+Benchmark history queries against a synthetic 10-year snapshot history
+Usage: python benchmarks/bench_history.py [--years 10] [--sales 50] [--packages 30]
+
+Builds a temporary history.db with one snapshot per day plus per-sales and
+per-package detail rows, then times the HistoryManager read paths and a
+per-agent trend query with and without the detail-table indexes.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_manager import HistoryManager
+
+
+def build_history(manager, years, sales_count, package_count):
+    """Fill the database with one synthetic snapshot per day"""
+    start = date.today() - timedelta(days=365 * years)
+    raw_padding = {f'metric_{i}': i * 1000 for i in range(1000)}  # raw_data is typically tens of KB
+
+    for day in range(365 * years):
+        upload_date = (start + timedelta(days=day)).strftime('%Y-%m-%d')
+        overview_stats = {
+            'stats': {
+                'total_customers': 5000 + day,
+                'active_customers': 4000 + day,
+                'inactive_customers': 1000,
+                'total_revenue': 600000000 + day * 1000,
+                'avg_revenue_per_customer': 150000,
+            },
+            'quality_checks': {'total_issues': day % 50},
+            'padding': raw_padding,
+        }
+        sales_data = [
+            {'name': f'Sales {i}', 'customer_count': 100 + i, 'revenue': 15000000 + i, 'avg_revenue': 150000}
+            for i in range(sales_count)
+        ]
+        package_data = [
+            {'name': f'Paket {i}', 'customer_count': 150 + i, 'revenue': 20000000 + i, 'avg_revenue': 150000}
+            for i in range(package_count)
+        ]
+        with manager._connection() as conn, conn:
+            raw_blob, raw_base_id = manager._encode_raw(conn, overview_stats)
+            cursor = conn.execute(
+                'INSERT INTO snapshots (timestamp, upload_date, total_customers, active_customers, '
+                'inactive_customers, total_revenue, avg_revenue_per_customer, raw_data, raw_base_id) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (upload_date + 'T12:00:00', upload_date,
+                 overview_stats['stats']['total_customers'], overview_stats['stats']['active_customers'],
+                 overview_stats['stats']['inactive_customers'], overview_stats['stats']['total_revenue'],
+                 overview_stats['stats']['avg_revenue_per_customer'], raw_blob, raw_base_id)
+            )
+            manager._insert_sales_rows(conn, cursor.lastrowid, sales_data)
+            manager._insert_package_rows(conn, cursor.lastrowid, package_data)
+
+
+def timed(label, func, repeat=20):
+    """Run func several times and print the best wall time"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    size = len(result) if hasattr(result, '__len__') else result
+    print(f"{label:<45} {best * 1000:9.3f} ms  ({size} rows)")
+
+
+def per_agent_trend(db_path, sales_name):
+    """Per-agent range scan joined to snapshot dates"""
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute('''
+        SELECT s.upload_date, ss.customer_count, ss.revenue
+        FROM sales_snapshots ss
+        JOIN snapshots s ON s.id = ss.snapshot_id
+        WHERE ss.sales_name = ?
+        ORDER BY s.upload_date
+    ''', (sales_name,)).fetchall()
+    conn.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--sales', type=int, default=50)
+    parser.add_argument('--packages', type=int, default=30)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'history.db')
+        manager = HistoryManager(db_path)
+
+        start = time.perf_counter()
+        build_history(manager, args.years, args.sales, args.packages)
+        print(f"Built {args.years}-year history in {time.perf_counter() - start:.1f}s "
+              f"({os.path.getsize(db_path) / 1024 / 1024:.1f} MB)")
+        start = time.perf_counter()
+        manager.compact()
+        print(f"Compacted rollups in {time.perf_counter() - start:.1f}s\n")
+
+        timed('get_history(limit=50)', lambda: manager.get_history(limit=50))
+        timed('get_history(limit=50, include_raw=True)', lambda: manager.get_history(limit=50, include_raw=True))
+        timed('get_trend(days=365)', lambda: manager.get_trend(days=365))
+        timed('get_trend(days=365, include_raw=True)', lambda: manager.get_trend(days=365, include_raw=True))
+        timed(f'get_trend(days={365 * args.years})', lambda: manager.get_trend(days=365 * args.years))
+        timed('per-agent trend (indexed)', lambda: per_agent_trend(db_path, 'Sales 7'))
+
+        conn = sqlite3.connect(db_path)
+        plan = conn.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM sales_snapshots WHERE sales_name = ?', ('Sales 7',)
+        ).fetchall()
+        print(f"\nQuery plan: {[row[-1] for row in plan]}")
+        conn.execute('DROP INDEX idx_sales_snapshots_name')
+        conn.close()
+
+        timed('per-agent trend (no name index)', lambda: per_agent_trend(db_path, 'Sales 7'), repeat=5)
+        manager.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Benchmark file reading strategies
+Usage: python benchmarks/bench_readers.py [--rows 100000] [--repeat 1]
+       python benchmarks/bench_readers.py --file export.xls [--repeat 1]
+
+Without --file, writes a temporary .xlsx shaped like the billing system's export
+(title row, blank row, header, then customer rows), then times every configured engine
+through the upload reader plus raw openpyxl read_only row iteration.
+With --file, sniffs the file's real format and times every strategy configured for it
+(READ_STRATEGIES) on that file.
+Engines whose package is not installed are reported and skipped.
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openpyxl
+
+from config import READ_STRATEGIES
+from utils import parser as file_parser
+
+HEADER = [
+    'No', 'ID Pelanggan', 'Nama Pelanggan', 'Tlp', 'Alamat', 'Nama Langganan', 'Harga',
+    'Status Langganan', 'Nama Lokasi', 'Nama Sales', 'Jatuh Tempo', 'Tanggal Registrasi',
+    'Pembayaran Terakhir', 'Titik Koordinat Lokasi', 'Insentif Sales',
+]
+PACKAGES = [('Paket 5M', 100000), ('Paket 10M', 150000), ('Paket 20M', 200000), ('Paket 50M', 350000)]
+
+
+def build_export(path, rows, seed=1):
+    """Write a synthetic export with mixed text / number / date cells"""
+    rng = random.Random(seed)
+    start = datetime(2021, 1, 1)
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Data Pelanggan')
+    sheet.append(['Laporan Data Pelanggan'])
+    sheet.append([])
+    sheet.append(HEADER)
+    for i in range(rows):
+        package, price = rng.choice(PACKAGES)
+        sheet.append([
+            i + 1,
+            f'CID{i:06d}',
+            f'Pelanggan {i}',
+            rng.choice(['08123456789', '0812345', None]),
+            f'Jl. Contoh No. {i}',
+            package,
+            price,
+            rng.choice(['On', 'On', 'On', 'Off']),
+            rng.choice(['Loc A', 'Loc B', 'Loc C', None]),
+            rng.choice(['Andi', 'Budi', 'Citra', 'Dewi', None]),
+            rng.choice([1, 5, 10, 20]),
+            start + timedelta(days=rng.randint(0, 2000)),
+            rng.choice([(start + timedelta(days=rng.randint(0, 2000))).strftime('%d-%B-%Y'), 'Data Belum Ada']),
+            rng.choice(['-6.2,106.8', '0,0', None]),
+            rng.choice([20000, 30000, None]),
+        ])
+    workbook.save(path)
+
+
+def iterate_read_only(path):
+    """Reference: openpyxl read_only row iteration without building a DataFrame"""
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        return sum(1 for _ in workbook.worksheets[0].iter_rows(values_only=True))
+    finally:
+        workbook.close()
+
+
+def read_rows(path, strategy, file_format='xlsx'):
+    """Parse a file with one strategy the way uploads do (progress prints silenced)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        success, result = file_parser._read_sniffed(path, file_format, strategy)
+    if not success:
+        raise RuntimeError(result)
+    return len(result)
+
+
+def timed(label, func, repeat):
+    """Run func several times and print the best wall time"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<40} {best:8.2f} s  ({result} rows)")
+    return best
+
+
+def bench_file(path, repeat):
+    """Time every configured strategy for the sniffed format of an existing file"""
+    file_format, encoding = file_parser.sniff_file_format(path)
+    print(f"{path}: {file_format}" + (f" ({encoding})" if encoding else "") +
+          f", {os.path.getsize(path) / 1024 / 1024:.1f} MB\n")
+
+    strategies = READ_STRATEGIES.get(file_format, [])
+    if encoding:
+        strategies = [encoding] + [e for e in strategies if e != encoding]
+    for strategy in strategies:
+        if not file_parser._engine_installed(strategy):
+            print(f"{strategy:<40} skipped (package {file_parser.ENGINE_PACKAGES[strategy]} not installed)")
+            continue
+        try:
+            timed(f'{file_format} ({strategy})', lambda: read_rows(path, strategy, file_format), repeat)
+        except RuntimeError as e:
+            print(f"{file_format + ' (' + strategy + ')':<40} failed: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--file', help='Benchmark the strategies for this file instead of a synthetic export')
+    args = parser.parse_args()
+
+    if args.file:
+        bench_file(args.file, args.repeat)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'export.xlsx')
+        start = time.perf_counter()
+        build_export(path, args.rows)
+        print(f"Built {args.rows}-row export in {time.perf_counter() - start:.1f}s "
+              f"({os.path.getsize(path) / 1024 / 1024:.1f} MB)\n")
+
+        results = {}
+        for engine in READ_STRATEGIES['xlsx']:
+            if not file_parser._engine_installed(engine):
+                results[engine] = None
+                continue
+            results[engine] = timed(f'xlsx ({engine})', lambda: read_rows(path, engine), args.repeat)
+        results['read_only'] = timed('openpyxl read_only iter_rows', lambda: iterate_read_only(path), args.repeat)
+
+        for engine, seconds in results.items():
+            if seconds is None:
+                print(f"{engine:<40} skipped (package {file_parser.ENGINE_PACKAGES[engine]} not installed)")
+        print(f"\nDefault strategy order: {file_parser.available_strategies('xlsx')}")
+
+
+if __name__ == '__main__':
+    main()
@@ -7,13 +7,44 @@ import os
 # ===== FILE UPLOAD CONFIGURATION =====
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'xls', 'xlsx', 'csv'}
-MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+MAX_CONTENT_LENGTH = 1024 * 1024 * 1024  # 1GB max upload request (large CSV / HTML exports are ingested in batches)
+MAX_IN_MEMORY_UPLOAD_BYTES = 16 * 1024 * 1024  # 16MB max for uploads read whole (Excel workbooks, upsert)
 MAX_DISPLAY_ROWS = 100  # Customer list display limit
+UPLOAD_WORKERS = 1      # Background upload workers (uploads replace the same data file, keep 1 to run them in order)
+UPLOAD_JOB_RETENTION = 50  # Finished upload jobs kept for /api/upload/<job_id>
+UPLOAD_MODES = ['replace', 'upsert']  # replace: upload becomes the dataset, upsert: merged in by ID Pelanggan
 
 # ===== DATA FILES =====
 MAIN_DATA_FILE = 'data-wifi-clean.csv'
 SOP_RULES_FILE = 'sop_rules.json'
+BACKUP_DIR = 'backups'                # Compressed, content-addressed versions of MAIN_DATA_FILE
+BACKUP_RETENTION_COUNT = 30          # Versions kept (newest first)
+BACKUP_RETENTION_DAYS = 90           # Versions older than this are dropped, the newest is always kept (None = count only)
+BACKUP_COMPRESSION_LEVEL = 6         # gzip level of stored versions
+PUBLISH_REPLACE_RETRIES = 8          # os.replace attempts while the target is open elsewhere (Windows sharing violation)
+PUBLISH_REPLACE_RETRY_DELAY = 0.05   # Seconds before the first retry, doubled each time (capped at 1s)
 HISTORY_DB_FILE = 'history.db'
+HISTORY_DB_POOL_SIZE = 8             # Max idle SQLite connections kept for reuse
+HISTORY_DB_BUSY_TIMEOUT = 5.0        # Seconds to wait on a locked database
+HISTORY_DB_STATEMENT_CACHE = 128     # Prepared statements cached per connection
+HISTORY_RAW_COMPRESSION = 'zlib'     # raw_data codec: 'zlib' or 'zstd' (needs zstandard package)
+HISTORY_RAW_COMPRESSION_LEVEL = 6
+HISTORY_RAW_DELTA = True             # Store raw_data as delta against the latest full snapshot
+HISTORY_RAW_KEYFRAME_INTERVAL = 30   # Max deltas per full snapshot
+HISTORY_COMPACTION_ENABLED = True    # Run the background rollup job
+HISTORY_COMPACTION_INTERVAL = 300    # Seconds between rollup runs (also triggered after each upload)
+HISTORY_INTRADAY_RETENTION_DAYS = 30 # Older days keep only their last snapshot (None = keep all)
+HISTORY_UPLOAD_HASH_RETENTION = 200  # Ingested upload hashes kept to detect repeated uploads
+HISTORY_CHANGESET_RETENTION = 100    # Upload changelogs kept for /api/changes
+CHANGES_MAX_ROWS = 5000              # Max changed rows returned by /api/changes
+
+# Trend resolution by requested window (checked top-down)
+HISTORY_TREND_RESOLUTIONS = [
+    (2, 'raw'),                      # <= 2 days: every upload
+    (120, 'day'),                    # <= 120 days: daily rollup
+    (730, 'week'),                   # <= 2 years: weekly rollup
+]
+HISTORY_TREND_DEFAULT_RESOLUTION = 'month'
 
 # ===== PROFITABILITY ANALYSIS =====
 FIXED_COST_PER_CUSTOMER = 50000  # Rp per month
@@ -30,6 +61,19 @@ CHURN_RISK_WEIGHTS = {
     'new_customer_bonus': -10,       # < 30 days tenure = -10 points
     'loyal_bonus': -5,               # > 365 days tenure = -5 points
 }
+CHURN_NEW_CUSTOMER_DAYS = 30         # Tenure below this gets new_customer_bonus
+CHURN_LOYAL_CUSTOMER_DAYS = 365      # Tenure above this gets loyal_bonus
+UNPAID_DAYS_DEFAULT = 999            # Days since payment when never paid
+
+# Score thresholds for churn risk category (checked top-down)
+CHURN_RISK_CATEGORIES = [
+    (80, 'Critical'),
+    (60, 'High'),
+    (40, 'Medium'),
+    (20, 'Low'),
+]
+CHURN_RISK_DEFAULT_CATEGORY = 'Very Low'
+CHURN_EXPORT_CHUNK_SIZE = 5000       # Rows per chunk in /api/churn-scores stream
 
 # ===== DATA QUALITY VALIDATION =====
 DATA_QUALITY_RULES = {
@@ -46,12 +90,21 @@ SUPPORTED_DATE_FORMATS = [
 ]
 
 # ===== EXCEL/CSV READING STRATEGIES =====
-# Order matters - tried in sequence
+# Keyed by the format sniffed from the file content (see utils.parser.sniff_file_format),
+# not by extension. Order matters - tried in sequence
+# Excel engines whose package is not installed are skipped: 'calamine' (pip install python-calamine)
+# is several times faster than openpyxl and is used first when available
 READ_STRATEGIES = {
-    'csv': ['utf-8-sig', 'latin1'],
-    'xlsx': ['openpyxl'],
-    'xls': ['xlrd', 'openpyxl'],
+    'csv': ['utf-8-sig', 'latin1'],  # Detected encoding is tried first
+    'xlsx': ['calamine', 'openpyxl'],  # Zip container (also .xls files saved as xlsx)
+    'xls': ['calamine', 'xlrd'],     # OLE2 / BIFF workbook
+    'html': ['utf-8-sig', 'latin1'], # HTML table saved as .xls (streamed, detected encoding first)
 }
+HEADER_SCAN_ROWS = 10                # Rows searched for the 'ID Pelanggan' header
+HTML_BATCH_ROWS = 5000               # Rows per batch when streaming HTML tables
+PARSE_POOL_SIZE = min(4, os.cpu_count() or 1)  # Worker processes for multi-file uploads (1 = parse in-process)
+INGEST_CHUNKED_MIN_BYTES = 8 * 1024 * 1024  # CSV/HTML uploads at least this large (total) are ingested in batches
+INGEST_CHUNK_ROWS = 20000            # Rows per batch on the chunked ingestion / diff path
 
 # ===== LOG LEVELS =====
 LOG_LEVEL = 'INFO'  # DEBUG, INFO, WARNING, ERROR, CRITICAL
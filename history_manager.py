@@ -5,51 +5,275 @@ Menyimpan semua metrics setiap kali data di-upload atau di-refresh
 
 import sqlite3
 import json
-from datetime import datetime
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from pathlib import Path
 import pandas as pd
+import zlib
+from config import (
+    HISTORY_DB_FILE, HISTORY_DB_POOL_SIZE, HISTORY_DB_BUSY_TIMEOUT, HISTORY_DB_STATEMENT_CACHE,
+    HISTORY_RAW_COMPRESSION, HISTORY_RAW_COMPRESSION_LEVEL, HISTORY_RAW_DELTA, HISTORY_RAW_KEYFRAME_INTERVAL,
+    HISTORY_COMPACTION_ENABLED, HISTORY_COMPACTION_INTERVAL, HISTORY_INTRADAY_RETENTION_DAYS,
+    HISTORY_TREND_RESOLUTIONS, HISTORY_TREND_DEFAULT_RESOLUTION, HISTORY_UPLOAD_HASH_RETENTION,
+    HISTORY_CHANGESET_RETENTION
+)
+
+# zstd is optional, zlib is always available
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # Database path
-DB_PATH = 'history.db'
+DB_PATH = HISTORY_DB_FILE
+
+# Snapshot columns returned by list queries (raw_data is only loaded on request)
+SNAPSHOT_COLUMNS = [
+    'id', 'timestamp', 'upload_date',
+    'total_customers', 'active_customers', 'inactive_customers',
+    'total_revenue', 'avg_revenue_per_customer', 'total_packages',
+    'quality_issues_count', 'missing_ktp_count', 'invalid_phone_count', 'missing_coords_count',
+    'top_package', 'top_package_count', 'top_location', 'top_location_revenue',
+    'active_sales_count', 'total_psb_count',
+]
+
+# Per-snapshot metrics carried into rollups (closing value of each period)
+ROLLUP_METRIC_COLUMNS = SNAPSHOT_COLUMNS[3:]
+
+# Text metrics have no delta; the others get a <name>_trend column in get_trend
+TREND_TEXT_METRICS = {'top_package', 'top_location'}
+TREND_COLUMN_NAMES = {
+    'total_customers': 'customer_trend',
+    'total_revenue': 'revenue_trend',
+}
+
+def trend_column(metric):
+    """Name of the delta column returned by get_trend for a metric"""
+    return TREND_COLUMN_NAMES.get(metric, f'{metric}_trend')
+
+# Period start expression per rollup resolution ({0} = date column or parameter)
+ROLLUP_PERIODS = {
+    'day': "date({0})",
+    'week': "date({0}, '-6 days', 'weekday 1')",
+    'month': "date({0}, 'start of month')",
+}
+
+# Earliest upload date saved after the last compaction (its periods have no up to date rollup)
+UNCOMPACTED_SINCE_SQL = '''(
+    SELECT MIN(upload_date) FROM snapshots
+    WHERE id > COALESCE((SELECT CAST(value AS INTEGER) FROM history_meta WHERE key = 'rollup_snapshot_id'), 0)
+)'''
+
+SNAPSHOTS_TABLE_DDL = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp DATETIME NOT NULL,
+        upload_date DATE NOT NULL,
+        total_customers INTEGER,
+        active_customers INTEGER,
+        inactive_customers INTEGER,
+        total_revenue INTEGER,
+        avg_revenue_per_customer REAL,
+        total_packages INTEGER,
+        quality_issues_count INTEGER,
+        missing_ktp_count INTEGER,
+        invalid_phone_count INTEGER,
+        missing_coords_count INTEGER,
+        top_package TEXT,
+        top_package_count INTEGER,
+        top_location TEXT,
+        top_location_revenue INTEGER,
+        active_sales_count INTEGER,
+        total_psb_count INTEGER,
+        raw_data TEXT,
+        raw_base_id INTEGER
+    )
+'''
+
+def snapshot_select(include_raw=False):
+    """Column list for SELECT on snapshots, with or without the raw_data blob"""
+    columns = SNAPSHOT_COLUMNS + (['raw_data', 'raw_base_id'] if include_raw else [])
+    return ', '.join(columns)
+
+# ===== RAW DATA ENCODING =====
+# raw_data blob layout: 1 byte codec (z = zlib, s = zstd) + 1 byte kind
+# (F = full JSON, D = delta against the snapshot in raw_base_id) + payload.
+# Legacy rows hold plain JSON text and are decoded as-is.
+
+def _compress(payload):
+    """Compress bytes with the configured codec"""
+    if HISTORY_RAW_COMPRESSION == 'zstd' and zstandard is not None:
+        return b's' + zstandard.ZstdCompressor(level=HISTORY_RAW_COMPRESSION_LEVEL).compress(payload)
+    return b'z' + zlib.compress(payload, min(HISTORY_RAW_COMPRESSION_LEVEL, 9))
+
+def _decompress(blob):
+    """Decompress a (codec byte + payload) blob"""
+    codec, payload = blob[:1], blob[1:]
+    if codec == b's':
+        if zstandard is None:
+            raise RuntimeError('raw_data is zstd-compressed but zstandard is not installed')
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return zlib.decompress(payload)
+
+def _flatten(data, prefix=()):
+    """Flatten nested dicts into {path_tuple: leaf_value}"""
+    items = {}
+    for key, value in data.items():
+        path = prefix + (key,)
+        if isinstance(value, dict) and value:
+            items.update(_flatten(value, path))
+        else:
+            items[path] = value
+    return items
+
+def _removed_paths(base, target, prefix=()):
+    """Shortest paths present in base but missing from target"""
+    paths = []
+    for key, value in base.items():
+        path = prefix + (key,)
+        if key not in target:
+            paths.append(path)
+        elif isinstance(value, dict) and isinstance(target[key], dict):
+            paths.extend(_removed_paths(value, target[key], path))
+    return paths
+
+def json_delta(base, target):
+    """
+    Describe target as changes against base
+
+    Returns:
+        dict - {'set': [[path, value], ...], 'del': [path, ...]}
+    """
+    base_items = _flatten(base)
+    target_items = _flatten(target)
+    return {
+        'set': [[list(path), value] for path, value in target_items.items()
+                if path not in base_items or base_items[path] != value],
+        'del': [list(path) for path in _removed_paths(base, target)],
+    }
+
+def apply_json_delta(base, delta):
+    """
+    Rebuild a dict from its base and a delta produced by json_delta
+    Only dicts along changed paths are copied, so base is never modified
+    """
+    result = dict(base)
+    owned = {id(result)}
+
+    def writable_parent(path):
+        parent = result
+        for key in path[:-1]:
+            child = parent.get(key)
+            if not isinstance(child, dict):
+                child = {}
+            elif id(child) not in owned:
+                child = dict(child)
+            owned.add(id(child))
+            parent[key] = child
+            parent = child
+        return parent
+
+    for path in delta['del']:
+        writable_parent(path).pop(path[-1], None)
+    for path, value in delta['set']:
+        writable_parent(path)[path[-1]] = value
+    return result
+
+def encode_raw_data(data, base=None):
+    """Encode a dict as a compressed full blob, or as a delta against base"""
+    if base is not None:
+        return _compress(b'D' + json.dumps(json_delta(base, data)).encode('utf-8'))
+    return _compress(b'F' + json.dumps(data).encode('utf-8'))
+
+def decode_raw_data(value, base_loader=None):
+    """
+    Decode a raw_data column value back into a dict
+
+    Args:
+        value: Stored raw_data (compressed blob or legacy JSON text)
+        base_loader: Callable returning the base dict for delta blobs
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return json.loads(value)
+
+    payload = _decompress(value)
+    kind, body = payload[:1], json.loads(payload[1:].decode('utf-8'))
+    if kind == b'D':
+        return apply_json_delta(base_loader(), body)
+    return body
 
 class HistoryManager:
     """Manage historical data snapshots"""
 
-    def __init__(self, db_path=DB_PATH):
+    def __init__(self, db_path=DB_PATH, pool_size=HISTORY_DB_POOL_SIZE):
         self.db_path = db_path
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._compaction_lock = threading.Lock()
+        self._compaction_requested = threading.Event()
+        self._compactor = None
         self.init_db()
 
+    def _open_connection(self):
+        """
+        Open a tuned SQLite connection
+        WAL lets /api/history reads run while a snapshot write is in progress
+        """
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=HISTORY_DB_BUSY_TIMEOUT,
+            cached_statements=HISTORY_DB_STATEMENT_CACHE,
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(HISTORY_DB_BUSY_TIMEOUT * 1000)}')
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """
+        Borrow a pooled connection (opened on demand, returned after use)
+        Prepared statements are reused through the per-connection statement cache
+        """
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._open_connection()
+
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close(self):
+        """Close all pooled connections"""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
     def init_db(self):
         """Initialize database with required tables"""
-        conn = sqlite3.connect(self.db_path)
+        with self._connection() as conn, conn:
+            self._create_tables(conn)
+
+    def _create_tables(self, conn):
+        """Create snapshot tables if they don't exist"""
         cursor = conn.cursor()
 
-        # Tabel untuk menyimpan snapshots
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS snapshots (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME NOT NULL,
-                upload_date DATE NOT NULL,
-                total_customers INTEGER,
-                active_customers INTEGER,
-                inactive_customers INTEGER,
-                total_revenue INTEGER,
-                avg_revenue_per_customer REAL,
-                total_packages INTEGER,
-                quality_issues_count INTEGER,
-                missing_ktp_count INTEGER,
-                invalid_phone_count INTEGER,
-                missing_coords_count INTEGER,
-                top_package TEXT,
-                top_package_count INTEGER,
-                top_location TEXT,
-                top_location_revenue INTEGER,
-                active_sales_count INTEGER,
-                total_psb_count INTEGER,
-                raw_data TEXT,
-                UNIQUE(upload_date)
-            )
-        ''')
+        # Tabel untuk menyimpan snapshots (satu baris per upload)
+        cursor.execute(SNAPSHOTS_TABLE_DDL.format(table='snapshots'))
 
         # Tabel untuk menyimpan detail metrics per sales
         cursor.execute('''
@@ -77,16 +301,198 @@ class HistoryManager:
             )
         ''')
 
-        conn.commit()
-        conn.close()
+        # raw_base_id: snapshot whose raw_data a delta-encoded raw_data builds on
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(snapshots)').fetchall()]
+        if 'raw_base_id' not in columns:
+            cursor.execute('ALTER TABLE snapshots ADD COLUMN raw_base_id INTEGER')
+
+        # Older databases kept one snapshot per date (UNIQUE(upload_date)): rebuild without it
+        table_sql = cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'snapshots'"
+        ).fetchone()[0]
+        if 'UNIQUE(upload_date)' in table_sql.replace(' ', ''):
+            self._drop_unique_upload_date(cursor)
+
+        # Rollups of snapshots per day / week / month, written by compact()
+        metric_columns = ',\n'.join(f'                {column}' for column in ROLLUP_METRIC_COLUMNS)
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS snapshot_rollups (
+                resolution TEXT NOT NULL,
+                period_start DATE NOT NULL,
+                snapshot_count INTEGER,
+                first_timestamp DATETIME,
+                last_timestamp DATETIME,
+                last_snapshot_id INTEGER,
+{metric_columns},
+                PRIMARY KEY (resolution, period_start)
+            )
+        ''')
+
+        # Key/value state (compaction watermark)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS history_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+
+        # Uploads already ingested, keyed by content hash (see utils.content_hash.hash_upload)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ingested_uploads (
+                upload_key TEXT PRIMARY KEY,
+                mode TEXT,
+                file_hashes TEXT,
+                dataset_hash TEXT,
+                stats TEXT,
+                message TEXT,
+                snapshot_id INTEGER,
+                ingested_at DATETIME
+            )
+        ''')
+
+        # Row-level changelog between dataset versions (see utils.changes.diff_datasets)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS changesets (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at DATETIME NOT NULL,
+                new_count INTEGER,
+                removed_count INTEGER,
+                changed_count INTEGER,
+                field_counts TEXT,
+                columns_added TEXT,
+                columns_removed TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS changeset_rows (
+                changeset_id INTEGER NOT NULL,
+                customer_id TEXT NOT NULL,
+                change_type TEXT NOT NULL,
+                fields TEXT,
+                FOREIGN KEY (changeset_id) REFERENCES changesets(id)
+            )
+        ''')
+
+        # Indexes for snapshot joins and per-sales / per-package range scans
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sales_snapshots_snapshot ON sales_snapshots(snapshot_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sales_snapshots_name ON sales_snapshots(sales_name, snapshot_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_package_snapshots_snapshot ON package_snapshots(snapshot_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_package_snapshots_name ON package_snapshots(package_name, snapshot_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_snapshots_raw_base ON snapshots(raw_base_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_snapshots_upload_date ON snapshots(upload_date, timestamp)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_changeset_rows_changeset ON changeset_rows(changeset_id, customer_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_changesets_created ON changesets(created_at)')
+
+    @staticmethod
+    def _drop_unique_upload_date(cursor):
+        """Rebuild the snapshots table without UNIQUE(upload_date), keeping ids"""
+        columns = ', '.join(SNAPSHOT_COLUMNS + ['raw_data', 'raw_base_id'])
+        cursor.execute('DROP TABLE IF EXISTS snapshots_new')
+        cursor.execute(SNAPSHOTS_TABLE_DDL.format(table='snapshots_new'))
+        cursor.execute(f'INSERT INTO snapshots_new ({columns}) SELECT {columns} FROM snapshots')
+        cursor.execute('DROP TABLE snapshots')
+        cursor.execute('ALTER TABLE snapshots_new RENAME TO snapshots')
+        print("✓ Migrated snapshots table to one row per upload")
+
+    def _load_raw(self, conn, snapshot_id, cache=None):
+        """Decode raw_data of one snapshot, following its delta base if any (optionally memoized in cache)"""
+        if cache is not None and snapshot_id in cache:
+            return cache[snapshot_id]
+        row = conn.execute('SELECT raw_data, raw_base_id FROM snapshots WHERE id = ?', (snapshot_id,)).fetchone()
+        if row is None:
+            return None
+        data = decode_raw_data(row['raw_data'], lambda: self._load_raw(conn, row['raw_base_id'], cache))
+        if cache is not None:
+            cache[snapshot_id] = data
+        return data
+
+    def _encode_raw(self, conn, data, exclude_ids=()):
+        """
+        Encode raw_data for a new snapshot
+        Deltas are taken against the latest full (keyframe) snapshot; a new keyframe
+        is written every HISTORY_RAW_KEYFRAME_INTERVAL snapshots or when no base exists
+
+        Returns:
+            tuple: (blob, raw_base_id or None)
+        """
+        full_blob = encode_raw_data(data)
+        if not HISTORY_RAW_DELTA:
+            return full_blob, None
+
+        placeholders = ', '.join('?' for _ in exclude_ids)
+        keyframe = conn.execute(f'''
+            SELECT id FROM snapshots
+            WHERE raw_base_id IS NULL AND raw_data IS NOT NULL AND id NOT IN ({placeholders})
+            ORDER BY id DESC LIMIT 1
+        ''', tuple(exclude_ids)).fetchone()
+        if keyframe is None:
+            return full_blob, None
+
+        delta_count = conn.execute('SELECT COUNT(*) FROM snapshots WHERE raw_base_id = ?', (keyframe['id'],)).fetchone()[0]
+        if delta_count >= HISTORY_RAW_KEYFRAME_INTERVAL:
+            return full_blob, None
+
+        base = self._load_raw(conn, keyframe['id'])
+        delta_blob = encode_raw_data(data, base)
+        if len(delta_blob) >= len(full_blob):
+            return full_blob, None
+        return delta_blob, keyframe['id']
+
+    def _rebase_dependents(self, conn, snapshot_ids):
+        """
+        Keep delta snapshots based on snapshot_ids decodable before those ids are deleted
+        The oldest surviving dependent of each deleted keyframe becomes the new keyframe and
+        the others are re-encoded as deltas against it, so pruning keeps delta storage
+        """
+        if not snapshot_ids:
+            return
+        placeholders = ', '.join('?' for _ in snapshot_ids)
+        dependents = conn.execute(
+            f'''SELECT id, raw_base_id FROM snapshots
+                WHERE raw_base_id IN ({placeholders}) AND id NOT IN ({placeholders})
+                ORDER BY raw_base_id, id''',
+            tuple(snapshot_ids) * 2
+        ).fetchall()
+
+        cache = {}
+        new_keyframes = {}   # deleted keyframe id -> (new keyframe id, its data)
+        for row in dependents:
+            data = self._load_raw(conn, row['id'], cache)
+            full_blob = encode_raw_data(data)
+            if row['raw_base_id'] not in new_keyframes:
+                new_keyframes[row['raw_base_id']] = (row['id'], data)
+                blob, base_id = full_blob, None
+            else:
+                base_id, base = new_keyframes[row['raw_base_id']]
+                blob = encode_raw_data(data, base)
+                if len(blob) >= len(full_blob):
+                    blob, base_id = full_blob, None
+            conn.execute('UPDATE snapshots SET raw_data = ?, raw_base_id = ? WHERE id = ?', (blob, base_id, row['id']))
+
+    def _decode_rows(self, conn, rows):
+        """Turn snapshot rows into dicts, decoding raw_data back to JSON text when selected"""
+        data = []
+        base_cache = {}
+        for row in rows:
+            item = dict(row)
+            if 'raw_data' in item:
+                raw = decode_raw_data(item['raw_data'], lambda: self._load_raw(conn, item['raw_base_id'], base_cache))
+                item['raw_data'] = json.dumps(raw) if raw is not None else None
+                item.pop('raw_base_id', None)
+            data.append(item)
+        return data
 
-    def save_snapshot(self, overview_stats, upload_date=None):
+    def save_snapshot(self, overview_stats, upload_date=None, sales_data=None, package_data=None):
         """
         Save a snapshot of current overview stats
+        Every upload is kept as its own row; several uploads per day are rolled up by compact()
+        Main snapshot, sales metrics and package metrics commit in one transaction
 
         Args:
             overview_stats: Dict containing overview data from /api/overview
             upload_date: Optional date to use (default: today)
+            sales_data: Optional list of dicts with sales metrics
+            package_data: Optional list of dicts with package metrics
 
         Returns:
             snapshot_id if successful, None otherwise
@@ -99,9 +505,6 @@ class HistoryManager:
                 if isinstance(upload_date, datetime):
                     upload_date = upload_date.strftime('%Y-%m-%d')
 
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
             # Extract main metrics
             stats = overview_stats.get('stats', {})
             quality = overview_stats.get('quality_checks', {})
@@ -128,44 +531,52 @@ class HistoryManager:
             active_sales = stats.get('active_sales', 0)
             total_psb = stats.get('total_psb_count', 0)
 
-            # Insert main snapshot
-            cursor.execute('''
-                INSERT OR REPLACE INTO snapshots (
-                    timestamp, upload_date,
-                    total_customers, active_customers, inactive_customers,
-                    total_revenue, avg_revenue_per_customer, total_packages,
-                    quality_issues_count, missing_ktp_count, invalid_phone_count, missing_coords_count,
-                    top_package, top_package_count, top_location, top_location_revenue,
-                    active_sales_count, total_psb_count, raw_data
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                datetime.now().isoformat(),
-                upload_date,
-                total_customers,
-                active_customers,
-                inactive_customers,
-                total_revenue,
-                avg_revenue,
-                stats.get('total_packages', 0),
-                quality_issues,
-                missing_ktp,
-                invalid_phone,
-                missing_coords,
-                top_package,
-                top_package_count,
-                top_location,
-                top_location_revenue,
-                active_sales,
-                total_psb,
-                json.dumps(overview_stats)
-            ))
-
-            snapshot_id = cursor.lastrowid
-
-            conn.commit()
-            conn.close()
+            with self._connection() as conn, conn:
+                raw_blob, raw_base_id = self._encode_raw(conn, overview_stats)
+
+                # Insert main snapshot
+                cursor = conn.execute('''
+                    INSERT INTO snapshots (
+                        timestamp, upload_date,
+                        total_customers, active_customers, inactive_customers,
+                        total_revenue, avg_revenue_per_customer, total_packages,
+                        quality_issues_count, missing_ktp_count, invalid_phone_count, missing_coords_count,
+                        top_package, top_package_count, top_location, top_location_revenue,
+                        active_sales_count, total_psb_count, raw_data, raw_base_id
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    datetime.now().isoformat(),
+                    upload_date,
+                    total_customers,
+                    active_customers,
+                    inactive_customers,
+                    total_revenue,
+                    avg_revenue,
+                    stats.get('total_packages', 0),
+                    quality_issues,
+                    missing_ktp,
+                    invalid_phone,
+                    missing_coords,
+                    top_package,
+                    top_package_count,
+                    top_location,
+                    top_location_revenue,
+                    active_sales,
+                    total_psb,
+                    raw_blob,
+                    raw_base_id
+                ))
+
+                snapshot_id = cursor.lastrowid
+
+                # Insert per-sales and per-package metrics
+                if sales_data:
+                    self._insert_sales_rows(conn, snapshot_id, sales_data)
+                if package_data:
+                    self._insert_package_rows(conn, snapshot_id, package_data)
 
             print(f"✓ Snapshot saved (ID: {snapshot_id}, Date: {upload_date})")
+            self._compaction_requested.set()
             return snapshot_id
 
         except Exception as e:
@@ -174,6 +585,36 @@ class HistoryManager:
             print(traceback.format_exc())
             return None
 
+    @staticmethod
+    def _metric_rows(snapshot_id, items):
+        """Build (snapshot_id, name, customer_count, revenue, avg_revenue) tuples for executemany"""
+        return [
+            (
+                snapshot_id,
+                item.get('name'),
+                item.get('customer_count', 0),
+                item.get('revenue', 0),
+                item.get('avg_revenue', 0)
+            )
+            for item in items
+        ]
+
+    def _insert_sales_rows(self, conn, snapshot_id, sales_data):
+        """Insert all sales metrics of a snapshot in one executemany (caller owns the transaction)"""
+        conn.executemany('''
+            INSERT INTO sales_snapshots (
+                snapshot_id, sales_name, customer_count, revenue, avg_revenue
+            ) VALUES (?, ?, ?, ?, ?)
+        ''', self._metric_rows(snapshot_id, sales_data))
+
+    def _insert_package_rows(self, conn, snapshot_id, package_data):
+        """Insert all package metrics of a snapshot in one executemany (caller owns the transaction)"""
+        conn.executemany('''
+            INSERT INTO package_snapshots (
+                snapshot_id, package_name, customer_count, revenue, avg_revenue
+            ) VALUES (?, ?, ?, ?, ?)
+        ''', self._metric_rows(snapshot_id, package_data))
+
     def save_sales_snapshot(self, snapshot_id, sales_data):
         """
         Save sales metrics for a snapshot
@@ -183,84 +624,44 @@ class HistoryManager:
             sales_data: List of dicts with sales metrics
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            for sales in sales_data:
-                cursor.execute('''
-                    INSERT INTO sales_snapshots (
-                        snapshot_id, sales_name, customer_count, revenue, avg_revenue
-                    ) VALUES (?, ?, ?, ?, ?)
-                ''', (
-                    snapshot_id,
-                    sales.get('name'),
-                    sales.get('customer_count', 0),
-                    sales.get('revenue', 0),
-                    sales.get('avg_revenue', 0)
-                ))
-
-            conn.commit()
-            conn.close()
+            with self._connection() as conn, conn:
+                self._insert_sales_rows(conn, snapshot_id, sales_data)
         except Exception as e:
             print(f"Error saving sales snapshot: {str(e)}")
 
     def save_package_snapshot(self, snapshot_id, package_data):
         """Save package metrics for a snapshot"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            for package in package_data:
-                cursor.execute('''
-                    INSERT INTO package_snapshots (
-                        snapshot_id, package_name, customer_count, revenue, avg_revenue
-                    ) VALUES (?, ?, ?, ?, ?)
-                ''', (
-                    snapshot_id,
-                    package.get('name'),
-                    package.get('customer_count', 0),
-                    package.get('revenue', 0),
-                    package.get('avg_revenue', 0)
-                ))
-
-            conn.commit()
-            conn.close()
+            with self._connection() as conn, conn:
+                self._insert_package_rows(conn, snapshot_id, package_data)
         except Exception as e:
             print(f"Error saving package snapshot: {str(e)}")
 
-    def get_history(self, limit=50):
-        """Get all snapshots sorted by date (newest first)"""
+    def get_history(self, limit=50, include_raw=False):
+        """Get all snapshots sorted by date and upload time (newest first), raw_data only if include_raw"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                SELECT * FROM snapshots
-                ORDER BY upload_date DESC
-                LIMIT ?
-            ''', (limit,))
-
-            rows = cursor.fetchall()
-            conn.close()
-
-            return [dict(row) for row in rows]
+            with self._connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT {snapshot_select(include_raw)} FROM snapshots
+                    ORDER BY upload_date DESC, timestamp DESC
+                    LIMIT ?
+                ''', (limit,)).fetchall()
+                return self._decode_rows(conn, rows)
         except Exception as e:
             print(f"Error getting history: {str(e)}")
             return []
 
-    def get_snapshot_by_date(self, date_str):
-        """Get specific snapshot by date (YYYY-MM-DD format)"""
+    def get_snapshot_by_date(self, date_str, include_raw=True):
+        """Get the latest snapshot of a date (YYYY-MM-DD format)"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-
-            cursor.execute('SELECT * FROM snapshots WHERE upload_date = ?', (date_str,))
-            row = cursor.fetchone()
-            conn.close()
-
-            return dict(row) if row else None
+            with self._connection() as conn:
+                row = conn.execute(f'''
+                    SELECT {snapshot_select(include_raw)} FROM snapshots
+                    WHERE upload_date = ?
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT 1
+                ''', (date_str,)).fetchone()
+                return self._decode_rows(conn, [row])[0] if row else None
         except Exception as e:
             print(f"Error getting snapshot: {str(e)}")
             return None
@@ -276,8 +677,8 @@ class HistoryManager:
         Returns:
             Dict with comparison data and changes
         """
-        snap1 = self.get_snapshot_by_date(date1)
-        snap2 = self.get_snapshot_by_date(date2)
+        snap1 = self.get_snapshot_by_date(date1, include_raw=False)
+        snap2 = self.get_snapshot_by_date(date2, include_raw=False)
 
         if not snap1 or not snap2:
             return {'error': 'One or both snapshots not found'}
@@ -324,79 +725,500 @@ class HistoryManager:
 
         return comparison
 
-    def get_trend(self, days=30):
+    @staticmethod
+    def trend_resolution(days):
+        """Pick the trend resolution ('raw', 'day', 'week' or 'month') for a window of N days"""
+        for max_days, resolution in HISTORY_TREND_RESOLUTIONS:
+            if days <= max_days:
+                return resolution
+        return HISTORY_TREND_DEFAULT_RESOLUTION
+
+    def get_trend(self, days=30, include_raw=False, start_date=None, end_date=None, bucket=None, metrics=None):
         """
-        Get trend data for last N days
+        Get trend data for a date window, bucketed per upload or per day / week / month
+        Deltas against the previous bucket are computed in SQL with LAG(). Buckets come from
+        the rollups, periods with uploads not yet compacted are computed from the raw snapshots
+
+        Args:
+            days: Window length when start_date is not given (counted back from end_date)
+            include_raw: Also return raw_data of each bucket's closing snapshot
+            start_date: Optional window start (YYYY-MM-DD)
+            end_date: Optional window end (YYYY-MM-DD, default: today)
+            bucket: 'raw', 'day', 'week', 'month' or None/'auto' to pick by window length
+            metrics: Optional list of metric columns to return (default: all)
 
         Returns:
-            List of snapshots with calculated trends
+            List of buckets with the requested metrics and their *_trend deltas
         """
-        try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
+        metrics = list(metrics) if metrics else list(ROLLUP_METRIC_COLUMNS)
+        unknown = [metric for metric in metrics if metric not in ROLLUP_METRIC_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown trend metrics: {', '.join(unknown)}")
+        if bucket not in (None, 'auto', 'raw') and bucket not in ROLLUP_PERIODS:
+            raise ValueError(f"Unknown trend bucket: {bucket}")
+        for value in (start_date, end_date):
+            if value is not None:
+                datetime.strptime(value, '%Y-%m-%d')
 
-            cursor.execute('''
-                SELECT * FROM snapshots
-                ORDER BY upload_date ASC
-                LIMIT ?
-            ''', (days,))
+        if end_date is None:
+            end_date = datetime.now().strftime('%Y-%m-%d')
 
-            rows = cursor.fetchall()
-            conn.close()
+        try:
+            with self._connection() as conn:
+                if start_date is None:
+                    start_date = conn.execute(
+                        'SELECT date(?, ?)', (end_date, f'-{max(days - 1, 0)} days')
+                    ).fetchone()[0]
+                window_days = conn.execute(
+                    'SELECT CAST(julianday(?) - julianday(?) AS INTEGER) + 1', (end_date, start_date)
+                ).fetchone()[0]
 
-            data = [dict(row) for row in rows]
+            resolution = self.trend_resolution(window_days) if bucket in (None, 'auto') else bucket
 
-            # Calculate trends
-            for i, item in enumerate(data):
-                if i > 0:
-                    prev = data[i-1]
-                    item['customer_trend'] = item['total_customers'] - prev['total_customers']
-                    item['revenue_trend'] = item['total_revenue'] - prev['total_revenue']
-                else:
-                    item['customer_trend'] = 0
-                    item['revenue_trend'] = 0
+            if resolution == 'raw':
+                source = f'''
+                    SELECT id, timestamp, upload_date, 'raw' AS resolution, 1 AS snapshot_count,
+                           {', '.join(metrics)}{', raw_data, raw_base_id' if include_raw else ''}
+                    FROM snapshots
+                    WHERE upload_date BETWEEN ? AND ?
+                '''
+                params = (start_date, end_date)
+                order = 'upload_date, timestamp, id'
+            else:
+                # Rollups of compacted periods, closing snapshots of the periods still pending
+                period = ROLLUP_PERIODS[resolution]
+                rollup_columns = (f"period_start, snapshot_count, last_timestamp, last_snapshot_id, "
+                                  f"{', '.join(metrics)}")
+                buckets = f'''
+                    SELECT {rollup_columns} FROM snapshot_rollups
+                    WHERE resolution = ? AND period_start BETWEEN {period.format('?')} AND ?
+                      AND period_start < COALESCE({period.format(UNCOMPACTED_SINCE_SQL)}, '9999-12-31')
+                    UNION ALL
+                    SELECT {rollup_columns} FROM ({self._period_closing_sql(resolution, UNCOMPACTED_SINCE_SQL)})
+                    WHERE period_start BETWEEN {period.format('?')} AND ?
+                '''
+                params = (resolution, start_date, end_date, start_date, end_date)
+
+                raw_columns = ', s.raw_data, s.raw_base_id' if include_raw else ''
+                raw_join = 'LEFT JOIN snapshots s ON s.id = b.last_snapshot_id' if include_raw else ''
+                source = f'''
+                    SELECT b.last_snapshot_id AS id, b.last_timestamp AS timestamp,
+                           b.period_start AS upload_date, '{resolution}' AS resolution, b.snapshot_count,
+                           {', '.join(f'b.{metric}' for metric in metrics)}{raw_columns}
+                    FROM ({buckets}) b {raw_join}
+                '''
+                order = 'upload_date'
 
-            return data
+            deltas = ''.join(
+                f', COALESCE({metric} - LAG({metric}) OVER trend_window, 0) AS {trend_column(metric)}'
+                for metric in metrics if metric not in TREND_TEXT_METRICS
+            )
+            with self._connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT *{deltas}
+                    FROM ({source})
+                    WINDOW trend_window AS (ORDER BY {order})
+                    ORDER BY {order}
+                ''', params).fetchall()
+                return self._decode_rows(conn, rows)
         except Exception as e:
             print(f"Error getting trend: {str(e)}")
             return []
 
+    # ===== ROLLUP COMPACTION =====
+
+    @staticmethod
+    def _period_closing_sql(resolution, since='?'):
+        """
+        SELECT of the rollup row (closing snapshot values) of every period of one resolution,
+        computed from the snapshots, for the periods from the one containing since on
+        (a ? parameter by default, or an SQL expression)
+        """
+        period = ROLLUP_PERIODS[resolution]
+        metric_columns = ', '.join(ROLLUP_METRIC_COLUMNS)
+        return f'''
+            SELECT period_start, snapshot_count, first_timestamp, timestamp AS last_timestamp,
+                   id AS last_snapshot_id, {metric_columns}
+            FROM (
+                SELECT *,
+                       {period.format('upload_date')} AS period_start,
+                       ROW_NUMBER() OVER period_window AS rank_in_period,
+                       COUNT(*) OVER (PARTITION BY {period.format('upload_date')}) AS snapshot_count,
+                       MIN(timestamp) OVER (PARTITION BY {period.format('upload_date')}) AS first_timestamp
+                FROM snapshots
+                WHERE upload_date >= {period.format(since)}
+                WINDOW period_window AS (
+                    PARTITION BY {period.format('upload_date')} ORDER BY timestamp DESC, id DESC
+                )
+            )
+            WHERE rank_in_period = 1
+        '''
+
+    def _rollup(self, conn, resolution, since):
+        """Recompute rollups of one resolution for every period from the one containing since"""
+        metric_columns = ', '.join(ROLLUP_METRIC_COLUMNS)
+        cursor = conn.execute(f'''
+            INSERT OR REPLACE INTO snapshot_rollups (
+                resolution, period_start, snapshot_count, first_timestamp, last_timestamp,
+                last_snapshot_id, {metric_columns}
+            )
+            SELECT ?, * FROM ({self._period_closing_sql(resolution)})
+        ''', (resolution, since))
+        return cursor.rowcount
+
+    def _trim_rollups(self, conn):
+        """
+        Bring rollups in line after the oldest snapshots were deleted: rollups of periods with
+        no snapshot left are dropped, the period holding the oldest kept snapshot is recomputed
+        """
+        since = conn.execute('SELECT MIN(upload_date) FROM snapshots').fetchone()[0]
+        if since is None:
+            conn.execute('DELETE FROM snapshot_rollups')
+            return
+
+        metric_columns = ', '.join(ROLLUP_METRIC_COLUMNS)
+        for resolution, period in ROLLUP_PERIODS.items():
+            conn.execute(
+                f'DELETE FROM snapshot_rollups WHERE resolution = ? AND period_start <= {period.format("?")}',
+                (resolution, since)
+            )
+            conn.execute(f'''
+                INSERT INTO snapshot_rollups (
+                    resolution, period_start, snapshot_count, first_timestamp, last_timestamp,
+                    last_snapshot_id, {metric_columns}
+                )
+                SELECT ?, * FROM ({self._period_closing_sql(resolution)})
+                WHERE period_start = {period.format('?')}
+            ''', (resolution, since, since))
+
+    def _prune_intraday(self, conn):
+        """Delete all but the last snapshot of each day older than HISTORY_INTRADAY_RETENTION_DAYS"""
+        if not HISTORY_INTRADAY_RETENTION_DAYS:
+            return 0
+        cutoff = (datetime.now() - timedelta(days=HISTORY_INTRADAY_RETENTION_DAYS)).strftime('%Y-%m-%d')
+        pruned_ids = [row['id'] for row in conn.execute('''
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY upload_date ORDER BY timestamp DESC, id DESC
+                ) AS rank_in_day
+                FROM snapshots
+                WHERE upload_date < ?
+            )
+            WHERE rank_in_day > 1
+        ''', (cutoff,)).fetchall()]
+        if not pruned_ids:
+            return 0
+
+        # Keep surviving deltas decodable, then delete detail rows and the pruned snapshots
+        self._rebase_dependents(conn, pruned_ids)
+        placeholders = ', '.join('?' for _ in pruned_ids)
+        for detail_table in ('sales_snapshots', 'package_snapshots'):
+            conn.execute(f'DELETE FROM {detail_table} WHERE snapshot_id IN ({placeholders})', pruned_ids)
+        conn.execute(f'DELETE FROM snapshots WHERE id IN ({placeholders})', pruned_ids)
+        return len(pruned_ids)
+
+    def compact(self):
+        """
+        Roll new snapshots up into daily, weekly and monthly aggregates
+        Only periods touched by snapshots saved since the last run are recomputed;
+        each rollup holds the closing (last upload) values of its period
+
+        Returns:
+            dict - {'rollups': rows written, 'pruned': intraday snapshots deleted}
+        """
+        with self._compaction_lock:
+            try:
+                with self._connection() as conn, conn:
+                    watermark = conn.execute(
+                        "SELECT CAST(value AS INTEGER) FROM history_meta WHERE key = 'rollup_snapshot_id'"
+                    ).fetchone()
+                    watermark = watermark[0] if watermark else 0
+                    new_since, new_max_id = conn.execute(
+                        'SELECT MIN(upload_date), MAX(id) FROM snapshots WHERE id > ?', (watermark,)
+                    ).fetchone()
+
+                    rollups = 0
+                    if new_since is not None:
+                        for resolution in ROLLUP_PERIODS:
+                            rollups += self._rollup(conn, resolution, new_since)
+                        conn.execute(
+                            "INSERT OR REPLACE INTO history_meta (key, value) VALUES ('rollup_snapshot_id', ?)",
+                            (str(new_max_id),)
+                        )
+                    pruned = self._prune_intraday(conn)
+
+                if rollups or pruned:
+                    print(f"✓ History compacted ({rollups} rollups updated, {pruned} intraday snapshots pruned)")
+                return {'rollups': rollups, 'pruned': pruned}
+            except Exception as e:
+                print(f"Error compacting history: {str(e)}")
+                return {'rollups': 0, 'pruned': 0}
+
+    def start_compactor(self, interval=HISTORY_COMPACTION_INTERVAL):
+        """Start the background compaction thread (runs every interval seconds and after each upload)"""
+        if self._compactor is not None:
+            return
+
+        def run():
+            while True:
+                self._compaction_requested.wait(interval)
+                self._compaction_requested.clear()
+                self.compact()
+
+        self._compactor = threading.Thread(target=run, name='history-compactor', daemon=True)
+        self._compactor.start()
+
+    def _detail_history(self, table, name_column, name, start_date=None, end_date=None):
+        """
+        Per-upload metrics of one sales agent or package, oldest first
+        Reads through the (name, snapshot_id) index, deltas are computed with LAG()
+        """
+        for value in (start_date, end_date):
+            if value is not None:
+                datetime.strptime(value, '%Y-%m-%d')
+
+        try:
+            with self._connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT s.id AS snapshot_id, s.timestamp, s.upload_date,
+                           d.customer_count, d.revenue, d.avg_revenue,
+                           COALESCE(d.customer_count - LAG(d.customer_count) OVER trend_window, 0) AS customer_trend,
+                           COALESCE(d.revenue - LAG(d.revenue) OVER trend_window, 0) AS revenue_trend
+                    FROM {table} d
+                    JOIN snapshots s ON s.id = d.snapshot_id
+                    WHERE d.{name_column} = ?
+                      AND s.upload_date BETWEEN COALESCE(?, '0000-00-00') AND COALESCE(?, '9999-12-31')
+                    WINDOW trend_window AS (ORDER BY s.upload_date, s.timestamp, s.id)
+                    ORDER BY s.upload_date, s.timestamp, s.id
+                ''', (name, start_date, end_date)).fetchall()
+                return [dict(row) for row in rows]
+        except Exception as e:
+            print(f"Error getting {table} history: {str(e)}")
+            return []
+
+    def get_sales_history(self, sales_name, start_date=None, end_date=None):
+        """
+        Get customer count and revenue of one sales agent on each upload
+
+        Args:
+            sales_name: Nama Sales
+            start_date: Optional window start (YYYY-MM-DD)
+            end_date: Optional window end (YYYY-MM-DD)
+        """
+        return self._detail_history('sales_snapshots', 'sales_name', sales_name, start_date, end_date)
+
+    def get_package_history(self, package_name, start_date=None, end_date=None):
+        """Get customer count and revenue of one package on each upload"""
+        return self._detail_history('package_snapshots', 'package_name', package_name, start_date, end_date)
+
+    def find_ingested_upload(self, upload_key):
+        """
+        Get the recorded result of an upload with the same content hash
+
+        Args:
+            upload_key: Hash from utils.content_hash.hash_upload
+
+        Returns:
+            dict (file_hashes and stats decoded) or None
+        """
+        try:
+            with self._connection() as conn:
+                row = conn.execute(
+                    'SELECT * FROM ingested_uploads WHERE upload_key = ?', (upload_key,)
+                ).fetchone()
+            if row is None:
+                return None
+            record = dict(row)
+            record['file_hashes'] = json.loads(record['file_hashes'])
+            record['stats'] = json.loads(record['stats'])
+            return record
+        except Exception as e:
+            print(f"Error reading ingested upload: {str(e)}")
+            return None
+
+    def record_ingested_upload(self, upload_key, mode, file_hashes, dataset_hash, stats, message, snapshot_id=None):
+        """
+        Remember an ingested upload and the dataset it produced
+        Only the newest HISTORY_UPLOAD_HASH_RETENTION uploads are kept
+
+        Args:
+            upload_key: Hash from utils.content_hash.hash_upload
+            mode: Upload mode
+            file_hashes: Content hash of each uploaded file
+            dataset_hash: Content hash of the main data file after the upload
+            stats: Merge stats returned to the client
+            message: Result message
+            snapshot_id: History snapshot saved for the upload
+        """
+        try:
+            with self._connection() as conn, conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO ingested_uploads (
+                        upload_key, mode, file_hashes, dataset_hash, stats, message, snapshot_id, ingested_at
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    upload_key, mode, json.dumps(file_hashes), dataset_hash,
+                    json.dumps(stats, default=str), message, snapshot_id, datetime.now().isoformat()
+                ))
+                conn.execute('''
+                    DELETE FROM ingested_uploads WHERE upload_key IN (
+                        SELECT upload_key FROM ingested_uploads
+                        ORDER BY ingested_at DESC
+                        LIMIT -1 OFFSET ?
+                    )
+                ''', (HISTORY_UPLOAD_HASH_RETENTION,))
+        except Exception as e:
+            print(f"Error recording ingested upload: {str(e)}")
+
+    def save_changeset(self, changes):
+        """
+        Store the row-level diff of one upload
+        Only the newest HISTORY_CHANGESET_RETENTION changesets are kept
+
+        Args:
+            changes: Result of utils.changes.diff_datasets
+
+        Returns:
+            changeset_id or None
+        """
+        try:
+            with self._connection() as conn, conn:
+                cursor = conn.execute('''
+                    INSERT INTO changesets (
+                        created_at, new_count, removed_count, changed_count,
+                        field_counts, columns_added, columns_removed
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    datetime.now().isoformat(), len(changes['new']), len(changes['removed']),
+                    len(changes['changed']), json.dumps(changes['field_counts']),
+                    json.dumps(changes['columns_added']), json.dumps(changes['columns_removed'])
+                ))
+                changeset_id = cursor.lastrowid
+
+                rows = [(changeset_id, str(key), 'new', None) for key in changes['new']]
+                rows += [(changeset_id, str(key), 'removed', None) for key in changes['removed']]
+                rows += [
+                    (changeset_id, str(key), 'changed', json.dumps(fields, ensure_ascii=False))
+                    for key, fields in changes['changed']
+                ]
+                conn.executemany(
+                    'INSERT INTO changeset_rows (changeset_id, customer_id, change_type, fields) VALUES (?, ?, ?, ?)',
+                    rows
+                )
+
+                old_ids_query = 'SELECT id FROM changesets ORDER BY id DESC LIMIT -1 OFFSET ?'
+                conn.execute(f'DELETE FROM changeset_rows WHERE changeset_id IN ({old_ids_query})',
+                             (HISTORY_CHANGESET_RETENTION,))
+                conn.execute(f'DELETE FROM changesets WHERE id IN ({old_ids_query})',
+                             (HISTORY_CHANGESET_RETENTION,))
+
+            print(f"✓ Changeset saved (ID: {changeset_id}, {len(rows)} rows)")
+            return changeset_id
+        except Exception as e:
+            print(f"Error saving changeset: {str(e)}")
+            return None
+
+    def get_changes(self, since=None, customer_id=None, change_type=None, limit=1000):
+        """
+        Get changesets created after a point in time, with their changed rows
+
+        Args:
+            since: ISO date or datetime (YYYY-MM-DD[THH:MM[:SS]]); None = latest changeset only
+            customer_id: Optional ID Pelanggan filter
+            change_type: Optional 'new' / 'removed' / 'changed' filter
+            limit: Max rows returned over all changesets (at least 1)
+
+        Returns:
+            tuple: (list of changesets oldest first, truncated: bool)
+
+        Raises:
+            ValueError: Invalid since, change_type or limit
+        """
+        if limit < 1:
+            raise ValueError(f"limit must be at least 1: {limit}")
+        if since is not None:
+            since = datetime.fromisoformat(since).isoformat()
+        if change_type is not None and change_type not in ('new', 'removed', 'changed'):
+            raise ValueError(f"Unknown change type: {change_type}")
+
+        with self._connection() as conn:
+            if since is None:
+                changesets = conn.execute('SELECT * FROM changesets ORDER BY id DESC LIMIT 1').fetchall()
+            else:
+                changesets = conn.execute(
+                    'SELECT * FROM changesets WHERE created_at > ? ORDER BY id', (since,)
+                ).fetchall()
+            changesets = [dict(row) for row in changesets]
+            if not changesets:
+                return [], False
+
+            by_id = {}
+            for changeset in changesets:
+                for column in ('field_counts', 'columns_added', 'columns_removed'):
+                    changeset[column] = json.loads(changeset[column])
+                changeset['changes'] = []
+                by_id[changeset['id']] = changeset
+
+            rows = conn.execute('''
+                SELECT changeset_id, customer_id, change_type, fields
+                FROM changeset_rows
+                WHERE changeset_id BETWEEN ? AND ?
+                  AND customer_id = COALESCE(?, customer_id)
+                  AND change_type = COALESCE(?, change_type)
+                ORDER BY changeset_id, rowid
+                LIMIT ?
+            ''', (min(by_id), max(by_id), customer_id, change_type, limit + 1)).fetchall()
+
+        for row in rows[:limit]:
+            by_id[row['changeset_id']]['changes'].append({
+                'customer_id': row['customer_id'],
+                'type': row['change_type'],
+                'fields': json.loads(row['fields']) if row['fields'] else None
+            })
+        return changesets, len(rows) > limit
+
     def delete_old_snapshots(self, keep_count=100):
         """Clean up old snapshots, keep only the most recent N"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            # Get total count
-            cursor.execute('SELECT COUNT(*) FROM snapshots')
-            total = cursor.fetchone()[0]
+            with self._connection() as conn, conn:
+                # Get total count
+                total = conn.execute('SELECT COUNT(*) FROM snapshots').fetchone()[0]
 
-            if total > keep_count:
-                # Delete old ones
-                cursor.execute('''
-                    DELETE FROM snapshots WHERE id IN (
+                deleted = 0
+                if total > keep_count:
+                    old_ids_query = '''
                         SELECT id FROM snapshots
-                        ORDER BY upload_date DESC
+                        ORDER BY upload_date DESC, timestamp DESC
                         LIMIT -1 OFFSET ?
-                    )
-                ''', (keep_count,))
+                    '''
 
-                deleted = cursor.rowcount
-                conn.commit()
-                print(f"✓ Deleted {deleted} old snapshots (kept {keep_count})")
+                    # Keep surviving deltas decodable, then delete detail rows and old snapshots
+                    old_ids = [row['id'] for row in conn.execute(old_ids_query, (keep_count,)).fetchall()]
+                    self._rebase_dependents(conn, old_ids)
+                    for detail_table in ('sales_snapshots', 'package_snapshots'):
+                        conn.execute(f'DELETE FROM {detail_table} WHERE snapshot_id IN ({old_ids_query})', (keep_count,))
+                    cursor = conn.execute(f'DELETE FROM snapshots WHERE id IN ({old_ids_query})', (keep_count,))
+                    deleted = cursor.rowcount
+                    # Bucketed trends must not keep counting the deleted snapshots
+                    self._trim_rollups(conn)
 
-            conn.close()
+            if deleted:
+                print(f"✓ Deleted {deleted} old snapshots (kept {keep_count})")
         except Exception as e:
             print(f"Error cleaning up snapshots: {str(e)}")
 
 
 # Singleton instance
 _history_manager = None
+_history_manager_lock = threading.Lock()
 
 def get_history_manager():
     """Get or create history manager instance"""
     global _history_manager
     if _history_manager is None:
-        _history_manager = HistoryManager()
+        with _history_manager_lock:
+            if _history_manager is None:
+                _history_manager = HistoryManager()
+                if HISTORY_COMPACTION_ENABLED:
+                    _history_manager.start_compactor()
     return _history_manager
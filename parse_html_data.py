@@ -1,33 +1,14 @@
 import pandas as pd
-from bs4 import BeautifulSoup
+from config import MAIN_DATA_FILE
+from utils.atomic_io import atomic_replace
+from utils.html_table import read_html_table
 
-# Read HTML file
-with open('data-wifi.xls', 'r', encoding='utf-8') as f:
-    html_content = f.read()
+# Stream the HTML table (the .xls export is HTML, not a workbook)
+df = read_html_table('data-wifi.xls', encoding='utf-8')
 
-# Parse HTML
-soup = BeautifulSoup(html_content, 'html.parser')
-table = soup.find('table')
-
-# Extract headers
-headers = []
-for th in table.find('thead').find_all('th'):
-    headers.append(th.text.strip())
-
-# Extract data rows
-data = []
-for tr in table.find('tbody').find_all('tr'):
-    row = []
-    for td in tr.find_all('td'):
-        row.append(td.text.strip())
-    if row:
-        data.append(row)
-
-# Create DataFrame
-df = pd.DataFrame(data, columns=headers)
-
-# Save to CSV for easier processing
-df.to_csv('data-wifi-clean.csv', index=False, encoding='utf-8-sig')
+# Save to CSV for easier processing (published atomically, the dashboard may be reading it)
+with atomic_replace(MAIN_DATA_FILE) as tmp_path:
+    df.to_csv(tmp_path, index=False, encoding='utf-8-sig')
 
 print("=" * 80)
 print("DATA BERHASIL DIPARSE!")
@@ -63,4 +44,4 @@ if 'Nama Langganan' in df.columns:
     print("\nNama Paket Langganan:")
     print(df['Nama Langganan'].value_counts())
 
-print("\n✓ File CSV bersih telah disimpan: data-wifi-clean.csv")
+print(f"\n✓ File CSV bersih telah disimpan: {MAIN_DATA_FILE}")
@@ -0,0 +1,32 @@
+import os
+import sys
+import pytest
+
+# Tests import the app modules from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app_dir(tmp_path_factory):
+    """
+    Working directory for tests that go through app.py
+    Data file, uploads, backups and history.db are relative paths (and the managers are
+    singletons), so the whole session runs in one scratch directory
+    """
+    path = tmp_path_factory.mktemp('app')
+    (path / 'uploads').mkdir()
+    (path / 'sop_rules.json').write_text('{}', encoding='utf-8')
+    cwd = os.getcwd()
+    os.chdir(path)
+    yield path
+    os.chdir(cwd)
+
+
+@pytest.fixture
+def app_module(app_dir):
+    """app.py imported with the scratch directory as working directory, without a data file"""
+    import app
+    for name in os.listdir(app_dir):
+        if name.startswith('data-wifi-clean.csv'):
+            os.remove(app_dir / name)
+    return app
@@ -0,0 +1,58 @@
+"""
+Tests for atomic publication of data files (utils/atomic_io.py)
+"""
+import os
+import pytest
+from utils import atomic_io
+from utils.atomic_io import atomic_replace, read_data_marker
+
+
+@pytest.fixture
+def flaky_replace(monkeypatch):
+    """os.replace failing like Windows does while a reader has the target open"""
+    real_replace = os.replace
+    state = {'failures': 0, 'calls': 0}
+
+    def replace(source_path, target_path):
+        state['calls'] += 1
+        if state['failures'] > 0:
+            state['failures'] -= 1
+            raise PermissionError(13, 'The process cannot access the file', target_path)
+        real_replace(source_path, target_path)
+
+    monkeypatch.setattr(atomic_io.os, 'replace', replace)
+    monkeypatch.setattr(atomic_io, 'PUBLISH_REPLACE_RETRY_DELAY', 0)
+    return state
+
+
+def publish(path, text):
+    with atomic_replace(str(path)) as tmp_path:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+
+def test_publish_retries_while_target_is_in_use(tmp_path, flaky_replace):
+    target = tmp_path / 'data.csv'
+    publish(target, 'old\n')
+
+    flaky_replace['failures'] = 3
+    publish(target, 'new\n')
+
+    assert target.read_text(encoding='utf-8') == 'new\n'
+    assert read_data_marker(str(target))['version'] == 2
+    assert sorted(os.listdir(tmp_path)) == ['data.csv', 'data.csv.version']
+
+
+def test_publish_gives_up_after_the_retries(tmp_path, flaky_replace):
+    target = tmp_path / 'data.csv'
+    publish(target, 'old\n')
+
+    flaky_replace['failures'] = atomic_io.PUBLISH_REPLACE_RETRIES
+    flaky_replace['calls'] = 0
+    with pytest.raises(PermissionError):
+        publish(target, 'new\n')
+
+    assert flaky_replace['calls'] == atomic_io.PUBLISH_REPLACE_RETRIES
+    assert target.read_text(encoding='utf-8') == 'old\n'
+    assert read_data_marker(str(target))['version'] == 1
+    assert sorted(os.listdir(tmp_path)) == ['data.csv', 'data.csv.version']
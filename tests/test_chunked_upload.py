@@ -0,0 +1,52 @@
+"""
+Tests for uploads larger than the in-memory limit (chunked ingestion, user-049)
+"""
+import io
+import pytest
+
+ROWS = 60000
+DUPLICATES = 500
+
+
+@pytest.fixture(scope='module')
+def big_csv():
+    """CSV export above the old 16 MB request limit, with duplicated IDs at the end"""
+    lines = ['ID Pelanggan,Nama Pelanggan,Alamat,Tlp,Foto KTP,Nama Langganan,Harga,'
+             'Status Langganan,Nama Lokasi,Nama Sales,Tanggal Registrasi']
+    filler = 'Jl. ' + 'x' * 200
+    for i in list(range(ROWS)) + list(range(DUPLICATES)):
+        status = 'On' if i % 3 else 'Off'
+        lines.append(f'CID{i:07d},Pelanggan {i},{filler} {i},0812{i:08d},http://ktp/{i}.jpg,'
+                     f'Paket {i % 4}M,"Rp. {100 + i % 4 * 50}.000",{status},Loc {i % 7},Sales {i % 5},2024-01-{i % 28 + 1:02d}')
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def test_upload_above_old_request_limit_is_ingested_in_batches(app_module, big_csv):
+    assert len(big_csv) > 16 * 1024 * 1024
+    client = app_module.app.test_client()
+
+    response = client.post('/api/upload?wait=true', data={
+        'files': (io.BytesIO(big_csv), 'data-wifi.csv')
+    }, content_type='multipart/form-data')
+
+    body = response.get_json()
+    assert response.status_code == 200, body
+    stats = body['stats']
+    assert stats['chunked'] is True
+    assert stats['final_rows'] == ROWS
+    assert stats['duplicates_removed'] == DUPLICATES
+
+    snapshot = app_module.get_history_manager().get_history(limit=1)[0]
+    assert snapshot['total_customers'] == ROWS
+    assert snapshot['active_customers'] == sum(1 for i in range(ROWS) if i % 3)
+
+
+def test_large_upsert_is_still_limited(app_module, big_csv):
+    client = app_module.app.test_client()
+
+    response = client.post('/api/upload?wait=true&mode=upsert', data={
+        'files': (io.BytesIO(big_csv), 'data-wifi.csv')
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 413
+    assert response.get_json()['success'] is False
@@ -0,0 +1,27 @@
+"""
+Tests for the churn risk scoring kernel (utils/churn.py)
+"""
+import pandas as pd
+from utils.churn import score_churn_risk
+from utils.date_utils import get_days_since, parse_date_flexible
+
+NOW = pd.Timestamp('2024-06-10 15:30')
+
+
+def test_days_since_payment_counts_from_the_current_time():
+    payments = ['2024-06-10', '2024-05-11', '2024-05-10', '2024-05-10 12:00', '']
+    df = pd.DataFrame({
+        'Tanggal Registrasi': ['2023-01-01'] * len(payments),
+        'Pembayaran Terakhir': payments,
+        'Status Langganan': ['On'] * len(payments),
+    })
+
+    scored = score_churn_risk(df, NOW)
+
+    # Same day counts as the per-row get_days_since the endpoints used before
+    assert scored['Days_Since_Payment'].tolist()[:-1] == [
+        get_days_since(parse_date_flexible(value), NOW) for value in payments[:-1]
+    ]
+    assert scored['Days_Since_Payment'].tolist() == [0, 30, 31, 31, 999]
+    # 30 days is not overdue yet, 31 days is (> 30 = +10, loyal customer -5)
+    assert scored['Churn_Risk_Score'].tolist() == [0, 0, 5, 5, 35]
@@ -0,0 +1,36 @@
+"""
+Tests for the churn score export (/api/churn-scores)
+"""
+import csv
+import io
+import json
+
+
+def write_data(app_dir, rows):
+    header = ['ID Pelanggan', 'Nama Pelanggan', 'Status Langganan', 'Tanggal Registrasi', 'Pembayaran Terakhir']
+    with open(app_dir / 'data-wifi-clean.csv', 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+NUMERIC_IDS_WITH_GAP = [
+    ['12345', 'Andi', 'On', '2024-01-05', '2024-06-01'],
+    ['', 'Budi', 'Off', '2024-02-10', ''],
+    ['00789', 'Cici', 'On', '2023-03-15', '2024-05-20'],
+]
+
+
+def test_numeric_ids_with_a_gap_export_as_in_source(app_module, app_dir):
+    write_data(app_dir, NUMERIC_IDS_WITH_GAP)
+    client = app_module.app.test_client()
+
+    response = client.get('/api/churn-scores')
+    assert response.status_code == 200
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [record['id_pelanggan'] for record in records] == ['12345', '', '00789']
+
+    response = client.get('/api/churn-scores?format=csv')
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['id_pelanggan'] for row in rows] == ['12345', '', '00789']
@@ -0,0 +1,60 @@
+"""
+Tests for history snapshots and rollups (history_manager.py)
+"""
+from datetime import datetime, timedelta
+import pytest
+import history_manager
+from history_manager import HistoryManager
+
+DAYS = 60
+UPLOADS_PER_DAY = 2
+
+
+def uploads():
+    """(upload_date, overview_stats) of two uploads a day over the last DAYS days, oldest first"""
+    today = datetime.now()
+    result = []
+    for day in range(DAYS - 1, -1, -1):
+        upload_date = (today - timedelta(days=day)).strftime('%Y-%m-%d')
+        for _ in range(UPLOADS_PER_DAY):
+            index = len(result)
+            result.append((upload_date, {'stats': {'total_customers': 1000 + index, 'active_customers': index}}))
+    return result
+
+
+def saved(tmp_path, name, snapshots):
+    manager = HistoryManager(str(tmp_path / name))
+    for upload_date, stats in snapshots:
+        assert manager.save_snapshot(stats, upload_date=upload_date)
+    return manager
+
+
+def buckets(manager, bucket):
+    return [
+        (row['upload_date'], row['snapshot_count'], row['total_customers'], row['active_customers'])
+        for row in manager.get_trend(days=DAYS + 40, bucket=bucket)
+    ]
+
+
+@pytest.mark.parametrize('keep_count', [45, 46])
+def test_deleted_snapshots_leave_the_rollups(tmp_path, monkeypatch, keep_count):
+    monkeypatch.setattr(history_manager, 'HISTORY_INTRADAY_RETENTION_DAYS', None)
+    all_uploads = uploads()
+
+    manager = saved(tmp_path, 'history.db', all_uploads)
+    manager.compact()
+    manager.delete_old_snapshots(keep_count=keep_count)
+
+    # Reference: only the kept snapshots, never compacted (every bucket computed from raw)
+    reference = saved(tmp_path, 'reference.db', all_uploads[-keep_count:])
+
+    assert len(buckets(manager, 'raw')) == keep_count
+    for bucket in ('day', 'week', 'month'):
+        assert buckets(manager, bucket) == buckets(reference, bucket)
+
+    # Later uploads are still compacted on top of the trimmed rollups
+    manager.save_snapshot({'stats': {'total_customers': 5000, 'active_customers': 1}})
+    reference.save_snapshot({'stats': {'total_customers': 5000, 'active_customers': 1}})
+    manager.compact()
+    for bucket in ('day', 'week', 'month'):
+        assert buckets(manager, bucket) == buckets(reference, bucket)
@@ -0,0 +1,105 @@
+"""
+Tests for the streaming HTML table reader (utils/html_table.py)
+"""
+import io
+import pytest
+from utils import html_table
+from utils.html_table import iter_html_table
+
+
+def read_rows(text, chunk=None, monkeypatch=None):
+    """Header and data rows of the first table, optionally fed chunk characters at a time"""
+    if chunk is not None:
+        monkeypatch.setattr(html_table, 'HTML_READ_CHUNK', chunk)
+    header = None
+    rows = []
+    for header, batch in iter_html_table(io.StringIO(text)):
+        rows.extend(batch)
+    return header, rows
+
+
+def table(*rows):
+    return '<table>' + ''.join(f'<tr>{row}</tr>' for row in rows) + '</table>'
+
+
+HEADER = '<th>ID Pelanggan</th><th>Nama</th>'
+
+
+def test_plain_table():
+    header, rows = read_rows(table(HEADER, '<td>1</td><td>Andi</td>', '<td>2</td><td></td>'))
+    assert header == ['ID Pelanggan', 'Nama']
+    assert rows == [['1', 'Andi'], ['2', None]]
+
+
+def test_quoted_gt_in_attribute():
+    header, rows = read_rows(table(
+        HEADER,
+        '<td title="a>b">5</td><td class=\'x>y\' data-v="<td>">Budi</td>'
+    ))
+    assert rows == [['5', 'Budi']]
+
+
+def test_quoted_gt_in_inner_tag():
+    _, rows = read_rows(table(HEADER, '<td><span title="1>2">7</span></td><td><a href="?a>b">Cici</a></td>'))
+    assert rows == [['7', 'Cici']]
+
+
+def test_comments_are_skipped():
+    _, rows = read_rows(
+        '<!-- <table><tr><td>x</td></tr></table> -->' + table(
+            HEADER,
+            '<!-- <tr><td>hidden</td></tr> --><td>1</td><td>A<!-- <td>no</td> -->ndi</td>'
+        )
+    )
+    assert rows == [['1', 'Andi']]
+
+
+def test_script_and_style_bodies_are_skipped():
+    _, rows = read_rows(
+        '<style>td > b { color: red } /* <td> */</style>'
+        '<script type="text/javascript">if (a < b && "<tr><td>") {}</script>' + table(
+            HEADER,
+            '<td>1<script>document.write("<td>x</td>")</script></td><td><STYLE>td{}</STYLE>Dedi</td>'
+        )
+    )
+    assert rows == [['1', 'Dedi']]
+
+
+def test_entities_colspan_and_unclosed_cells():
+    _, rows = read_rows(
+        '<table><tr><th>ID Pelanggan<th>Nama<th>Alamat'
+        '<tr><td>1<td colspan="2">Jl. A &amp; B'
+        '<tr><td>2<td>Eka &lt;3&gt;<td>'
+        '</table>'
+    )
+    assert rows == [['1', 'Jl. A & B', None], ['2', 'Eka <3>', None]]
+
+
+def test_nested_tables_are_not_rows():
+    _, rows = read_rows(table(HEADER, '<td>1</td><td><table><tr><td>in</td></tr></table>Fani</td>'))
+    assert rows == [['1', 'inFani']]
+
+
+TRICKY_TABLE = (
+    '<html><head><style>td > b {}</style></head><body>'
+    '<!-- export <td>header</td> -->'
+    '<table border="1"><tr>' + HEADER + '</tr>'
+    + ''.join(
+        f'<tr><td title="id>{i}">{i}</td><td><b class=\'n\'>Nama &amp; {i}</b>'
+        f'<!-- <td>{i}</td> --><script>var s = "<tr>";</script></td></tr>'
+        for i in range(1, 6)
+    )
+    + '</table></body></html>'
+)
+
+
+@pytest.mark.parametrize('chunk', [1, 2, 3, 5, 7, 11, 64])
+def test_chunk_boundaries(chunk, monkeypatch):
+    expected = read_rows(TRICKY_TABLE)
+    assert expected[1] == [[str(i), f'Nama & {i}'] for i in range(1, 6)]
+    assert read_rows(TRICKY_TABLE, chunk, monkeypatch) == expected
+
+
+def test_unterminated_tag_at_end_of_file():
+    _, rows = read_rows(table(HEADER, '<td>1</td><td>Gita</td>') + '<td title="open')
+    assert rows == [['1', 'Gita']]
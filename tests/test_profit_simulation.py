@@ -0,0 +1,51 @@
+"""
+Tests for the what-if cost simulation (/api/profitability/simulate)
+"""
+import csv
+import pytest
+
+URL = '/api/profitability/simulate'
+
+
+@pytest.fixture
+def client(app_module, app_dir):
+    header = ['ID Pelanggan', 'Nama Langganan', 'Harga', 'Status Langganan', 'Nama Lokasi',
+              'Nama Sales', 'Tanggal Registrasi', 'Pembayaran Terakhir']
+    with open(app_dir / 'data-wifi-clean.csv', 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerow(['1', 'Paket 10M', 'Rp. 150.000', 'On', 'Loc A', 'Sales A', '2024-01-05', '2024-06-01'])
+        writer.writerow(['2', 'Paket 20M', 'Rp. 250.000', 'On', 'Loc B', 'Sales B', '2023-02-10', '2024-06-03'])
+    return app_module.app.test_client()
+
+
+def test_empty_body_uses_default_costs(client, app_module):
+    response = client.post(URL)
+    body = response.get_json()
+    assert response.status_code == 200, body
+    assert body['scenarios'][0]['parameters'] == {
+        'fixed_cost': float(app_module.config.FIXED_COST_PER_CUSTOMER),
+        'variable_cost_percentage': float(app_module.config.VARIABLE_COST_PERCENTAGE),
+    }
+
+
+@pytest.mark.parametrize('data, content_type', [
+    ('{"fixed_cost": 1000', 'application/json'),
+    ('fixed_cost=1000', 'application/x-www-form-urlencoded'),
+    ('{"fixed_cost": 1000}', 'text/plain'),
+])
+def test_body_that_is_not_json_is_rejected(client, data, content_type):
+    response = client.post(URL, data=data, content_type=content_type)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+@pytest.mark.parametrize('scenario', [
+    {'fixed_cost': True},
+    {'variable_cost_percentage': False},
+    {'scenarios': [{'fixed_cost': 1000}, {'fixed_cost': True}]},
+])
+def test_booleans_are_not_costs(client, scenario):
+    response = client.post(URL, json=scenario)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
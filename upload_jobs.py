@@ -0,0 +1,164 @@
+"""
+Upload Jobs - Menjalankan proses upload di background worker
+Setiap upload mendapat job ID, progress per stage dipantau lewat /api/upload/<job_id>
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from config import UPLOAD_WORKERS, UPLOAD_JOB_RETENTION
+
+# Pipeline stages in execution order
+UPLOAD_STAGES = ['hash', 'read', 'merge', 'dedupe', 'diff', 'write', 'snapshot']
+
+class UploadJob:
+    """State and stage timings of one upload"""
+
+    def __init__(self, files):
+        self.id = uuid.uuid4().hex
+        self.files = files
+        self.status = 'queued'          # queued -> running -> done / failed
+        self.message = None
+        self.result = {}
+        self.created_at = datetime.now()
+        self.finished_at = None
+        self.current_stage = None
+        self.stages = OrderedDict(
+            (name, {'status': 'pending', 'detail': None, 'started': None, 'duration_ms': None})
+            for name in UPLOAD_STAGES
+        )
+        self._lock = threading.Lock()
+
+    def _close_stage(self, status):
+        """Mark the running stage as finished (caller holds the lock)"""
+        if self.current_stage is None:
+            return
+        stage = self.stages[self.current_stage]
+        stage['status'] = status
+        stage['duration_ms'] = round((time.perf_counter() - stage['started']) * 1000, 1)
+        self.current_stage = None
+
+    def start_stage(self, name, detail=None):
+        """
+        Enter a pipeline stage (closes the previous one)
+        Calling again with the running stage only updates its detail text
+        """
+        with self._lock:
+            if name != self.current_stage:
+                self._close_stage('done')
+                self.stages[name].update(status='running', started=time.perf_counter())
+                self.current_stage = name
+                self.status = 'running'
+            self.stages[name]['detail'] = detail
+
+    def finish(self, success, message, result=None):
+        """Close the job with its final message and result payload"""
+        with self._lock:
+            self._close_stage('done' if success else 'failed')
+            if success:
+                # Stages a successful job never entered (e.g. repeated upload) were skipped
+                for stage in self.stages.values():
+                    if stage['status'] == 'pending':
+                        stage['status'] = 'skipped'
+            self.status = 'done' if success else 'failed'
+            self.message = message
+            self.result = result or {}
+            self.finished_at = datetime.now()
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def to_dict(self):
+        """Job status for the API"""
+        with self._lock:
+            completed = sum(1 for stage in self.stages.values() if stage['status'] in ('done', 'skipped'))
+            end = self.finished_at or datetime.now()
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'message': self.message,
+                'files': self.files,
+                'current_stage': self.current_stage,
+                'progress': round(completed / len(self.stages) * 100),
+                'stages': [
+                    {
+                        'name': name,
+                        'status': stage['status'],
+                        'detail': stage['detail'],
+                        'duration_ms': stage['duration_ms']
+                    }
+                    for name, stage in self.stages.items()
+                ],
+                'created_at': self.created_at.isoformat(),
+                'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+                'elapsed_ms': round((end - self.created_at).total_seconds() * 1000, 1),
+                **self.result
+            }
+
+class UploadJobManager:
+    """Queue uploads on a thread pool and keep their status for polling"""
+
+    def __init__(self, max_workers=UPLOAD_WORKERS, retention=UPLOAD_JOB_RETENTION):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upload')
+        self._jobs = OrderedDict()
+        self._retention = retention
+        self._lock = threading.Lock()
+
+    def submit(self, pipeline, files):
+        """
+        Queue an upload
+
+        Args:
+            pipeline: Callable(job) returning (success, message, result dict)
+            files: Uploaded file names (for display)
+
+        Returns:
+            tuple: (UploadJob, Future)
+        """
+        job = UploadJob(files)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        future = self._executor.submit(self._run, pipeline, job)
+        return job, future
+
+    @staticmethod
+    def _run(pipeline, job):
+        """Worker entry point, never lets an exception escape without closing the job"""
+        try:
+            success, message, result = pipeline(job)
+            job.finish(success, message, result)
+        except Exception as e:
+            import traceback
+            print(f"Error in upload job {job.id}: {traceback.format_exc()}")
+            job.finish(False, f'Error processing files: {str(e)}')
+        return job
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond the retention limit (caller holds the lock)"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - self._retention, 0)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        """Get a job by ID (None if unknown or pruned)"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+
+# Singleton instance
+_upload_job_manager = None
+_upload_job_manager_lock = threading.Lock()
+
+def get_upload_job_manager():
+    """Get or create upload job manager instance"""
+    global _upload_job_manager
+    if _upload_job_manager is None:
+        with _upload_job_manager_lock:
+            if _upload_job_manager is None:
+                _upload_job_manager = UploadJobManager()
+    return _upload_job_manager
@@ -2,18 +2,51 @@
 Utils package - reusable utilities across the application
 """
 
-from .date_utils import parse_date_flexible, get_days_since, get_tenure_days
+from .date_utils import parse_date_flexible, parse_date_series, get_days_since, get_tenure_days
 from .validators import DataValidator, validate_data_quality
-from .parser import read_excel_file, merge_dataframes, save_data, find_header_row
+from .parser import (
+    read_excel_file, read_excel_files, merge_dataframes, save_data, find_header_row,
+    read_data_text, as_text_frame, upsert_dataframes, missing_key_message, iter_file_batches
+)
+from .churn import score_churn_risk, categorize_churn_risk
+from .html_table import iter_html_table, read_html_table
+from .content_hash import hash_file, hash_upload
+from .changes import diff_datasets, diff_data_files, summarize_changes
+from .atomic_io import atomic_replace, read_data_marker, publish_lock
+from .backup_store import BackupStore, get_backup_store
+from .ingest import use_chunked_ingest, ingest_files_chunked
 
 __all__ = [
     'parse_date_flexible',
+    'parse_date_series',
     'get_days_since',
     'get_tenure_days',
     'DataValidator',
     'validate_data_quality',
     'read_excel_file',
+    'read_excel_files',
     'merge_dataframes',
     'save_data',
     'find_header_row',
+    'read_data_text',
+    'as_text_frame',
+    'upsert_dataframes',
+    'missing_key_message',
+    'iter_file_batches',
+    'score_churn_risk',
+    'categorize_churn_risk',
+    'iter_html_table',
+    'read_html_table',
+    'hash_file',
+    'hash_upload',
+    'diff_datasets',
+    'diff_data_files',
+    'summarize_changes',
+    'BackupStore',
+    'get_backup_store',
+    'atomic_replace',
+    'read_data_marker',
+    'publish_lock',
+    'use_chunked_ingest',
+    'ingest_files_chunked',
 ]
@@ -0,0 +1,124 @@
+"""
+Atomic publication of data files
+A new version is written to a temp file next to the target, fsynced and swapped in with
+os.replace, so readers always open either the complete old file or the complete new one
+Every publication bumps a version marker (<file>.version)
+On Windows a file cannot be replaced while another handle has it open (e.g. a reader in the
+middle of load_data), so the swap is retried for a short while on PermissionError
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from config import PUBLISH_REPLACE_RETRIES, PUBLISH_REPLACE_RETRY_DELAY
+
+DATA_MARKER_SUFFIX = '.version'
+
+# Serializes publications within the process (upload worker, restore API, ...)
+# Hold it across a read-modify-write of a published file so no other publication lands in between
+publish_lock = threading.RLock()
+
+
+def _fsync_file(path):
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+
+def _fsync_dir(path):
+    """Persist the rename itself (directories cannot be opened for fsync on Windows)"""
+    if os.name == 'nt':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _replace(source_path, target_path):
+    """os.replace, retried with backoff while the target is held open (PermissionError)"""
+    delay = PUBLISH_REPLACE_RETRY_DELAY
+    for attempt in range(1, PUBLISH_REPLACE_RETRIES + 1):
+        try:
+            os.replace(source_path, target_path)
+            return
+        except PermissionError as e:
+            if attempt == PUBLISH_REPLACE_RETRIES:
+                raise
+            print(f"✗ {target_path} is in use ({str(e)}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+
+def read_data_marker(target_path):
+    """
+    Version marker of a published file
+
+    Args:
+        target_path: Published file
+
+    Returns:
+        dict: version (int, 0 if never published through atomic_replace), published_at
+    """
+    try:
+        with open(f'{target_path}{DATA_MARKER_SUFFIX}', 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'version': 0, 'published_at': None}
+
+
+def _bump_data_marker(target_path):
+    marker = {
+        'version': read_data_marker(target_path)['version'] + 1,
+        'published_at': datetime.now().isoformat()
+    }
+    marker_path = f'{target_path}{DATA_MARKER_SUFFIX}'
+    tmp_path = f'{marker_path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(marker, f)
+    _replace(tmp_path, marker_path)
+    return marker
+
+
+@contextmanager
+def atomic_replace(target_path, copy_existing=False):
+    """
+    Write a new version of target_path without readers ever seeing a partial file
+
+    with atomic_replace('data.csv') as tmp_path:
+        df.to_csv(tmp_path)
+
+    The body writes (and closes) tmp_path; on success it is fsynced, swapped in with
+    os.replace and the version marker is bumped. On error the temp file is removed and
+    the target is left untouched
+
+    Args:
+        target_path: File to publish
+        copy_existing: Start the temp file as a byte copy of the current target (for appends;
+                       the whole file is still copied, only re-serializing it is saved)
+
+    Yields:
+        str - temp file path in the target's directory
+    """
+    directory = os.path.dirname(os.path.abspath(target_path))
+    tmp_path = f'{target_path}.{uuid.uuid4().hex[:8]}.tmp'
+
+    with publish_lock:
+        try:
+            if copy_existing and os.path.exists(target_path):
+                shutil.copyfile(target_path, tmp_path)
+            yield tmp_path
+            _fsync_file(tmp_path)
+            _replace(tmp_path, target_path)
+            _fsync_dir(directory)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        marker = _bump_data_marker(target_path)
+        print(f"✓ Published {target_path} (version {marker['version']})")
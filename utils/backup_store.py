@@ -0,0 +1,219 @@
+"""
+Backup store - versioned, compressed, content-addressed copies of the main data file
+Each distinct file content is stored once (gzip, named by its SHA-256); versions are
+index entries pointing at a content hash, pruned by the configured retention policy
+"""
+import glob
+import gzip
+import json
+import os
+import shutil
+import threading
+from datetime import datetime, timedelta
+from config import (
+    MAIN_DATA_FILE, BACKUP_DIR, BACKUP_RETENTION_COUNT, BACKUP_RETENTION_DAYS, BACKUP_COMPRESSION_LEVEL
+)
+from .atomic_io import atomic_replace
+from .content_hash import hash_file
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class BackupStore:
+    """Versions of the main data file, stored under BACKUP_DIR"""
+
+    def __init__(self, root=BACKUP_DIR, retention_count=BACKUP_RETENTION_COUNT,
+                 retention_days=BACKUP_RETENTION_DAYS, compression_level=BACKUP_COMPRESSION_LEVEL):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.index_path = os.path.join(root, 'versions.json')
+        self.retention_count = retention_count
+        self.retention_days = retention_days
+        self.compression_level = compression_level
+        self._lock = threading.Lock()
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._index = self._load_index()
+
+    def _load_index(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {'next_id': 1, 'versions': []}
+
+    def _save_index(self):
+        """Write the index through a temp file so a crash never leaves it half written"""
+        tmp_path = f'{self.index_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    def _object_path(self, content_hash):
+        return os.path.join(self.objects_dir, content_hash[:2], f'{content_hash}.csv.gz')
+
+    def _store_object(self, file_path, content_hash):
+        """Compress file_path into the store unless that content is already there"""
+        object_path = self._object_path(content_hash)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            tmp_path = f'{object_path}.tmp'
+            with open(file_path, 'rb') as src, gzip.open(tmp_path, 'wb', compresslevel=self.compression_level) as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+            os.replace(tmp_path, object_path)
+        return os.path.getsize(object_path)
+
+    def add_version(self, file_path=MAIN_DATA_FILE, content_hash=None, source='upload', created_at=None, pinned=()):
+        """
+        Record the current content of file_path as a new version
+        Content already in the store is not compressed again; the same content as the
+        newest version adds no entry
+
+        Args:
+            file_path: File to back up
+            content_hash: SHA-256 of the file if already known
+            source: What produced this version (upload, restore, ...)
+            created_at: Optional ISO timestamp (default: now)
+            pinned: Version IDs retention must keep (e.g. the version about to be restored)
+
+        Returns:
+            dict - version entry
+        """
+        content_hash = content_hash or hash_file(file_path)
+        with self._lock:
+            versions = self._index['versions']
+            if versions and versions[-1]['hash'] == content_hash:
+                return dict(versions[-1])
+
+            compressed_size = self._store_object(file_path, content_hash)
+            version = {
+                'id': self._index['next_id'],
+                'hash': content_hash,
+                'created_at': created_at or datetime.now().isoformat(),
+                'size': os.path.getsize(file_path),
+                'compressed_size': compressed_size,
+                'source': source
+            }
+            versions.append(version)
+            self._index['next_id'] += 1
+            self._apply_retention(pinned)
+            self._save_index()
+
+        print(f"✓ Backup version {version['id']} stored ({version['compressed_size'] / 1024:.0f} KB, {source})")
+        return dict(version)
+
+    def ensure_version(self, file_path=MAIN_DATA_FILE, content_hash=None, pinned=()):
+        """
+        Make sure the current content of file_path is restorable before it is overwritten
+        A no-op when a kept version already has this content (the usual case, since every
+        written version is added right after it is saved)
+
+        Args:
+            file_path: File about to be overwritten
+            content_hash: SHA-256 of the file if already known
+            pinned: Version IDs retention must keep if a version is added
+
+        Returns:
+            dict - version entry holding this content
+        """
+        content_hash = content_hash or hash_file(file_path)
+        with self._lock:
+            for version in reversed(self._index['versions']):
+                if version['hash'] == content_hash:
+                    return dict(version)
+        return self.add_version(file_path, content_hash, source='pre-upload', pinned=pinned)
+
+    def _apply_retention(self, pinned=()):
+        """
+        Drop versions beyond the count / age limits and unreferenced objects (caller holds the lock)
+        Versions whose ID is in pinned are kept regardless
+        """
+        versions = self._index['versions']
+        keep = versions[-self.retention_count:] if self.retention_count else list(versions)
+        if self.retention_days is not None:
+            cutoff = (datetime.now() - timedelta(days=self.retention_days)).isoformat()
+            keep = [version for version in keep[:-1] if version['created_at'] >= cutoff] + keep[-1:]
+        keep = [version for version in versions if version in keep or version['id'] in pinned]
+
+        dropped = [version for version in versions if version not in keep]
+        self._index['versions'] = keep
+
+        referenced = {version['hash'] for version in keep}
+        for content_hash in {version['hash'] for version in dropped} - referenced:
+            object_path = self._object_path(content_hash)
+            if os.path.exists(object_path):
+                os.remove(object_path)
+        if dropped:
+            print(f"Backup retention: dropped {len(dropped)} old versions")
+
+    def list_versions(self):
+        """All kept versions, newest first"""
+        with self._lock:
+            return [dict(version) for version in reversed(self._index['versions'])]
+
+    def get_version(self, version_id):
+        """Get a version entry by ID (None if unknown or pruned)"""
+        with self._lock:
+            for version in self._index['versions']:
+                if version['id'] == version_id:
+                    return dict(version)
+        return None
+
+    def restore(self, version_id, target_path=MAIN_DATA_FILE):
+        """
+        Write a stored version back to target_path (decompressed to a temp file, then swapped in
+        with atomic_replace)
+        The restored content is recorded as a new version pointing at the same object
+
+        Returns:
+            dict - the new version entry, or None if version_id is unknown
+        """
+        version = self.get_version(version_id)
+        if version is None:
+            return None
+
+        with atomic_replace(target_path) as tmp_path:
+            with gzip.open(self._object_path(version['hash']), 'rb') as src, open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+        print(f"✓ Restored backup version {version_id} to {target_path}")
+
+        return self.add_version(target_path, version['hash'], source=f"restore:{version_id}")
+
+    def import_legacy_backups(self, data_file=MAIN_DATA_FILE):
+        """
+        Move old full-copy backups (<name>_backup_<timestamp>.csv) into the store
+        Each file is removed once its content is stored; files the retention count
+        would drop right away are removed without being compressed
+
+        Returns:
+            int - number of files imported
+        """
+        pattern = f'{os.path.splitext(data_file)[0]}_backup_*.csv'
+        legacy_files = sorted(glob.glob(pattern), key=os.path.getmtime)
+        if self.retention_count and len(legacy_files) > self.retention_count:
+            for file_path in legacy_files[:-self.retention_count]:
+                os.remove(file_path)
+            legacy_files = legacy_files[-self.retention_count:]
+
+        for file_path in legacy_files:
+            created_at = datetime.fromtimestamp(os.path.getmtime(file_path)).isoformat()
+            self.add_version(file_path, source='legacy', created_at=created_at)
+            os.remove(file_path)
+        if legacy_files:
+            print(f"✓ Imported {len(legacy_files)} legacy backup files into {self.root}")
+        return len(legacy_files)
+
+
+# Singleton instance
+_backup_store = None
+_backup_store_lock = threading.Lock()
+
+def get_backup_store():
+    """Get or create backup store instance (imports legacy backup files on first use)"""
+    global _backup_store
+    if _backup_store is None:
+        with _backup_store_lock:
+            if _backup_store is None:
+                store = BackupStore()
+                store.import_legacy_backups()
+                _backup_store = store
+    return _backup_store
@@ -0,0 +1,211 @@
+"""
+Dataset diff - row-level change detection between two versions of the main data
+Rows are matched on ID Pelanggan and compared through one 64-bit hash per row
+"""
+import numpy as np
+import pandas as pd
+from config import INGEST_CHUNK_ROWS
+
+
+def row_hashes(df, columns):
+    """
+    One uint64 hash per row over the given columns (vectorized, no Python loop per row)
+
+    Args:
+        df: DataFrame
+        columns: Columns included in the hash, in a fixed order
+
+    Returns:
+        np.ndarray of uint64, positional with df
+    """
+    return pd.util.hash_pandas_object(df[columns], index=False, categorize=False).to_numpy()
+
+
+def key_hashes(keys):
+    """
+    One uint64 hash per key value (stands in for the key in sets / indexes of large datasets)
+
+    Args:
+        keys: Series or array of key values
+
+    Returns:
+        np.ndarray of uint64
+    """
+    return pd.util.hash_array(np.asarray(keys, dtype=object), categorize=False)
+
+
+def _changed_fields(changed_keys, old_values, new_values, columns):
+    """Field-level differences of rows whose hash changed -> (changed list, field_counts)"""
+    rows, cols = np.nonzero(old_values != new_values)
+
+    fields_by_row = [{} for _ in range(len(changed_keys))]
+    for row, col in zip(rows.tolist(), cols.tolist()):
+        fields_by_row[row][columns[col]] = [old_values[row, col], new_values[row, col]]
+
+    counts = np.bincount(cols, minlength=len(columns))
+    field_counts = {columns[i]: int(count) for i, count in enumerate(counts) if count}
+    return list(zip(list(changed_keys), fields_by_row)), field_counts
+
+
+def diff_datasets(old_df, new_df, key='ID Pelanggan'):
+    """
+    Compare two text frames (utils.parser.read_data_text / as_text_frame) of the dataset
+    Rows of both versions are hashed once; only rows whose hash differs are compared
+    field by field, so the cost stays linear in the number of rows
+
+    Args:
+        old_df: Previous version
+        new_df: New version
+        key: Customer key column
+
+    Returns:
+        dict: new (list of keys), removed (list of keys),
+              changed (list of (key, {field: [old, new]})), field_counts ({field: changed rows}),
+              columns_added, columns_removed
+    """
+    old_df = old_df.drop_duplicates(subset=[key])
+    new_df = new_df.drop_duplicates(subset=[key])
+    columns = [col for col in new_df.columns if col in old_df.columns and col != key]
+
+    old_keys = old_df[key].to_numpy()
+    new_keys = new_df[key].to_numpy()
+    old_hashes = pd.Series(row_hashes(old_df, columns), index=old_keys)
+
+    known = new_df[key].isin(old_hashes.index).to_numpy()
+    removed = ~old_df[key].isin(new_df[key]).to_numpy()
+
+    # Same key, different row hash -> changed row
+    common_keys = new_keys[known]
+    differs = row_hashes(new_df, columns)[known] != old_hashes.reindex(common_keys).to_numpy()
+    changed_keys = common_keys[differs]
+
+    changed = []
+    field_counts = {}
+    if len(changed_keys):
+        old_values = old_df.set_index(key).loc[changed_keys, columns].to_numpy()
+        new_values = new_df[known][differs][columns].to_numpy()
+        changed, field_counts = _changed_fields(changed_keys.tolist(), old_values, new_values, columns)
+
+    return {
+        'new': new_keys[~known].tolist(),
+        'removed': old_keys[removed].tolist(),
+        'changed': changed,
+        'field_counts': field_counts,
+        'columns_added': [col for col in new_df.columns if col not in old_df.columns],
+        'columns_removed': [col for col in old_df.columns if col not in new_df.columns],
+    }
+
+
+def _read_text_chunks(file_path, chunk_rows):
+    return pd.read_csv(file_path, encoding='utf-8-sig', dtype=str, keep_default_na=False, chunksize=chunk_rows)
+
+
+def _read_header(file_path):
+    return list(pd.read_csv(file_path, encoding='utf-8-sig', dtype=str, nrows=0).columns)
+
+
+def diff_data_files(old_path, new_path, key='ID Pelanggan', chunk_rows=INGEST_CHUNK_ROWS):
+    """
+    diff_datasets for two data CSV files, streamed in chunks instead of loaded as text frames
+    Memory holds two 64-bit hashes per stored customer plus the changed rows; the stored
+    file is read twice (hashes, then the old values of changed / removed rows)
+
+    Args:
+        old_path: Previous version of the data file
+        new_path: New version
+        key: Customer key column
+        chunk_rows: Rows per chunk
+
+    Returns:
+        dict - same as diff_datasets
+    """
+    old_columns = _read_header(old_path)
+    new_columns = _read_header(new_path)
+    columns = [col for col in new_columns if col in old_columns and col != key]
+
+    # Pass 1: row hash of every stored customer, indexed by key hash (first occurrence wins)
+    parts = []
+    with _read_text_chunks(old_path, chunk_rows) as chunks:
+        for chunk in chunks:
+            parts.append(pd.Series(row_hashes(chunk, columns), index=key_hashes(chunk[key])))
+    old_hashes = pd.concat(parts) if parts else pd.Series([], dtype='uint64')
+    old_hashes = old_hashes[~old_hashes.index.duplicated()]
+    old_row_hashes = old_hashes.to_numpy()
+
+    # Pass 2: classify new rows against the stored hashes
+    present = np.zeros(len(old_hashes), dtype=bool)   # stored customer still in the new file
+    new_only = set()                                  # key hashes of new customers seen so far
+    new_keys = []
+    changed_positions = []
+    changed_frames = []
+    with _read_text_chunks(new_path, chunk_rows) as chunks:
+        for chunk in chunks:
+            hashes = key_hashes(chunk[key])
+            positions = old_hashes.index.get_indexer(hashes)
+            known = positions >= 0
+
+            # First occurrence of each key only, like drop_duplicates in diff_datasets
+            keep = ~pd.Series(hashes).duplicated().to_numpy()
+            keep[known] &= ~present[positions[known]]
+            unknown = np.flatnonzero(~known)
+            keep[unknown] &= np.fromiter((h not in new_only for h in hashes[unknown].tolist()),
+                                         dtype=bool, count=len(unknown))
+
+            inserted = ~known & keep
+            new_keys.extend(chunk.loc[inserted, key].tolist())
+            new_only.update(hashes[inserted].tolist())
+
+            matched = known & keep
+            present[positions[matched]] = True
+            differs = np.zeros(len(chunk), dtype=bool)
+            differs[matched] = row_hashes(chunk[matched], columns) != old_row_hashes[positions[matched]]
+            if differs.any():
+                changed_positions.append(positions[differs])
+                changed_frames.append(chunk.loc[differs, [key] + columns])
+
+    changed_positions = np.concatenate(changed_positions) if changed_positions else np.array([], dtype=np.intp)
+    is_changed = np.zeros(len(old_hashes), dtype=bool)
+    is_changed[changed_positions] = True
+
+    # Pass 3: keys of removed customers and old values of changed ones, in stored order
+    removed = []
+    old_changed = []
+    visited = np.zeros(len(old_hashes), dtype=bool)
+    with _read_text_chunks(old_path, chunk_rows) as chunks:
+        for chunk in chunks:
+            positions = old_hashes.index.get_indexer(key_hashes(chunk[key]))
+            first = ~visited[positions] & ~pd.Series(positions).duplicated().to_numpy()
+            visited[positions] = True
+            removed.extend(chunk.loc[first & ~present[positions], key].tolist())
+            wanted = first & is_changed[positions]
+            if wanted.any():
+                old_changed.append(pd.DataFrame(chunk.loc[wanted, columns].to_numpy(), index=positions[wanted]))
+
+    changed = []
+    field_counts = {}
+    if len(changed_positions):
+        new_changed = pd.concat(changed_frames)
+        old_values = pd.concat(old_changed).loc[changed_positions].to_numpy()
+        changed, field_counts = _changed_fields(new_changed[key].tolist(), old_values,
+                                                new_changed[columns].to_numpy(), columns)
+
+    return {
+        'new': new_keys,
+        'removed': removed,
+        'changed': changed,
+        'field_counts': field_counts,
+        'columns_added': [col for col in new_columns if col not in old_columns],
+        'columns_removed': [col for col in old_columns if col not in new_columns],
+    }
+
+
+def summarize_changes(changes):
+    """Counts of a diff_datasets result (for upload stats)"""
+    return {
+        'new': len(changes['new']),
+        'removed': len(changes['removed']),
+        'changed': len(changes['changed']),
+        'fields': changes['field_counts'],
+        'columns_added': changes['columns_added'],
+        'columns_removed': changes['columns_removed'],
+    }
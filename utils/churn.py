@@ -0,0 +1,76 @@
+"""
+Churn risk scoring - single vectorized kernel for churn risk rules
+Used by customer segmentation, churn analysis and churn score export
+"""
+import numpy as np
+import pandas as pd
+from config import (
+    CHURN_RISK_WEIGHTS, CHURN_NEW_CUSTOMER_DAYS, CHURN_LOYAL_CUSTOMER_DAYS,
+    UNPAID_DAYS_DEFAULT, CHURN_RISK_CATEGORIES, CHURN_RISK_DEFAULT_CATEGORY
+)
+from .date_utils import parse_date_series
+
+
+def categorize_churn_risk(scores):
+    """
+    Map churn risk scores to risk categories
+
+    Args:
+        scores: pd.Series of churn risk scores (0-100)
+
+    Returns:
+        np.ndarray of category names (Critical, High, Medium, Low, Very Low)
+    """
+    conditions = [scores >= threshold for threshold, _ in CHURN_RISK_CATEGORIES]
+    choices = [category for _, category in CHURN_RISK_CATEGORIES]
+    return np.select(conditions, choices, default=CHURN_RISK_DEFAULT_CATEGORY)
+
+
+def score_churn_risk(df, today=None):
+    """
+    Compute churn risk columns for every customer
+
+    Adds columns: Tanggal_Registrasi_Parsed, Pembayaran_Terakhir_Parsed,
+    Tenure_Days, Days_Since_Payment, Churn_Risk_Score, Churn_Category
+
+    Args:
+        df: pandas DataFrame with customer data (modified in place)
+        today: pd.Timestamp reference time (default: now)
+
+    Returns:
+        pd.DataFrame - the same dataframe with scoring columns
+    """
+    if today is None:
+        today = pd.Timestamp.now()
+
+    df['Tanggal_Registrasi_Parsed'] = parse_date_series(df['Tanggal Registrasi'])
+    df['Pembayaran_Terakhir_Parsed'] = parse_date_series(df['Pembayaran Terakhir'])
+
+    df['Tenure_Days'] = (today - df['Tanggal_Registrasi_Parsed']).dt.days.fillna(0).astype(int)
+    df['Days_Since_Payment'] = (today - df['Pembayaran_Terakhir_Parsed']).dt.days.fillna(UNPAID_DAYS_DEFAULT).astype(int)
+
+    days_unpaid = df['Days_Since_Payment']
+    tenure = df['Tenure_Days']
+
+    # Rule 1: Days since payment - highest matching tier only
+    tiers = sorted(CHURN_RISK_WEIGHTS['days_since_payment'].values(), reverse=True)
+    payment_points = np.select(
+        [days_unpaid > threshold for threshold, _ in tiers],
+        [points for _, points in tiers],
+        default=0
+    )
+
+    # Rule 2: Status langganan
+    status_points = np.where(df['Status Langganan'] == 'Off', CHURN_RISK_WEIGHTS['status_offline'], 0)
+
+    # Rule 3: Tenure (new customers = lower risk initially, long-term = lower risk)
+    tenure_points = (
+        np.where(tenure < CHURN_NEW_CUSTOMER_DAYS, CHURN_RISK_WEIGHTS['new_customer_bonus'], 0)
+        + np.where(tenure > CHURN_LOYAL_CUSTOMER_DAYS, CHURN_RISK_WEIGHTS['loyal_bonus'], 0)
+    )
+
+    score = (payment_points + status_points + tenure_points).astype(float)
+    df['Churn_Risk_Score'] = np.clip(score, 0, 100)
+    df['Churn_Category'] = categorize_churn_risk(df['Churn_Risk_Score'])
+
+    return df
@@ -0,0 +1,39 @@
+"""
+Content hashing - identify uploaded files and dataset versions by their bytes
+Used to recognise an export that was already ingested
+"""
+import hashlib
+
+HASH_CHUNK_SIZE = 1024 * 1024  # Bytes read per update
+
+
+def hash_file(file_path):
+    """
+    SHA-256 of a file's content, read in chunks
+
+    Args:
+        file_path: Path to file
+
+    Returns:
+        str - hex digest
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_upload(file_hashes, mode='replace'):
+    """
+    Key of one upload: its files' content hashes in upload order plus the upload mode
+    (the order decides which duplicate row is kept, the mode how the files are applied)
+
+    Args:
+        file_hashes: List of hex digests from hash_file
+        mode: Upload mode
+
+    Returns:
+        str - hex digest
+    """
+    return hashlib.sha256('\n'.join([mode] + list(file_hashes)).encode('ascii')).hexdigest()
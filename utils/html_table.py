@@ -0,0 +1,241 @@
+"""
+HTML table reader - streaming parser for HTML tables saved as .xls
+The billing system's "data-wifi.xls" exports are HTML, not Excel workbooks
+"""
+import html
+import io
+import re
+import pandas as pd
+from config import HEADER_SCAN_ROWS, HTML_BATCH_ROWS
+
+HTML_READ_CHUNK = 1024 * 1024  # Characters fed to the parser per read
+
+
+# Inside of a tag: a '>' within a quoted attribute value does not end it
+# (same as (?:"[^"]*"|'[^']*'|[^'">])*, unrolled so plain attributes are matched in one step)
+TAG_BODY = r'''[^'">]*(?:(?:"[^"]*"|'[^']*')[^'">]*)*'''
+
+# Table tags, spans dropped whole (comments, script / style bodies) and a construct cut off
+# by the end of the fed text; everything starts with '<' so the scan jumps between them
+TOKEN_PATTERN = re.compile(
+    rf'<(?:(?P<closing>/?)(?P<tag>table|tr|td|th)\b(?P<attrs>{TAG_BODY})>'
+    rf'|(?P<skip>!--.*?-->|script\b{TAG_BODY}>.*?</script\s*>|style\b{TAG_BODY}>.*?</style\s*>)'
+    rf'''|(?P<partial>(?:!--|script\b|style\b).*|(?:[!/a-z]{TAG_BODY}(?:"[^"]*|'[^']*)?)?\Z))''',
+    re.IGNORECASE | re.DOTALL
+)
+INNER_TAG_PATTERN = re.compile(rf'<{TAG_BODY}>')
+COLSPAN_PATTERN = re.compile(r'colspan\s*=\s*["\']?(\d+)', re.IGNORECASE)
+
+
+class _TableRowParser:
+    """
+    Incremental tokenizer collecting the rows of the first top-level <table>
+    Only table / tr / td / th tags are tokenized (no DOM is built); other tags inside a
+    cell are dropped and entities unescaped, like BeautifulSoup's .text. Comments and
+    script / style bodies are skipped, quoted attribute values may contain '>'
+    Completed rows are appended to self.rows; the caller drains them between feed() calls
+    Tolerates unclosed <td>/<th>/<tr> tags as browsers do
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.done = False
+        self._buffer = ''
+        self._table_depth = 0
+        self._row = None
+        self._cell = None
+        self._colspan = 1
+
+    def feed(self, data):
+        """Tokenize data; a trailing partial tag, comment or script is kept for the next call"""
+        self._buffer += data
+        consumed = self._process(self._buffer)
+        self._buffer = self._buffer[consumed:]
+
+    def close(self):
+        """Tokenize whatever is left and close an unterminated table"""
+        self._process(self._buffer, final=True)
+        self._buffer = ''
+        self._close_row()
+        self.done = True
+
+    def _process(self, text, final=False):
+        """Tokenize text, returning how much of it was consumed (all of it when final)"""
+        # Hot loop: cell tags of the current table are handled inline, the rest in _handle_tag
+        position = 0
+        cell = self._cell
+        for match in TOKEN_PATTERN.finditer(text):
+            closing, tag, attrs, skip, partial = match.groups()
+            if partial is not None:
+                if final:
+                    continue   # Never completed: left as text
+                if cell is not None:
+                    cell.append(text[position:match.start()])
+                return match.start()
+
+            if cell is not None:
+                cell.append(text[position:match.start()])
+            position = match.end()
+            if skip is not None:
+                continue   # Comment, script or style: dropped
+            tag = tag.lower()
+            if self._table_depth == 1 and tag in ('td', 'th') and self._row is not None:
+                if cell is not None:
+                    self._close_cell()
+                if closing:
+                    cell = None
+                else:
+                    cell = self._cell = []
+                    self._colspan = self._parse_colspan(attrs)
+                continue
+
+            self._handle_tag(tag, closing == '/', attrs)
+            cell = self._cell
+            if self.done:
+                return len(text)
+        if cell is not None:
+            cell.append(text[position:])
+        return len(text)
+
+    @staticmethod
+    def _parse_colspan(attrs):
+        if not attrs or 'colspan' not in attrs.lower():
+            return 1
+        colspan = COLSPAN_PATTERN.search(attrs)
+        return max(int(colspan.group(1)), 1) if colspan else 1
+
+    def _handle_tag(self, tag, closing, attrs):
+        if tag == 'table':
+            if not closing:
+                self._table_depth += 1
+                return
+            if self._table_depth == 1:
+                self._close_row()
+                self.done = True
+            self._table_depth -= 1
+        elif self._table_depth != 1:
+            return
+        elif tag == 'tr':
+            self._close_row()
+            if not closing:
+                self._row = []
+        elif closing:
+            self._close_cell()
+        else:
+            if self._row is None:
+                self._row = []
+            self._close_cell()
+            self._cell = []
+            self._colspan = self._parse_colspan(attrs)
+
+    def _close_cell(self):
+        if self._cell is not None:
+            text = ''.join(self._cell)
+            if '<' in text:
+                text = INNER_TAG_PATTERN.sub('', text)
+            if '&' in text:
+                text = html.unescape(text)
+            self._row.append(text.strip())
+            if self._colspan > 1:
+                self._row.extend([''] * (self._colspan - 1))
+            self._cell = None
+
+    def _close_row(self):
+        self._close_cell()
+        if self._row:
+            self.rows.append(self._row)
+        self._row = None
+
+
+def iter_html_table(text_stream, batch_rows=HTML_BATCH_ROWS):
+    """
+    Stream the first HTML table of a text stream as row batches
+    The header is the first row (within HEADER_SCAN_ROWS) containing 'ID Pelanggan',
+    or the first row; rows before it are skipped. A table without data rows yields its
+    header with an empty batch
+
+    Args:
+        text_stream: Text file object
+        batch_rows: Rows per yielded batch
+
+    Yields:
+        tuple: (header list, list of row lists padded/truncated to the header width)
+    """
+    parser = _TableRowParser()
+    header = None
+    pending = []   # rows seen before the header was decided
+    batch = []
+    yielded = False
+
+    def fit(row):
+        """Pad or cut a row to the header width, empty cells become missing values"""
+        row = row[:len(header)] + [''] * (len(header) - len(row))
+        return [value if value != '' else None for value in row]
+
+    while not parser.done:
+        chunk = text_stream.read(HTML_READ_CHUNK)
+        if not chunk:
+            parser.close()
+        else:
+            parser.feed(chunk)
+
+        rows, parser.rows = parser.rows, []
+        for row in rows:
+            if header is None:
+                pending.append(row)
+                if any('ID Pelanggan' in value for value in row):
+                    header = row
+                    pending = []
+                elif len(pending) >= HEADER_SCAN_ROWS:
+                    header, pending = pending[0], pending[1:]
+                    batch.extend(fit(r) for r in pending)
+                    pending = []
+                continue
+
+            batch.append(fit(row))
+            if len(batch) >= batch_rows:
+                yield header, batch
+                batch = []
+                yielded = True
+
+        if not chunk:
+            break
+
+    # Short tables: header not found within the scanned rows
+    if header is None and pending:
+        header, pending = pending[0], pending[1:]
+        batch.extend(fit(r) for r in pending)
+
+    if header is not None and (batch or not yielded):
+        yield header, batch
+
+
+def read_html_table(f, encoding='utf-8-sig'):
+    """
+    Read an HTML table export into a DataFrame (all values as text, empty cells as NaN)
+
+    Args:
+        f: Binary file object or path
+        encoding: Text encoding of the file
+
+    Returns:
+        pd.DataFrame
+    """
+    if isinstance(f, (str, bytes)) or hasattr(f, '__fspath__'):
+        with open(f, 'rb') as handle:
+            return read_html_table(handle, encoding)
+
+    text_stream = io.TextIOWrapper(f, encoding=encoding, newline='')
+    try:
+        header = None
+        frames = []
+        for header, batch in iter_html_table(text_stream):
+            frames.append(pd.DataFrame(batch, columns=header, dtype=object))
+    finally:
+        text_stream.detach()
+
+    if header is None:
+        raise ValueError('Tabel HTML tidak ditemukan di file')
+    if not frames:
+        return pd.DataFrame(columns=header)
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,177 @@
+"""
+Chunked ingestion - merge and de-duplicate large CSV / HTML uploads in bounded memory
+Files are read in row batches and each batch is written to the output as soon as its
+duplicates are dropped, so memory holds a few batches plus one 64-bit hash per kept
+ID Pelanggan, whatever the size of the upload
+Values are text, exactly as read_excel_file returns them for the in-memory path
+"""
+import os
+import time
+from itertools import chain
+import numpy as np
+import pandas as pd
+from config import INGEST_CHUNK_ROWS, INGEST_CHUNKED_MIN_BYTES
+from .changes import key_hashes
+from .parser import sniff_file_format, available_strategies, missing_key_message, iter_file_batches
+
+# Formats that can be read in row batches (Excel workbooks are always read whole)
+CHUNKED_FORMATS = ('csv', 'html')
+
+
+def use_chunked_ingest(file_paths, min_bytes=INGEST_CHUNKED_MIN_BYTES):
+    """
+    Whether an upload should go through ingest_files_chunked: every file is CSV / HTML
+    and together they are at least min_bytes
+
+    Args:
+        file_paths: Uploaded file paths
+        min_bytes: Size threshold (total of all files)
+
+    Returns:
+        bool
+    """
+    if sum(os.path.getsize(file_path) for file_path in file_paths) < min_bytes:
+        return False
+    return all(sniff_file_format(file_path)[0] in CHUNKED_FORMATS for file_path in file_paths)
+
+
+def _ingest(file_paths, sources, output_path, key, batch_rows, on_progress, on_batch, current):
+    """One pass of ingest_files_chunked with the current encoding of every file"""
+    readers = []
+    first_batches = []
+    seconds = [0.0] * len(file_paths)   # time spent on each file (reading, de-duplicating, writing)
+    try:
+        # First batch of every file: the output header (union of columns) is decided before writing
+        for idx, file_path in enumerate(file_paths, 1):
+            current.update(file=file_path, started=time.perf_counter())
+            file_format, encodings = sources[file_path]
+            readers.append(iter_file_batches(file_path, file_format, encodings[0], batch_rows))
+            first = next(readers[-1], None)
+            seconds[idx - 1] += time.perf_counter() - current['started']
+            if first is None:
+                return False, f"Error reading file {idx}: Tabel tidak ditemukan di file", None
+            if key not in first.columns:
+                return False, f"Error reading file {idx}: {missing_key_message(first.columns)}", None
+            first_batches.append(first)
+
+        columns = []
+        for first in first_batches:
+            columns.extend(col for col in first.columns if col not in columns)
+
+        seen = set()   # key hashes of the rows already written
+        file_info = []
+        kept_rows = 0
+        with open(output_path, 'w', encoding='utf-8-sig', newline='') as out:
+            pd.DataFrame(columns=columns).to_csv(out, index=False)
+
+            for idx, file_path in enumerate(file_paths, 1):
+                current.update(file=file_path, started=time.perf_counter())
+                first, first_batches[idx - 1] = first_batches[idx - 1], None
+                file_columns = len(first.columns)
+                file_rows = 0
+
+                for batch in chain([first], readers[idx - 1]):
+                    first = None
+                    hashes = key_hashes(batch[key])
+                    keep = ~pd.Series(hashes).duplicated().to_numpy()
+                    keep &= np.fromiter((h not in seen for h in hashes.tolist()), dtype=bool, count=len(hashes))
+                    seen.update(hashes[keep].tolist())
+
+                    kept = batch[keep].reindex(columns=columns, fill_value='')
+                    kept.to_csv(out, header=False, index=False)
+                    if on_batch:
+                        on_batch(kept)
+                    file_rows += len(batch)
+                    kept_rows += int(keep.sum())
+                    if on_progress:
+                        on_progress(idx, file_rows)
+
+                seconds[idx - 1] += time.perf_counter() - current['started']
+                file_format, encodings = sources[file_path]
+                file_info.append({
+                    'file_num': idx,
+                    'filename': os.path.basename(file_path),
+                    'rows': file_rows,
+                    'columns': file_columns,
+                    'format': file_format,
+                    'strategy': encodings[0],
+                    'read_seconds': round(seconds[idx - 1], 3),
+                    'attempts': current['failed'].get(file_path, []) + [
+                        {'strategy': encodings[0], 'seconds': round(seconds[idx - 1], 3), 'success': True, 'error': None}
+                    ]
+                })
+                print(f"File {idx} ingested: {file_rows} rows, {file_columns} columns")
+    finally:
+        for reader in readers:
+            reader.close()
+
+    total_rows = sum(info['rows'] for info in file_info)
+    stats = {
+        'file_info': file_info,
+        'total_rows_before_merge': total_rows,
+        'total_rows_after_merge': kept_rows,
+        'duplicates_removed': total_rows - kept_rows,
+        'columns': len(columns)
+    }
+    return True, f"{kept_rows} rows written to {output_path}", stats
+
+
+def ingest_files_chunked(file_paths, output_path, key='ID Pelanggan', batch_rows=INGEST_CHUNK_ROWS,
+                         on_progress=None, on_batch=None):
+    """
+    Merge CSV / HTML files into one CSV in row batches, keeping the first row of every
+    ID Pelanggan (same rows as concat + drop_duplicates(keep='first'))
+    Duplicates are dropped across batches and files with a running set of key hashes.
+    A file that turns out not to be in its detected encoding is read again from the
+    start with the next configured one
+
+    Args:
+        file_paths: File paths, in upload order
+        output_path: CSV to write (utf-8-sig, overwritten)
+        key: Key column
+        batch_rows: Rows per batch
+        on_progress: Optional callback(file_num, rows_read_from_that_file)
+        on_batch: Optional callback(rows) with every batch of kept rows as written (output
+                  columns), e.g. to aggregate the dataset without loading it. Called with
+                  None when the ingest restarts: the batches are then delivered again
+
+    Returns:
+        tuple: (success: bool, message or error_message, stats)
+        stats: file_info (with format, strategy and attempts like read_excel_file's read_info),
+               total_rows_before_merge, total_rows_after_merge, duplicates_removed, columns
+    """
+    try:
+        print(f"\n--- Chunked ingestion of {len(file_paths)} files ({batch_rows} rows per batch) ---")
+
+        sources = {}
+        for idx, file_path in enumerate(file_paths, 1):
+            file_format, encoding = sniff_file_format(file_path)
+            if file_format not in CHUNKED_FORMATS:
+                return False, f"Error reading file {idx}: format {file_format} tidak bisa dibaca bertahap", None
+            encodings = [encoding] + [e for e in available_strategies(file_format) if e != encoding]
+            sources[file_path] = (file_format, encodings)
+
+        current = {'file': None, 'started': None, 'failed': {}}
+        while True:
+            try:
+                return _ingest(file_paths, sources, output_path, key, batch_rows, on_progress, on_batch, current)
+            except UnicodeDecodeError as e:
+                file_format, encodings = sources[current['file']]
+                print(f"✗ {current['file']} is not {encodings[0]} ({str(e)}), restarting")
+                current['failed'].setdefault(current['file'], []).append({
+                    'strategy': encodings[0],
+                    'seconds': round(time.perf_counter() - current['started'], 3),
+                    'success': False,
+                    'error': f"{encodings[0]}: {str(e)}"
+                })
+                if len(encodings) == 1:
+                    return False, f"Gagal membaca file {os.path.basename(current['file'])}: {str(e)}", None
+                sources[current['file']] = (file_format, encodings[1:])
+                if on_batch:
+                    on_batch(None)
+
+    except Exception as e:
+        import traceback
+        error_detail = traceback.format_exc()
+        print(f"Error in ingest_files_chunked: {error_detail}")
+        return False, f"Error: {str(e)}", None
@@ -1,171 +1,424 @@
 """
 File parser - centralized Excel/CSV parsing logic
 Replaces duplicated parsing code with strategy pattern
+Every upload path reads through here: the format is sniffed, then the format's reader
+(FORMAT_READERS) is tried with each configured strategy (READ_STRATEGIES) in turn.
+Readers return text frames - values as they are written to the main data CSV, empty cells as ''
 """
 import pandas as pd
+import numpy as np
+import io
 import os
-from config import MAIN_DATA_FILE, READ_STRATEGIES
+import re
+import time
+import importlib.util
+from functools import lru_cache
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from config import (
+    MAIN_DATA_FILE, ALLOWED_EXTENSIONS, READ_STRATEGIES, PARSE_POOL_SIZE, HEADER_SCAN_ROWS, INGEST_CHUNK_ROWS
+)
+from .html_table import iter_html_table, read_html_table
+
+# Leading bytes of binary spreadsheet containers
+FILE_SIGNATURES = [
+    (b'PK\x03\x04', 'xlsx'),                          # Office Open XML (zip)
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'xls'),     # OLE2 compound document (BIFF .xls)
+]
+SNIFF_BYTES = 64 * 1024
+
+# Package behind each pandas Excel engine (optional ones may be missing)
+ENGINE_PACKAGES = {
+    'calamine': 'python_calamine',
+    'openpyxl': 'openpyxl',
+    'xlrd': 'xlrd',
+}
+HTML_PATTERN = re.compile(rb'<\s*(!doctype\s+html|html|table|head|body|meta)\b', re.IGNORECASE)
+# Date cell read as text: str() of a datetime, the time part is dropped when it is midnight
+MIDNIGHT_PATTERN = r'^(\d{4}-\d{2}-\d{2}) 00:00:00$'
+
+
+def detect_text_encoding(head):
+    """
+    Pick the encoding of a text file from its first bytes (BOM, then UTF-8 validity)
 
+    Args:
+        head: First bytes of the file
 
-def find_header_row(file_path, file_ext):
+    Returns:
+        str - encoding name usable by pd.read_csv
     """
-    Find the row containing 'ID Pelanggan' column
+    if head.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+    if head.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return 'utf-16'
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off by the sniff window is still UTF-8
+        if e.start < len(head) - 3:
+            return 'latin1'
+    return 'utf-8-sig'
+
+
+def sniff_file_format(file_path):
+    """
+    Detect the real format of a file from its magic bytes (not its extension)
+    Exports often save HTML tables or CSV text with an .xls name
 
     Args:
         file_path: Path to file
-        file_ext: File extension (csv, xls, xlsx)
 
     Returns:
-        int - row index of header row (0 if not found)
+        tuple: (format: 'xlsx' | 'xls' | 'html' | 'csv' | 'unknown', encoding or None for binary formats)
     """
-    try:
-        print(f"Searching for header row with 'ID Pelanggan'...")
+    with open(file_path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
 
-        # Read first 10 rows without header to inspect
-        if file_ext == 'csv':
-            temp_df = pd.read_csv(file_path, encoding='utf-8-sig', header=None, nrows=10)
-        elif file_ext == 'xlsx':
-            temp_df = pd.read_excel(file_path, engine='openpyxl', header=None, nrows=10)
-        elif file_ext == 'xls':
-            try:
-                temp_df = pd.read_excel(file_path, engine='xlrd', header=None, nrows=10)
-            except Exception:
-                try:
-                    temp_df = pd.read_excel(file_path, engine='openpyxl', header=None, nrows=10)
-                except Exception:
-                    temp_df = pd.read_csv(file_path, encoding='utf-8-sig', header=None, nrows=10)
-        else:
-            return 0
+    for signature, file_format in FILE_SIGNATURES:
+        if head.startswith(signature):
+            return file_format, None
 
-        # Search for row containing "ID Pelanggan"
-        for idx, row in temp_df.iterrows():
-            row_values = row.astype(str).tolist()
-            if any('ID Pelanggan' in str(val) for val in row_values):
-                print(f"Found header row at index {idx}")
-                return idx
+    encoding = detect_text_encoding(head)
+    if encoding != 'utf-16' and b'\x00' in head:
+        return 'unknown', None
+    text_head = head.decode(encoding, errors='ignore').lstrip('\ufeff \t\r\n').encode('utf-8')
+    if text_head.startswith(b'<') and HTML_PATTERN.search(text_head[:4096]):
+        return 'html', encoding
+    return 'csv', encoding
+
+
+@lru_cache(maxsize=None)
+def _engine_installed(engine):
+    """Whether the package behind a pandas Excel engine can be imported"""
+    package = ENGINE_PACKAGES.get(engine)
+    return package is None or importlib.util.find_spec(package) is not None
+
+
+def available_strategies(file_format):
+    """
+    Configured read strategies for a sniffed format, without Excel engines that are not installed
+
+    Args:
+        file_format: Format from sniff_file_format
+
+    Returns:
+        list - engines (Excel) or encodings (CSV / HTML) in the order they should be tried
+    """
+    strategies = READ_STRATEGIES.get(file_format, [])
+    if file_format in ('xlsx', 'xls'):
+        return [engine for engine in strategies if _engine_installed(engine)]
+    return list(strategies)
+
+
+def _header_row_index(preview_df):
+    """Index of the first preview row containing 'ID Pelanggan' (0 if none)"""
+    for idx, row in preview_df.iterrows():
+        if any('ID Pelanggan' in str(val) for val in row.tolist()):
+            print(f"Found header row at index {idx}")
+            return idx
+
+    print("Header row not found, using default (0)")
+    return 0
+
+
+def _text_values(df):
+    """Empty cells as '' and every column as str (the dtype all readers return)"""
+    df = df.fillna('').astype(str)
+    df.columns = df.columns.astype(str).str.strip()
+    return df
 
-        print("Header row not found, using default (0)")
-        return 0
 
+def _csv_header_row(f, encoding):
+    """Header row of a CSV from its first rows; the handle is rewound for the real read"""
+    try:
+        header_row = _header_row_index(pd.read_csv(f, encoding=encoding, header=None,
+                                                   nrows=HEADER_SCAN_ROWS, dtype=str))
     except Exception as e:
         print(f"Error finding header row: {str(e)}")
-        return 0
+        header_row = 0
+    print(f"Using header row: {header_row}")
+    f.seek(0)
+    return header_row
+
+
+def _read_csv_handle(f, encoding):
+    """Sniff the header row and parse a CSV from one open binary handle (values kept as text)"""
+    header_row = _csv_header_row(f, encoding)
+    return _text_values(pd.read_csv(f, encoding=encoding, skiprows=header_row, dtype=str, keep_default_na=False))
 
 
-def _attempt_read_with_engine(file_path, file_ext, engine, encoding=None, header_row=0):
+def _read_html_handle(f, encoding):
+    """Parse an HTML table export (.xls saved as HTML) from one open binary handle"""
+    return _text_values(read_html_table(f, encoding))
+
+
+def _read_excel_handle(f, engine):
+    """Sniff the header row and parse the first sheet from one opened workbook"""
+    with pd.ExcelFile(f, engine=engine) as workbook:
+        try:
+            header_row = _header_row_index(workbook.parse(0, header=None, nrows=HEADER_SCAN_ROWS))
+        except Exception as e:
+            print(f"Error finding header row: {str(e)}")
+            header_row = 0
+        print(f"Using header row: {header_row}")
+
+        # Cells as text like the other formats: text cells keep leading zeros, whole numbers
+        # have no '.0', dates without a time are written as YYYY-MM-DD
+        df = workbook.parse(0, skiprows=header_row, dtype=str)
+        for col in df.columns:
+            if df[col].str.endswith(' 00:00:00').any():
+                df[col] = df[col].str.replace(MIDNIGHT_PATTERN, r'\1', regex=True)
+        return _text_values(df)
+
+
+# Reader per sniffed format: reader(binary_handle, strategy) -> text DataFrame
+# (strategy is an encoding for text formats, an engine for workbooks; see READ_STRATEGIES)
+FORMAT_READERS = {
+    'csv': _read_csv_handle,
+    'html': _read_html_handle,
+    'xlsx': _read_excel_handle,
+    'xls': _read_excel_handle,
+}
+
+
+def find_header_row(file_path, file_ext=None):
     """
-    Attempt to read file with specific engine and encoding
+    Find the row containing 'ID Pelanggan' column
 
     Args:
         file_path: Path to file
-        file_ext: File extension
-        engine: Engine to use (openpyxl, xlrd, etc.)
-        encoding: Encoding for CSV (utf-8-sig, latin1, etc.)
-        header_row: Row to use as header
+        file_ext: Unused, the format is sniffed from the file content
 
     Returns:
-        tuple: (success: bool, dataframe or error_message, engine_used)
+        int - row index of header row (0 if not found)
     """
     try:
-        if file_ext == 'csv':
-            df = pd.read_csv(file_path, encoding=encoding or 'utf-8-sig', skiprows=header_row)
-            print(f"✓ Successfully read CSV with {encoding or 'utf-8-sig'}: {len(df)} rows")
-            return True, df, encoding or 'utf-8-sig'
+        print(f"Searching for header row with 'ID Pelanggan'...")
+        file_format, encoding = sniff_file_format(file_path)
+        with open(file_path, 'rb') as f:
+            if file_format == 'csv':
+                preview = pd.read_csv(f, encoding=encoding, header=None, nrows=HEADER_SCAN_ROWS, dtype=str)
+            elif file_format in ('xlsx', 'xls') and available_strategies(file_format):
+                preview = pd.read_excel(f, engine=available_strategies(file_format)[0], header=None, nrows=HEADER_SCAN_ROWS)
+            else:
+                return 0
+        return _header_row_index(preview)
+
+    except Exception as e:
+        print(f"Error finding header row: {str(e)}")
+        return 0
+
+
+def missing_key_message(columns):
+    """Error message for a file without an 'ID Pelanggan' column, naming similar columns"""
+    print(f"ERROR: 'ID Pelanggan' column not found!")
+    print(f"Available columns: {list(columns)}")
 
-        elif file_ext in ['xls', 'xlsx']:
-            df = pd.read_excel(file_path, engine=engine, skiprows=header_row)
-            print(f"✓ Successfully read with {engine}: {len(df)} rows")
-            return True, df, engine
+    # Try to find similar columns
+    possible_cols = [col for col in columns
+                     if 'ID' in str(col).upper() or 'PELANGGAN' in str(col).upper()]
+    if possible_cols:
+        return f"Kolom 'ID Pelanggan' tidak ditemukan. Kolom yang mirip: {', '.join(possible_cols[:5])}"
+    return f"Kolom 'ID Pelanggan' tidak ditemukan. Kolom tersedia: {', '.join(list(columns)[:10])}"
 
+
+def _read_sniffed(file_path, file_format, strategy):
+    """
+    Open file_path once and parse it with the format's reader and one engine (Excel)
+    or encoding (CSV / HTML)
+
+    Returns:
+        tuple: (success: bool, text dataframe or error_message)
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            df = FORMAT_READERS[file_format](f, strategy)
+        print(f"✓ Successfully read {file_format} with {strategy}: {len(df)} rows")
+        return True, df
     except Exception as e:
-        error_msg = f"{engine or 'encoding=' + (encoding or 'unknown')}: {str(e)}"
+        error_msg = f"{strategy}: {str(e)}"
         print(f"✗ Failed: {error_msg}")
-        return False, error_msg, None
-
-    return False, f"Unsupported format: {file_ext}", None
+        return False, error_msg
 
 
 def read_excel_file(file_path):
     """
-    Read single Excel/CSV file with intelligent fallback strategy
+    Read single Excel/CSV file
+    The real format and text encoding are sniffed from the file's first bytes, then the
+    file is opened once per attempt: the header row is found in the first rows of the same
+    handle and the rest is parsed from there. Strategies are tried in order until one works
 
     Args:
         file_path: Path to file
 
     Returns:
-        tuple: (success: bool, dataframe or error_message, file_ext)
+        tuple: (success: bool, text dataframe or error_message, read_info)
+        read_info: file_ext, format, strategy (the one that worked, None if none did),
+                   attempts ([{strategy, seconds, success, error}]), seconds (total)
     """
-    try:
-        # Determine file extension
-        file_ext = file_path.rsplit('.', 1)[1].lower()
+    started = time.perf_counter()
+    # Determine file extension
+    file_ext = file_path.rsplit('.', 1)[1].lower() if '.' in file_path else ''
+    read_info = {'file_ext': file_ext, 'format': None, 'strategy': None, 'attempts': [], 'seconds': 0.0}
+
+    def failed(message):
+        read_info['seconds'] = round(time.perf_counter() - started, 3)
+        return False, message, read_info
 
-        if file_ext not in READ_STRATEGIES:
-            return False, f"Format file tidak didukung: {file_ext}", None
+    try:
+        if file_ext not in ALLOWED_EXTENSIONS:
+            return failed(f"Format file tidak didukung: {file_ext}")
 
         print(f"\n--- Processing File: {file_path} ---")
 
-        # Find header row
-        header_row = find_header_row(file_path, file_ext)
-        print(f"Using header row: {header_row}")
+        file_format, encoding = sniff_file_format(file_path)
+        read_info['format'] = file_format
+        print(f"Detected format: {file_format}" + (f" ({encoding})" if encoding else ""))
 
-        # Try reading with strategies
-        strategies = READ_STRATEGIES[file_ext]
-        error_messages = []
+        if file_format not in FORMAT_READERS:
+            return failed(f"Format isi file ({file_format}) belum didukung untuk file .{file_ext}")
 
-        for strategy in strategies:
-            if file_ext == 'csv':
-                # CSV uses encoding as strategy
-                success, result, _ = _attempt_read_with_engine(file_path, file_ext, None, strategy, header_row)
-            else:
-                # Excel uses engine as strategy
-                success, result, _ = _attempt_read_with_engine(file_path, file_ext, strategy, None, header_row)
+        # CSV / HTML: detected encoding first, then the configured fallbacks; Excel: installed engines
+        strategies = available_strategies(file_format)
+        if file_format in ('csv', 'html'):
+            strategies = [encoding] + [e for e in strategies if e != encoding]
+        elif not strategies:
+            engines = ', '.join(READ_STRATEGIES[file_format])
+            return failed(f"Engine untuk membaca file .{file_ext} belum terpasang ({engines})")
 
+        df = None
+        for strategy in strategies:
+            attempt_started = time.perf_counter()
+            success, result = _read_sniffed(file_path, file_format, strategy)
+            read_info['attempts'].append({
+                'strategy': strategy,
+                'seconds': round(time.perf_counter() - attempt_started, 3),
+                'success': success,
+                'error': None if success else result
+            })
             if success:
                 df = result
+                read_info['strategy'] = strategy
                 break
-            else:
-                error_messages.append(result)
-
-        # If all strategies failed, try CSV as last resort
-        if 'df' not in locals() and file_ext in ['xls', 'xlsx']:
-            print("Trying CSV as last resort fallback...")
-            success, result, _ = _attempt_read_with_engine(file_path, file_ext, None, 'utf-8-sig', header_row)
-            if success:
-                df = result
-            else:
-                error_messages.append(result)
 
         # Check if we got a dataframe
-        if 'df' not in locals() or df is None:
-            error_detail = "\n".join(error_messages)
-            return False, f"Gagal membaca file. Detail:\n{error_detail}", None
+        if df is None:
+            error_detail = "\n".join(attempt['error'] for attempt in read_info['attempts'])
+            return failed(f"Gagal membaca file. Detail:\n{error_detail}")
 
         print(f"Successfully read {len(df)} rows")
         print(f"Columns (first 10): {list(df.columns)[:10]}")
 
-        # Clean column names
-        df.columns = df.columns.str.strip()
-
         # Verify ID Pelanggan column exists
         if 'ID Pelanggan' not in df.columns:
-            print(f"ERROR: 'ID Pelanggan' column not found!")
-            print(f"Available columns: {list(df.columns)}")
-
-            # Try to find similar columns
-            possible_cols = [col for col in df.columns
-                           if 'ID' in str(col).upper() or 'PELANGGAN' in str(col).upper()]
-            if possible_cols:
-                return False, f"Kolom 'ID Pelanggan' tidak ditemukan. Kolom yang mirip: {', '.join(possible_cols[:5])}", None
-            else:
-                return False, f"Kolom 'ID Pelanggan' tidak ditemukan. Kolom tersedia: {', '.join(list(df.columns)[:10])}", None
+            return failed(missing_key_message(df.columns))
 
-        return True, df, file_ext
+        read_info['seconds'] = round(time.perf_counter() - started, 3)
+        print(f"Read with {read_info['strategy']} in {read_info['seconds']:.2f}s "
+              f"({len(read_info['attempts'])} attempt(s))")
+        return True, df, read_info
 
     except Exception as e:
         import traceback
         error_detail = traceback.format_exc()
         print(f"Error in read_excel_file: {error_detail}")
-        return False, f"Error: {str(e)}", None
+        return failed(f"Error: {str(e)}")
+
+
+# Shared process pool for parsing uploads. 'spawn' keeps workers independent of the
+# web server's threads (forking a threaded process can deadlock the child).
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+def get_parse_pool():
+    """Get or create the file parsing process pool"""
+    global _parse_pool
+    if _parse_pool is None:
+        with _parse_pool_lock:
+            if _parse_pool is None:
+                _parse_pool = ProcessPoolExecutor(
+                    max_workers=PARSE_POOL_SIZE,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+    return _parse_pool
+
+def _reset_parse_pool():
+    """Drop a broken pool (e.g. a worker was killed) so the next upload starts a fresh one"""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown(wait=False, cancel_futures=True)
+            _parse_pool = None
+
+def read_excel_files(file_paths, on_file_done=None):
+    """
+    Read several Excel/CSV files with read_excel_file
+    More than one file is parsed in parallel worker processes (PARSE_POOL_SIZE)
+
+    Args:
+        file_paths: List of file paths
+        on_file_done: Optional callback(done_count) after each file finishes
+
+    Returns:
+        list of (success, text dataframe or error_message, read_info), in file_paths order
+    """
+    if len(file_paths) <= 1 or PARSE_POOL_SIZE <= 1:
+        results = []
+        for file_path in file_paths:
+            results.append(read_excel_file(file_path))
+            if on_file_done:
+                on_file_done(len(results))
+        return results
+
+    futures = [get_parse_pool().submit(read_excel_file, file_path) for file_path in file_paths]
+    for done, _ in enumerate(as_completed(futures), 1):
+        if on_file_done:
+            on_file_done(done)
+
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except BrokenProcessPool as e:
+            _reset_parse_pool()
+            results.append((False, f"Error: worker process crashed ({str(e)})", {}))
+        except Exception as e:
+            results.append((False, f"Error: {str(e)}", {}))
+    return results
+
+
+def iter_file_batches(file_path, file_format, encoding, batch_rows=INGEST_CHUNK_ROWS):
+    """
+    Stream a CSV / HTML file as text DataFrame batches (same values as read_excel_file)
+    The header row is found the same way; the first batch is yielded even when the file
+    has no data rows
+
+    Args:
+        file_path: Path to file
+        file_format: 'csv' or 'html' (see sniff_file_format)
+        encoding: Text encoding
+        batch_rows: Rows per batch
+
+    Yields:
+        pd.DataFrame
+    """
+    with open(file_path, 'rb') as f:
+        if file_format == 'csv':
+            header_row = _csv_header_row(f, encoding)
+            with pd.read_csv(f, encoding=encoding, skiprows=header_row, dtype=str,
+                             keep_default_na=False, chunksize=batch_rows) as reader:
+                for batch in reader:
+                    yield _text_values(batch)
+        else:
+            text_stream = io.TextIOWrapper(f, encoding=encoding, newline='')
+            try:
+                for header, rows in iter_html_table(text_stream, batch_rows):
+                    yield _text_values(pd.DataFrame(rows, columns=header, dtype=object))
+            finally:
+                text_stream.detach()
 
 
 def merge_dataframes(dataframes):
@@ -187,8 +440,8 @@ def merge_dataframes(dataframes):
         # Calculate stats before merge
         total_rows_before = sum(len(df) for df in dataframes)
 
-        # Merge all dataframes
-        merged_df = pd.concat(dataframes, ignore_index=True)
+        # Merge all dataframes (cells of columns a file does not have stay empty text)
+        merged_df = pd.concat(dataframes, ignore_index=True).fillna('')
         print(f"Merged data: {len(merged_df)} rows")
 
         # Remove duplicates based on ID Pelanggan
@@ -215,35 +468,128 @@ def merge_dataframes(dataframes):
         return False, f"Error merging dataframes: {str(e)}", None
 
 
+def read_data_text(file_path=MAIN_DATA_FILE):
+    """
+    Read the main data file with every value as the text stored in the CSV
+    (no type inference, empty cells as ''), so rows can be compared and written back unchanged
+
+    Returns:
+        pd.DataFrame
+    """
+    return pd.read_csv(file_path, encoding='utf-8-sig', dtype=str, keep_default_na=False)
+
+
+def as_text_frame(df):
+    """Convert a DataFrame to the text values it would have once written to the main data CSV"""
+    return pd.read_csv(io.StringIO(df.to_csv(index=False)), dtype=str, keep_default_na=False)
+
+
+def upsert_dataframes(existing_df, delta_df, key='ID Pelanggan'):
+    """
+    Merge a delta upload into the existing dataset, keyed on ID Pelanggan
+    Both frames are text frames (read_data_text / as_text_frame). Rows with a known key
+    are updated in place (columns missing from the delta keep their stored value), new
+    keys are appended at the end
+
+    Args:
+        existing_df: Stored dataset
+        delta_df: De-duplicated upload
+        key: Key column
+
+    Returns:
+        tuple: (success: bool, merged_df or error_message, stats)
+        stats['write_mode'] is 'unchanged' (nothing to write), 'append' (only new rows,
+        written after a byte copy of the stored file) or 'rewrite' (existing rows or the header changed)
+    """
+    try:
+        if key not in existing_df.columns or key not in delta_df.columns:
+            return False, f"Kolom '{key}' tidak ditemukan untuk upsert", None
+
+        print(f"\n--- Upserting {len(delta_df)} rows into {len(existing_df)} rows ---")
+
+        # Position of each stored key (first occurrence wins, like the de-duplication)
+        first = ~existing_df[key].duplicated()
+        positions = pd.Series(np.flatnonzero(first.to_numpy()), index=existing_df.loc[first, key])
+
+        known = delta_df[key].isin(positions.index)
+        matched = delta_df[known]
+        inserted = delta_df[~known]
+
+        shared_columns = [col for col in delta_df.columns if col in existing_df.columns]
+        new_columns = [col for col in delta_df.columns if col not in existing_df.columns]
+
+        # A matched row is updated when any uploaded value differs from the stored text
+        matched_positions = positions.loc[matched[key]].to_numpy()
+        stored = existing_df.iloc[matched_positions][shared_columns].to_numpy()
+        changed = (stored != matched[shared_columns].to_numpy()).any(axis=1)
+        if new_columns:
+            changed |= (matched[new_columns].to_numpy() != '').any(axis=1)
+
+        merged_df = existing_df.copy()
+        for col in new_columns:
+            merged_df[col] = ''
+        if changed.any():
+            update_columns = shared_columns + new_columns
+            column_positions = [merged_df.columns.get_loc(col) for col in update_columns]
+            merged_df.iloc[matched_positions[changed], column_positions] = matched.loc[changed, update_columns].to_numpy()
+        if len(inserted):
+            merged_df = pd.concat([merged_df, inserted.reindex(columns=merged_df.columns, fill_value='')],
+                                  ignore_index=True)
+
+        updated_count = int(changed.sum())
+        if updated_count or new_columns:
+            write_mode = 'rewrite'
+        elif len(inserted):
+            write_mode = 'append'
+        else:
+            write_mode = 'unchanged'
+
+        stats = {
+            'inserted': len(inserted),
+            'updated': updated_count,
+            'unchanged': len(matched) - updated_count,
+            'new_columns': new_columns,
+            'write_mode': write_mode
+        }
+        print(f"Inserted {stats['inserted']}, updated {stats['updated']}, unchanged {stats['unchanged']} ({write_mode})")
+
+        return True, merged_df, stats
+
+    except Exception as e:
+        import traceback
+        error_detail = traceback.format_exc()
+        print(f"Error in upsert_dataframes: {error_detail}")
+        return False, f"Error upserting data: {str(e)}", None
+
+
 def save_data(df, backup_existing=True):
     """
-    Save dataframe to CSV and optionally backup existing file
+    Save dataframe to CSV and record it in the backup store
 
     Args:
         df: DataFrame to save
-        backup_existing: Whether to backup existing file
+        backup_existing: Whether to make sure the existing file is restorable first
 
     Returns:
-        tuple: (success: bool, message, backup_file)
+        tuple: (success: bool, message, backup version ID of the saved data or None)
     """
     try:
-        import shutil
-        from datetime import datetime
+        from .atomic_io import atomic_replace
+        from .backup_store import get_backup_store
 
-        backup_file = None
+        backup_store = get_backup_store()
 
-        # Backup old file if exists
+        # Existing content is normally already a stored version; only stored if not
         if backup_existing and os.path.exists(MAIN_DATA_FILE):
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_file = f'{MAIN_DATA_FILE.replace(".csv", "")}_backup_{timestamp}.csv'
-            shutil.copy(MAIN_DATA_FILE, backup_file)
-            print(f"Backup created: {backup_file}")
+            backup_store.ensure_version(MAIN_DATA_FILE)
 
-        # Save new file
-        df.to_csv(MAIN_DATA_FILE, index=False, encoding='utf-8-sig')
+        # Save new file (written to a temp file, then swapped in)
+        with atomic_replace(MAIN_DATA_FILE) as tmp_path:
+            df.to_csv(tmp_path, index=False, encoding='utf-8-sig')
         print(f"Saved data: {len(df)} rows, {len(df.columns)} columns")
 
-        return True, f"Data berhasil disimpan: {len(df)} rows", backup_file
+        version = backup_store.add_version(MAIN_DATA_FILE, source='save')
+        return True, f"Data berhasil disimpan: {len(df)} rows", version['id']
 
     except Exception as e:
         import traceback
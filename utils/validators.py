@@ -2,6 +2,7 @@
 Data validators - centralized data quality and validation logic
 Replaces scattered validation code across app.py
 """
+import numpy as np
 import pandas as pd
 from config import DATA_QUALITY_RULES
 
@@ -9,6 +10,24 @@ from config import DATA_QUALITY_RULES
 class DataValidator:
     """Centralized data validation and quality checks"""
 
+    @staticmethod
+    def map_unique(series, func):
+        """
+        Apply a per-value check or cleaner (e.g. clean_price) to a whole column
+        func runs once per distinct value instead of once per row
+
+        Args:
+            series: pd.Series to check
+            func: Callable taking a single value
+
+        Returns:
+            pd.Series - func results aligned with series
+        """
+        codes, uniques = pd.factorize(series)
+        # factorize marks missing values as -1, which picks the trailing func(NaN) result
+        results = np.array([func(value) for value in uniques] + [func(np.nan)], dtype=object)
+        return pd.Series(results[codes], index=series.index).infer_objects()
+
     @staticmethod
     def is_ktp_missing(ktp_url):
         """